@@ -52,6 +52,11 @@ static const uint8_t kCodeLengthPrefixValue[16] = {
   0, 4, 3, 2, 0, 4, 3, 1, 0, 4, 3, 2, 0, 4, 3, 5,
 };
 
+/* We need the slack region for the following reasons:
+    - doing up to two 16-byte copies for fast backward copying
+    - inserting transformed dictionary word (5 prefix + 24 base + 8 suffix) */
+static const int kRingBufferWriteAheadSlack = 42;
+
 BrotliDecoderState* BrotliDecoderCreateInstance(
     brotli_alloc_func alloc_func, brotli_free_func free_func, void* opaque) {
   BrotliDecoderState* state = 0;
@@ -82,6 +87,172 @@ void BrotliDecoderDestroyInstance(BrotliDecoderState* state) {
   }
 }
 
+static void* RelocatePointer(const void* p, const void* from, size_t size,
+                             void* to) {
+  const uint8_t* p8 = (const uint8_t*)p;
+  const uint8_t* from8 = (const uint8_t*)from;
+  if (!p || !from || p8 < from8 || p8 > from8 + size) return 0;
+  return (uint8_t*)to + (p8 - from8);
+}
+
+static size_t HuffmanTreeGroupCodesSize(const HuffmanTreeGroup* group) {
+  return sizeof(HuffmanCode) * group->num_htrees *
+      kMaxHuffmanTableSize[(group->alphabet_size + 31) >> 5];
+}
+
+/* Copies |src| group to |dst|; tree pointers are moved into the new codes. */
+static BROTLI_BOOL CopyHuffmanTreeGroup(BrotliDecoderState* s,
+    HuffmanTreeGroup* dst, const HuffmanTreeGroup* src) {
+  const size_t code_size = HuffmanTreeGroupCodesSize(src);
+  uint32_t i;
+  if (!src->htrees) return BROTLI_TRUE;
+  if (!BrotliDecoderHuffmanTreeGroupInit(
+      s, dst, src->alphabet_size, src->num_htrees)) {
+    return BROTLI_FALSE;
+  }
+  memcpy(dst->codes, src->codes, code_size);
+  for (i = 0; i < src->num_htrees; ++i) {
+    /* Trees that are not decoded yet are not valid pointers. */
+    HuffmanCode* tree = (HuffmanCode*)RelocatePointer(
+        src->htrees[i], src->codes, code_size, dst->codes);
+    dst->htrees[i] = tree ? tree : src->htrees[i];
+  }
+  return BROTLI_TRUE;
+}
+
+static BROTLI_BOOL CopyBuffer(BrotliDecoderState* s, void** dst,
+                              const void* src, size_t size) {
+  if (!src) return BROTLI_TRUE;
+  *dst = BROTLI_ALLOC(s, size);
+  if (!*dst) return BROTLI_FALSE;
+  memcpy(*dst, src, size);
+  return BROTLI_TRUE;
+}
+
+BrotliDecoderState* BrotliDecoderCopyInstance(const BrotliDecoderState* s) {
+  const HuffmanTreeGroup* groups[3];
+  HuffmanTreeGroup* copy_groups[3];
+  BrotliDecoderState* copy;
+  void* p;
+  int i;
+  copy = BrotliDecoderCreateInstance(
+      s->alloc_func, s->free_func, s->memory_manager_opaque);
+  if (!copy) return 0;
+
+  /* Shallow copy everything, then detach all owned buffers so that the copy
+     is always safe to destroy. */
+  memcpy(copy, s, sizeof(BrotliDecoderState));
+  copy->ringbuffer = NULL;
+  copy->ringbuffer_end = NULL;
+  copy->block_type_trees = NULL;
+  copy->block_len_trees = NULL;
+  copy->context_modes = NULL;
+  copy->context_map = NULL;
+  copy->dist_context_map = NULL;
+  copy->context_map_slice = NULL;
+  copy->dist_context_map_slice = NULL;
+  copy->literal_hgroup.htrees = NULL;
+  copy->insert_copy_hgroup.htrees = NULL;
+  copy->distance_hgroup.htrees = NULL;
+  copy->literal_htree = NULL;
+  copy->htree_command = NULL;
+  copy->next = NULL;
+  copy->symbol_lists = &copy->symbols_lists_array[
+      s->symbol_lists - s->symbols_lists_array];
+
+  p = NULL;
+  if (!CopyBuffer(copy, &p, s->ringbuffer,
+      (size_t)(s->ringbuffer_size + kRingBufferWriteAheadSlack))) {
+    goto oom;
+  }
+  copy->ringbuffer = (uint8_t*)p;
+  if (copy->ringbuffer) {
+    copy->ringbuffer_end = copy->ringbuffer + copy->ringbuffer_size;
+  }
+
+  p = NULL;
+  if (!CopyBuffer(copy, &p, s->block_type_trees, sizeof(HuffmanCode) * 3 *
+      (BROTLI_HUFFMAN_MAX_SIZE_258 + BROTLI_HUFFMAN_MAX_SIZE_26))) {
+    goto oom;
+  }
+  copy->block_type_trees = (HuffmanCode*)p;
+  if (copy->block_type_trees) {
+    copy->block_len_trees =
+        copy->block_type_trees + 3 * BROTLI_HUFFMAN_MAX_SIZE_258;
+  }
+
+  p = NULL;
+  if (!CopyBuffer(copy, &p, s->context_modes, s->num_block_types[0])) {
+    goto oom;
+  }
+  copy->context_modes = (uint8_t*)p;
+
+  p = NULL;
+  if (!CopyBuffer(copy, &p, s->context_map,
+      s->num_block_types[0] << BROTLI_LITERAL_CONTEXT_BITS)) {
+    goto oom;
+  }
+  copy->context_map = (uint8_t*)p;
+  copy->context_map_slice = (uint8_t*)RelocatePointer(s->context_map_slice,
+      s->context_map, s->num_block_types[0] << BROTLI_LITERAL_CONTEXT_BITS,
+      copy->context_map);
+
+  p = NULL;
+  if (!CopyBuffer(copy, &p, s->dist_context_map,
+      s->num_block_types[2] << BROTLI_DISTANCE_CONTEXT_BITS)) {
+    goto oom;
+  }
+  copy->dist_context_map = (uint8_t*)p;
+  copy->dist_context_map_slice = (uint8_t*)RelocatePointer(
+      s->dist_context_map_slice, s->dist_context_map,
+      s->num_block_types[2] << BROTLI_DISTANCE_CONTEXT_BITS,
+      copy->dist_context_map);
+
+  groups[0] = &s->literal_hgroup;
+  groups[1] = &s->insert_copy_hgroup;
+  groups[2] = &s->distance_hgroup;
+  copy_groups[0] = &copy->literal_hgroup;
+  copy_groups[1] = &copy->insert_copy_hgroup;
+  copy_groups[2] = &copy->distance_hgroup;
+  for (i = 0; i < 3; ++i) {
+    if (!CopyHuffmanTreeGroup(copy, copy_groups[i], groups[i])) goto oom;
+  }
+  if (s->literal_hgroup.htrees) {
+    copy->literal_htree = (HuffmanCode*)RelocatePointer(s->literal_htree,
+        s->literal_hgroup.codes, HuffmanTreeGroupCodesSize(&s->literal_hgroup),
+        copy->literal_hgroup.codes);
+  }
+  if (s->insert_copy_hgroup.htrees) {
+    copy->htree_command = (HuffmanCode*)RelocatePointer(s->htree_command,
+        s->insert_copy_hgroup.codes,
+        HuffmanTreeGroupCodesSize(&s->insert_copy_hgroup),
+        copy->insert_copy_hgroup.codes);
+  }
+  /* Tree group that is being decoded right now. */
+  for (i = 0; i < 3; ++i) {
+    if (groups[i]->htrees) {
+      p = RelocatePointer(s->next, groups[i]->codes,
+          HuffmanTreeGroupCodesSize(groups[i]), copy_groups[i]->codes);
+      if (p) copy->next = (HuffmanCode*)p;
+    }
+  }
+
+  p = RelocatePointer(
+      s->br.next_in, s->buffer.u8, sizeof(s->buffer), copy->buffer.u8);
+  if (p) copy->br.next_in = (const uint8_t*)p;
+
+  return copy;
+
+oom:
+  BrotliDecoderDestroyInstance(copy);
+  return 0;
+}
+
+void BrotliDecoderGetStats(const BrotliDecoderState* s,
+                           BrotliDecoderStats* stats) {
+  *stats = s->stats;
+}
+
 /* Saves error code and converts it to BrotliDecoderResult */
 static BROTLI_NOINLINE BrotliDecoderResult SaveErrorCode(
     BrotliDecoderState* s, BrotliDecoderErrorCode e) {
@@ -736,6 +907,8 @@ static BrotliDecoderErrorCode ReadHuffmanCode(uint32_t alphabet_size,
       BROTLI_LOG_UINT(s->symbol);
       table_size = BrotliBuildSimpleHuffmanTable(
           table, HUFFMAN_TABLE_BITS, s->symbols_lists_array, s->symbol);
+      s->stats.huffman_tables++;
+      s->stats.huffman_table_entries += table_size;
       if (opt_table_size) {
         *opt_table_size = table_size;
       }
@@ -783,6 +956,8 @@ Complex: /* Decode Huffman-coded code lengths. */
       }
       table_size = BrotliBuildHuffmanTable(
           table, HUFFMAN_TABLE_BITS, s->symbol_lists, s->code_length_histo);
+      s->stats.huffman_tables++;
+      s->stats.huffman_table_entries += table_size;
       if (opt_table_size) {
         *opt_table_size = table_size;
       }
@@ -1240,10 +1415,6 @@ static void BROTLI_NOINLINE WrapRingBuffer(BrotliDecoderState* s) {
 */
 static BROTLI_BOOL BROTLI_NOINLINE BrotliEnsureRingBuffer(
     BrotliDecoderState* s) {
-  /* We need the slack region for the following reasons:
-      - doing up to two 16-byte copies for fast backward copying
-      - inserting transformed dictionary word (5 prefix + 24 base + 8 suffix) */
-  static const int kRingBufferWriteAheadSlack = 42;
   uint8_t* old_ringbuffer = s->ringbuffer;
   if (s->ringbuffer_size == s->new_ringbuffer_size) {
     return BROTLI_TRUE;
@@ -1258,6 +1429,7 @@ static BROTLI_BOOL BROTLI_NOINLINE BrotliEnsureRingBuffer(
   }
   s->ringbuffer[s->new_ringbuffer_size - 2] = 0;
   s->ringbuffer[s->new_ringbuffer_size - 1] = 0;
+  s->stats.ringbuffer_allocations++;
 
   if (!old_ringbuffer) {
     if (s->custom_dict) {
@@ -1607,6 +1779,8 @@ CommandBegin:
   BROTLI_SAFE(ReadCommand(s, br, &i));
   BROTLI_LOG(("[ProcessCommandsInternal] pos = %d insert = %d copy = %d\n",
               pos, i, s->copy_length));
+  s->stats.commands++;
+  s->stats.literal_bytes += (uint64_t)i;
   if (i == 0) {
     goto CommandPostDecodeLiterals;
   }
@@ -1749,6 +1923,8 @@ postReadDistance:
         }
         pos += len;
         s->meta_block_remaining_len -= len;
+        s->stats.dictionary_references++;
+        s->stats.dictionary_bytes += (uint64_t)len;
         if (pos >= s->ringbuffer_size) {
           /*s->partial_pos_rb += (size_t)s->ringbuffer_size;*/
           s->state = BROTLI_STATE_COMMAND_POST_WRITE_1;
@@ -1776,6 +1952,7 @@ postReadDistance:
     s->dist_rb[s->dist_rb_idx & 3] = s->distance_code;
     ++s->dist_rb_idx;
     s->meta_block_remaining_len -= i;
+    s->stats.copy_bytes += (uint64_t)i;
     /* There are 32+ bytes of slack in the ring-buffer allocation.
        Also, we have 16 short codes, that make these 16 bytes irrelevant
        in the ring-buffer. Let's copy over them as a first guess.
@@ -2019,6 +2196,7 @@ BrotliDecoderResult BrotliDecoderDecompressStream(
           }
         }
         if (s->is_metadata) {
+          s->stats.metadata_blocks++;
           s->state = BROTLI_STATE_METADATA;
           break;
         }
@@ -2026,8 +2204,11 @@ BrotliDecoderResult BrotliDecoderDecompressStream(
           s->state = BROTLI_STATE_METABLOCK_DONE;
           break;
         }
+        s->stats.metablocks++;
         BrotliCalculateRingBufferSize(s);
         if (s->is_uncompressed) {
+          s->stats.uncompressed_metablocks++;
+          s->stats.uncompressed_bytes += (uint64_t)s->meta_block_remaining_len;
           s->state = BROTLI_STATE_UNCOMPRESSED;
           break;
         }
@@ -7,6 +7,7 @@
 #include "./state.h"
 
 #include <stdlib.h>  /* free, malloc */
+#include <string.h>  /* memset */
 
 #include <brotli/types.h>
 #include "./huffman.h"
@@ -98,6 +99,8 @@ void BrotliDecoderStateInitWithCustomAllocators(BrotliDecoderState* s,
   s->symbol_lists = &s->symbols_lists_array[BROTLI_HUFFMAN_MAX_CODE_LENGTH + 1];
 
   s->mtf_upper_bound = 63;
+
+  memset(&s->stats, 0, sizeof(s->stats));
 }
 
 void BrotliDecoderStateMetablockBegin(BrotliDecoderState* s) {
@@ -10,6 +10,7 @@
 #define BROTLI_DEC_STATE_H_
 
 #include "../common/constants.h"
+#include <brotli/decode.h>
 #include <brotli/types.h>
 #include "./bit_reader.h"
 #include "./huffman.h"
@@ -222,6 +223,8 @@ struct BrotliDecoderStateStruct {
   uint8_t* context_modes;
 
   uint32_t trivial_literal_contexts[8];  /* 256 bits */
+
+  BrotliDecoderStats stats;
 };
 
 typedef struct BrotliDecoderStateStruct BrotliDecoderStateInternal;
@@ -28,6 +28,7 @@
 #include "./prefix.h"
 #include "./quality.h"
 #include "./ringbuffer.h"
+#include "./stats.h"
 #include "./utf8_util.h"
 #include "./write_bits.h"
 
@@ -107,12 +108,20 @@ typedef struct BrotliEncoderStateStruct {
   uint32_t remaining_metadata_bytes_;
   BrotliEncoderStreamState stream_state_;
 
+  BrotliEncoderStats stats_;
+  BROTLI_BOOL collect_stats_;
+
   BROTLI_BOOL is_last_block_emitted_;
   BROTLI_BOOL is_initialized_;
 } BrotliEncoderStateStruct;
 
 static BROTLI_BOOL EnsureInitialized(BrotliEncoderState* s);
 
+/* Returns NULL if statistics are not collected. */
+static BrotliEncoderStats* GetStatsOrNull(BrotliEncoderState* s) {
+  return s->collect_stats_ ? &s->stats_ : NULL;
+}
+
 static size_t InputBlockSize(BrotliEncoderState* s) {
   if (!EnsureInitialized(s)) return 0;
   return (size_t)1 << s->params.lgblock;
@@ -131,6 +140,11 @@ static size_t RemainingInputBlockSize(BrotliEncoderState* s) {
 
 BROTLI_BOOL BrotliEncoderSetParameter(
     BrotliEncoderState* state, BrotliEncoderParameter p, uint32_t value) {
+  /* Statistics can be switched on and off at any time. */
+  if (p == BROTLI_PARAM_STATS) {
+    state->collect_stats_ = TO_BROTLI_BOOL(value != 0);
+    return BROTLI_TRUE;
+  }
   /* Changing parameters on the fly is not implemented yet. */
   if (state->is_initialized_) return BROTLI_FALSE;
   /* TODO: Validate/clamp parameters here. */
@@ -440,12 +454,14 @@ static void WriteMetaBlockInternal(MemoryManager* m,
                                    const int* saved_dist_cache,
                                    int* dist_cache,
                                    size_t* storage_ix,
-                                   uint8_t* storage) {
+                                   uint8_t* storage,
+                                   BrotliEncoderStats* stats) {
   const uint32_t wrapped_last_flush_pos = WrapPosition(last_flush_pos);
   uint8_t last_byte;
   uint8_t last_byte_bits;
   uint32_t num_direct_distance_codes = 0;
   uint32_t distance_postfix_bits = 0;
+  uint64_t start;
 
   if (bytes == 0) {
     /* Write the ISLAST and ISEMPTY bits. */
@@ -454,11 +470,15 @@ static void WriteMetaBlockInternal(MemoryManager* m,
     return;
   }
 
+  BROTLI_STATS_ADD(stats, metablocks, 1);
+  BROTLI_STATS_ADD(stats, commands, num_commands);
+  BROTLI_STATS_ADD(stats, literals, num_literals);
   if (!ShouldCompress(data, mask, last_flush_pos, bytes,
                       num_literals, num_commands)) {
     /* Restore the distance cache, as its last update by
        CreateBackwardReferences is now unused. */
     memcpy(dist_cache, saved_dist_cache, 4 * sizeof(dist_cache[0]));
+    BROTLI_STATS_ADD(stats, uncompressed_metablocks, 1);
     BrotliStoreUncompressedMetaBlock(is_last, data,
                                      wrapped_last_flush_pos, mask, bytes,
                                      storage_ix, storage);
@@ -477,17 +497,21 @@ static void WriteMetaBlockInternal(MemoryManager* m,
                               distance_postfix_bits);
   }
   if (params->quality <= MAX_QUALITY_FOR_STATIC_ENTROPY_CODES) {
+    start = BrotliStatsStart(stats);
     BrotliStoreMetaBlockFast(m, data, wrapped_last_flush_pos,
                              bytes, mask, is_last,
                              commands, num_commands,
                              storage_ix, storage);
     if (BROTLI_IS_OOM(m)) return;
+    BROTLI_STATS_ADD_TIME(stats, entropy_coding_ns, start);
   } else if (params->quality < MIN_QUALITY_FOR_BLOCK_SPLIT) {
+    start = BrotliStatsStart(stats);
     BrotliStoreMetaBlockTrivial(m, data, wrapped_last_flush_pos,
                                 bytes, mask, is_last,
                                 commands, num_commands,
                                 storage_ix, storage);
     if (BROTLI_IS_OOM(m)) return;
+    BROTLI_STATS_ADD_TIME(stats, entropy_coding_ns, start);
   } else {
     ContextType literal_context_mode = CONTEXT_UTF8;
     MetaBlockSplit mb;
@@ -495,6 +519,7 @@ static void WriteMetaBlockInternal(MemoryManager* m,
     if (params->quality < MIN_QUALITY_FOR_HQ_BLOCK_SPLITTING) {
       size_t num_literal_contexts = 1;
       const uint32_t* literal_context_map = NULL;
+      start = BrotliStatsStart(stats);
       DecideOverLiteralContextModeling(data, wrapped_last_flush_pos,
                                        bytes, mask,
                                        params->quality,
@@ -505,6 +530,11 @@ static void WriteMetaBlockInternal(MemoryManager* m,
           prev_byte, prev_byte2, literal_context_mode, num_literal_contexts,
           literal_context_map, commands, num_commands, &mb);
       if (BROTLI_IS_OOM(m)) return;
+      BROTLI_STATS_ADD_TIME(stats, block_splitting_ns, start);
+      BROTLI_STATS_ADD(stats, block_types, mb.literal_split.num_types +
+          mb.command_split.num_types + mb.distance_split.num_types);
+      BROTLI_STATS_ADD(stats, blocks, mb.literal_split.num_blocks +
+          mb.command_split.num_blocks + mb.distance_split.num_blocks);
     } else {
       if (!BrotliIsMostlyUTF8(data, wrapped_last_flush_pos, mask, bytes,
                               kMinUTF8Ratio)) {
@@ -514,9 +544,10 @@ static void WriteMetaBlockInternal(MemoryManager* m,
                            prev_byte, prev_byte2,
                            commands, num_commands,
                            literal_context_mode,
-                           &mb);
+                           &mb, stats);
       if (BROTLI_IS_OOM(m)) return;
     }
+    start = BrotliStatsStart(stats);
     if (params->quality >= MIN_QUALITY_FOR_OPTIMIZE_HISTOGRAMS) {
       BrotliOptimizeHistograms(num_direct_distance_codes,
                                distance_postfix_bits,
@@ -533,10 +564,12 @@ static void WriteMetaBlockInternal(MemoryManager* m,
                          storage_ix, storage);
     if (BROTLI_IS_OOM(m)) return;
     DestroyMetaBlockSplit(m, &mb);
+    BROTLI_STATS_ADD_TIME(stats, entropy_coding_ns, start);
   }
   if (bytes + 4 < (*storage_ix >> 3)) {
     /* Restore the distance cache and last byte. */
     memcpy(dist_cache, saved_dist_cache, 4 * sizeof(dist_cache[0]));
+    BROTLI_STATS_ADD(stats, uncompressed_metablocks, 1);
     storage[0] = last_byte;
     *storage_ix = last_byte_bits;
     BrotliStoreUncompressedMetaBlock(is_last, data,
@@ -604,6 +637,8 @@ static void BrotliEncoderInitState(BrotliEncoderState* s) {
   s->available_out_ = 0;
   s->total_out_ = 0;
   s->stream_state_ = BROTLI_STREAM_PROCESSING;
+  memset(&s->stats_, 0, sizeof(s->stats_));
+  s->collect_stats_ = BROTLI_FALSE;
   s->is_last_block_emitted_ = BROTLI_FALSE;
   s->is_initialized_ = BROTLI_FALSE;
 
@@ -671,6 +706,176 @@ void BrotliEncoderDestroyInstance(BrotliEncoderState* state) {
   }
 }
 
+void BrotliEncoderReset(BrotliEncoderState* s) {
+  if (!s->is_initialized_ || BROTLI_IS_OOM(&s->memory_manager_)) {
+    /* Nothing allocated yet, or unusable anyway. */
+    return;
+  }
+
+  s->input_pos_ = 0;
+  s->num_commands_ = 0;
+  s->num_literals_ = 0;
+  s->last_insert_len_ = 0;
+  s->last_flush_pos_ = 0;
+  s->last_processed_pos_ = 0;
+  s->prev_byte_ = 0;
+  s->prev_byte2_ = 0;
+  s->next_out_ = NULL;
+  s->available_out_ = 0;
+  s->total_out_ = 0;
+  s->remaining_metadata_bytes_ = BROTLI_UINT32_MAX;
+  s->stream_state_ = BROTLI_STREAM_PROCESSING;
+  memset(&s->stats_, 0, sizeof(s->stats_));
+  s->is_last_block_emitted_ = BROTLI_FALSE;
+
+  /* Only fully grown ring buffer is kept; data is overwritten before being
+     read, except for the guard bytes that are expected to be zero. */
+  {
+    RingBuffer* rb = &s->ringbuffer_;
+    if (rb->cur_size_ == rb->total_size_) {
+      rb->buffer_[-2] = rb->buffer_[-1] = 0;
+      rb->buffer_[rb->size_ - 2] = rb->buffer_[rb->size_ - 1] = 0;
+    } else {
+      RingBufferFree(&s->memory_manager_, rb);
+      RingBufferInit(rb);
+    }
+    rb->pos_ = 0;
+  }
+
+  {
+    int lgwin = s->params.lgwin;
+    if (s->params.quality == FAST_ONE_PASS_COMPRESSION_QUALITY ||
+        s->params.quality == FAST_TWO_PASS_COMPRESSION_QUALITY) {
+      lgwin = BROTLI_MAX(int, lgwin, 18);
+    }
+    EncodeWindowBits(lgwin, &s->last_byte_, &s->last_byte_bits_);
+  }
+
+  if (s->params.quality == FAST_ONE_PASS_COMPRESSION_QUALITY) {
+    InitCommandPrefixCodes(s->cmd_depths_, s->cmd_bits_,
+                           s->cmd_code_, &s->cmd_code_numbits_);
+  }
+
+  /* Hash tables are cleared lazily on the next use. */
+  HashersReset(&s->hashers_, ChooseHasher(&s->params));
+
+  s->dist_cache_[0] = 4;
+  s->dist_cache_[1] = 11;
+  s->dist_cache_[2] = 15;
+  s->dist_cache_[3] = 16;
+  memcpy(s->saved_dist_cache_, s->dist_cache_, sizeof(s->dist_cache_));
+}
+
+/* Relocates |p| pointing into [|from|, |from| + |size|] to the same offset in
+   |to|. Returns 0 if |p| points elsewhere. */
+static uint8_t* RelocatePointer(const uint8_t* p, const uint8_t* from,
+                                size_t size, uint8_t* to) {
+  if (!p || !from || p < from || p > from + size) return 0;
+  return to + (p - from);
+}
+
+BrotliEncoderState* BrotliEncoderCopyInstance(const BrotliEncoderState* s) {
+  const MemoryManager* src_m = &s->memory_manager_;
+  BrotliEncoderState* copy;
+  MemoryManager* m;
+  if (BROTLI_IS_OOM(src_m)) return 0;
+  copy = BrotliEncoderCreateInstance(
+      src_m->alloc_func, src_m->free_func, src_m->opaque);
+  if (!copy) return 0;
+  m = &copy->memory_manager_;
+
+  /* Shallow copy everything but the memory manager, then detach all owned
+     buffers so that the copy is always safe to destroy. */
+  {
+    MemoryManager saved_m = *m;
+    memcpy(copy, s, sizeof(BrotliEncoderState));
+    copy->memory_manager_ = saved_m;
+  }
+  InitHashers(&copy->hashers_);
+  copy->ringbuffer_.data_ = 0;
+  copy->ringbuffer_.buffer_ = 0;
+  copy->ringbuffer_.cur_size_ = 0;
+  copy->commands_ = 0;
+  copy->cmd_alloc_size_ = 0;
+  copy->storage_ = 0;
+  copy->storage_size_ = 0;
+  copy->large_table_ = NULL;
+  copy->large_table_size_ = 0;
+  copy->command_buf_ = NULL;
+  copy->literal_buf_ = NULL;
+  copy->next_out_ = NULL;
+
+  HashersCopy(m, &s->hashers_, &copy->hashers_);
+  if (BROTLI_IS_OOM(m)) goto oom;
+
+  if (s->ringbuffer_.data_) {
+    RingBufferInitBuffer(m, s->ringbuffer_.cur_size_, &copy->ringbuffer_);
+    if (BROTLI_IS_OOM(m)) goto oom;
+    memcpy(copy->ringbuffer_.buffer_ - 2, s->ringbuffer_.buffer_ - 2,
+           2 + s->ringbuffer_.cur_size_);
+  }
+
+  if (s->commands_) {
+    copy->commands_ = BROTLI_ALLOC(m, Command, s->cmd_alloc_size_);
+    if (BROTLI_IS_OOM(m)) goto oom;
+    copy->cmd_alloc_size_ = s->cmd_alloc_size_;
+    memcpy(copy->commands_, s->commands_, s->num_commands_ * sizeof(Command));
+  }
+
+  if (s->storage_) {
+    copy->storage_ = BROTLI_ALLOC(m, uint8_t, s->storage_size_);
+    if (BROTLI_IS_OOM(m)) goto oom;
+    copy->storage_size_ = s->storage_size_;
+    memcpy(copy->storage_, s->storage_, s->storage_size_);
+  }
+
+  if (s->large_table_) {
+    copy->large_table_ = BROTLI_ALLOC(m, int, s->large_table_size_);
+    if (BROTLI_IS_OOM(m)) goto oom;
+    copy->large_table_size_ = s->large_table_size_;
+    memcpy(copy->large_table_, s->large_table_,
+           s->large_table_size_ * sizeof(int));
+  }
+
+  if (s->command_buf_) {
+    copy->command_buf_ =
+        BROTLI_ALLOC(m, uint32_t, kCompressFragmentTwoPassBlockSize);
+    copy->literal_buf_ =
+        BROTLI_ALLOC(m, uint8_t, kCompressFragmentTwoPassBlockSize);
+    if (BROTLI_IS_OOM(m)) goto oom;
+    memcpy(copy->command_buf_, s->command_buf_,
+           kCompressFragmentTwoPassBlockSize * sizeof(uint32_t));
+    memcpy(copy->literal_buf_, s->literal_buf_,
+           kCompressFragmentTwoPassBlockSize);
+  }
+
+  /* Pending output lives either in storage or in the tiny buffer. */
+  if (s->next_out_) {
+    copy->next_out_ = RelocatePointer(
+        s->next_out_, s->storage_, s->storage_size_, copy->storage_);
+    if (!copy->next_out_) {
+      copy->next_out_ = RelocatePointer(s->next_out_, s->tiny_buf_.u8,
+          sizeof(s->tiny_buf_), copy->tiny_buf_.u8);
+    }
+  }
+
+  return copy;
+
+oom:
+  BrotliEncoderDestroyInstance(copy);
+  return 0;
+}
+
+void BrotliEncoderGetStats(const BrotliEncoderState* s,
+                           BrotliEncoderStats* stats) {
+  if (!s->collect_stats_) {
+    memset(stats, 0, sizeof(*stats));
+    return;
+  }
+  *stats = s->stats_;
+  stats->bytes_out = s->total_out_;
+}
+
 /*
    Copies the given input data to the internal ring buffer of the compressor.
    No processing of the data occurs at this time and this function can be
@@ -795,6 +1000,8 @@ static BROTLI_BOOL EncodeData(
   uint8_t* data;
   uint32_t mask;
   MemoryManager* m = &s->memory_manager_;
+  BrotliEncoderStats* stats = GetStatsOrNull(s);
+  uint64_t start;
 
   if (!EnsureInitialized(s)) return BROTLI_FALSE;
   data = s->ringbuffer_.buffer_;
@@ -834,6 +1041,7 @@ static BROTLI_BOOL EncodeData(
     storage[0] = s->last_byte_;
     table = GetHashTable(s, s->params.quality, bytes, &table_size);
     if (BROTLI_IS_OOM(m)) return BROTLI_FALSE;
+    start = BrotliStatsStart(stats);
     if (s->params.quality == FAST_ONE_PASS_COMPRESSION_QUALITY) {
       BrotliCompressFragmentFast(
           m, &data[wrapped_last_processed_pos & mask],
@@ -852,6 +1060,8 @@ static BROTLI_BOOL EncodeData(
           &storage_ix, storage);
       if (BROTLI_IS_OOM(m)) return BROTLI_FALSE;
     }
+    BROTLI_STATS_ADD_TIME(stats, fragment_ns, start);
+    BROTLI_STATS_ADD(stats, metablocks, 1);
     s->last_byte_ = storage[storage_ix >> 3];
     s->last_byte_bits_ = storage_ix & 7u;
     UpdateLastProcessedPos(s);
@@ -879,6 +1089,7 @@ static BROTLI_BOOL EncodeData(
     }
   }
 
+  start = BrotliStatsStart(stats);
   BrotliCreateBackwardReferences(m, bytes, wrapped_last_processed_pos,
                                  is_last, data, mask,
                                  &s->params,
@@ -889,6 +1100,7 @@ static BROTLI_BOOL EncodeData(
                                  &s->num_commands_,
                                  &s->num_literals_);
   if (BROTLI_IS_OOM(m)) return BROTLI_FALSE;
+  BROTLI_STATS_ADD_TIME(stats, backward_references_ns, start);
 
   {
     const size_t max_length = MaxMetablockSize(&s->params);
@@ -944,7 +1156,7 @@ static BROTLI_BOOL EncodeData(
         m, data, mask, s->last_flush_pos_, metablock_size, is_last,
         &s->params, s->prev_byte_, s->prev_byte2_,
         s->num_literals_, s->num_commands_, s->commands_, s->saved_dist_cache_,
-        s->dist_cache_, &storage_ix, storage);
+        s->dist_cache_, &storage_ix, storage, stats);
     if (BROTLI_IS_OOM(m)) return BROTLI_FALSE;
     s->last_byte_ = storage[storage_ix >> 3];
     s->last_byte_bits_ = storage_ix & 7u;
@@ -1149,7 +1361,7 @@ static BROTLI_BOOL BrotliCompressBufferQuality10(
                            prev_byte, prev_byte2,
                            commands, num_commands,
                            literal_context_mode,
-                           &mb);
+                           &mb, NULL);
       if (BROTLI_IS_OOM(m)) goto oom;
       BrotliOptimizeHistograms(num_direct_distance_codes,
                                distance_postfix_bits,
@@ -1391,6 +1603,7 @@ static BROTLI_BOOL BrotliEncoderCompressStreamFast(
   uint8_t* tmp_literal_buf = NULL;
   uint8_t* literal_buf = NULL;
   MemoryManager* m = &s->memory_manager_;
+  BrotliEncoderStats* stats = GetStatsOrNull(s);
   if (s->params.quality != FAST_ONE_PASS_COMPRESSION_QUALITY &&
       s->params.quality != FAST_TWO_PASS_COMPRESSION_QUALITY) {
     return BROTLI_FALSE;
@@ -1437,6 +1650,7 @@ static BROTLI_BOOL BrotliEncoderCompressStreamFast(
       size_t storage_ix = s->last_byte_bits_;
       size_t table_size;
       int* table;
+      uint64_t start;
 
       if (force_flush && block_size == 0) {
         s->stream_state_ = BROTLI_STREAM_FLUSH_REQUESTED;
@@ -1453,6 +1667,7 @@ static BROTLI_BOOL BrotliEncoderCompressStreamFast(
       table = GetHashTable(s, s->params.quality, block_size, &table_size);
       if (BROTLI_IS_OOM(m)) return BROTLI_FALSE;
 
+      start = BrotliStatsStart(stats);
       if (s->params.quality == FAST_ONE_PASS_COMPRESSION_QUALITY) {
         BrotliCompressFragmentFast(m, *next_in, block_size, is_last, table,
             table_size, s->cmd_depths_, s->cmd_bits_, &s->cmd_code_numbits_,
@@ -1464,6 +1679,9 @@ static BROTLI_BOOL BrotliEncoderCompressStreamFast(
             &storage_ix, storage);
         if (BROTLI_IS_OOM(m)) return BROTLI_FALSE;
       }
+      BROTLI_STATS_ADD_TIME(stats, fragment_ns, start);
+      BROTLI_STATS_ADD(stats, metablocks, 1);
+      BROTLI_STATS_ADD(stats, bytes_in, block_size);
       *next_in += block_size;
       *available_in -= block_size;
       if (inplace) {
@@ -1599,6 +1817,7 @@ BROTLI_BOOL BrotliEncoderCompressStream(
       size_t copy_input_size =
           BROTLI_MIN(size_t, remaining_block_size, *available_in);
       CopyInputToRingBuffer(s, copy_input_size, *next_in);
+      BROTLI_STATS_ADD(GetStatsOrNull(s), bytes_in, copy_input_size);
       *next_in += copy_input_size;
       *available_in -= copy_input_size;
       continue;
@@ -1672,6 +1891,7 @@ void BrotliEncoderCopyInputToRingBuffer(BrotliEncoderState* s,
                                         const size_t input_size,
                                         const uint8_t* input_buffer) {
   CopyInputToRingBuffer(s, input_size, input_buffer);
+  BROTLI_STATS_ADD(GetStatsOrNull(s), bytes_in, input_size);
 }
 BROTLI_BOOL BrotliEncoderWriteData(
     BrotliEncoderState* s, const BROTLI_BOOL is_last,
@@ -668,6 +668,29 @@ static BROTLI_INLINE void DestroyHashers(MemoryManager* m, Hashers* self) {
 #undef CLEANUP_
 }
 
+/* Deep-copies all hashers allocated in |src| into empty |self|. */
+static BROTLI_INLINE void HashersCopy(
+    MemoryManager* m, const Hashers* src, Hashers* self) {
+#define COPY_(N)                                        \
+  if (src->h ## N) {                                    \
+    self->h ## N = BROTLI_ALLOC(m, H ## N, 1);          \
+    if (BROTLI_IS_OOM(m)) return;                       \
+    memcpy(self->h ## N, src->h ## N, sizeof(H ## N));  \
+  }
+  FOR_ALL_HASHERS(COPY_)
+#undef COPY_
+  if (src->h10) {
+    self->h10->forest_ = NULL;
+    if (src->h10->forest_) {
+      self->h10->forest_ =
+          BROTLI_ALLOC(m, uint32_t, 2 * src->h10->forest_size_);
+      if (BROTLI_IS_OOM(m)) return;
+      memcpy(self->h10->forest_, src->h10->forest_,
+             2 * src->h10->forest_size_ * sizeof(uint32_t));
+    }
+  }
+}
+
 static BROTLI_INLINE void HashersReset(Hashers* self, int type) {
   switch (type) {
 #define RESET_(N) case N: ResetH ## N(self->h ## N); break;
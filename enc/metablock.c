@@ -35,7 +35,8 @@ void BrotliBuildMetaBlock(MemoryManager* m,
                           const Command* cmds,
                           size_t num_commands,
                           ContextType literal_context_mode,
-                          MetaBlockSplit* mb) {
+                          MetaBlockSplit* mb,
+                          BrotliEncoderStats* stats) {
   /* Histogram ids need to fit in one byte. */
   static const size_t kMaxNumberOfHistograms = 256;
   HistogramDistance* distance_histograms;
@@ -44,6 +45,7 @@ void BrotliBuildMetaBlock(MemoryManager* m,
   size_t num_literal_contexts;
   size_t num_distance_contexts;
   size_t i;
+  uint64_t start = BrotliStatsStart(stats);
 
   BrotliSplitBlock(m, cmds, num_commands,
                    ringbuffer, pos, mask, params,
@@ -51,6 +53,12 @@ void BrotliBuildMetaBlock(MemoryManager* m,
                    &mb->command_split,
                    &mb->distance_split);
   if (BROTLI_IS_OOM(m)) return;
+  BROTLI_STATS_ADD_TIME(stats, block_splitting_ns, start);
+  BROTLI_STATS_ADD(stats, block_types, mb->literal_split.num_types +
+      mb->command_split.num_types + mb->distance_split.num_types);
+  BROTLI_STATS_ADD(stats, blocks, mb->literal_split.num_blocks +
+      mb->command_split.num_blocks + mb->distance_split.num_blocks);
+  start = BrotliStatsStart(stats);
 
   literal_context_modes =
       BROTLI_ALLOC(m, ContextType, mb->literal_split.num_types);
@@ -122,6 +130,11 @@ void BrotliBuildMetaBlock(MemoryManager* m,
                                   mb->distance_context_map);
   if (BROTLI_IS_OOM(m)) return;
   BROTLI_FREE(m, distance_histograms);
+  BROTLI_STATS_ADD_TIME(stats, clustering_ns, start);
+  BROTLI_STATS_ADD(stats, histograms,
+      mb->literal_context_map_size + mb->distance_context_map_size);
+  BROTLI_STATS_ADD(stats, clusters,
+      mb->literal_histograms_size + mb->distance_histograms_size);
 }
 
 #define FN(X) X ## Literal
@@ -18,6 +18,7 @@
 #include "./memory.h"
 #include "./port.h"
 #include "./quality.h"
+#include "./stats.h"
 
 #if defined(__cplusplus) || defined(c_plusplus)
 extern "C" {
@@ -78,7 +79,8 @@ BROTLI_INTERNAL void BrotliBuildMetaBlock(MemoryManager* m,
                                           const Command* cmds,
                                           size_t num_commands,
                                           ContextType literal_context_mode,
-                                          MetaBlockSplit* mb);
+                                          MetaBlockSplit* mb,
+                                          BrotliEncoderStats* stats);
 
 /* Uses a fast greedy block splitter that tries to merge current block with the
    last or the second last block and uses a static context clustering which
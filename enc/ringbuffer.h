@@ -104,13 +104,15 @@ static BROTLI_INLINE void RingBufferWriteTail(
 /* Push bytes into the ring buffer. */
 static BROTLI_INLINE void RingBufferWrite(
     MemoryManager* m, const uint8_t *bytes, size_t n, RingBuffer* rb) {
-  if (rb->pos_ == 0 && n < rb->tail_size_) {
+  if (rb->pos_ == 0 && n < rb->tail_size_ &&
+      rb->cur_size_ < rb->total_size_) {
     /* Special case for the first write: to process the first block, we don't
        need to allocate the whole ring-buffer and we don't need the tail
        either. However, we do this memory usage optimization only if the
        first write is less than the tail size, which is also the input block
        size, otherwise it is likely that other blocks will follow and we
-       will need to reallocate to the full size anyway. */
+       will need to reallocate to the full size anyway. A full ring-buffer
+       retained by BrotliEncoderReset is reused as is. */
     rb->pos_ = (uint32_t)n;
     RingBufferInitBuffer(m, rb->pos_, rb);
     if (BROTLI_IS_OOM(m)) return;
@@ -0,0 +1,64 @@
+/* Copyright 2016 Google Inc. All Rights Reserved.
+
+   Distributed under MIT license.
+   See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+*/
+
+/* Clock and helpers for the optional encoder statistics. */
+
+#ifndef BROTLI_ENC_STATS_H_
+#define BROTLI_ENC_STATS_H_
+
+#include <brotli/encode.h>
+#include <brotli/types.h>
+#include "./port.h"
+
+#if defined(_WIN32)
+#include <windows.h>
+#else
+#include <time.h>
+#endif
+
+#if defined(__cplusplus) || defined(c_plusplus)
+extern "C" {
+#endif
+
+/* Returns the time of a monotonic clock, in nanoseconds. */
+static BROTLI_INLINE uint64_t BrotliStatsNow(void) {
+#if defined(_WIN32)
+  LARGE_INTEGER counter;
+  LARGE_INTEGER frequency;
+  QueryPerformanceCounter(&counter);
+  QueryPerformanceFrequency(&frequency);
+  return (uint64_t)((double)counter.QuadPart * 1e9 /
+                    (double)frequency.QuadPart);
+#elif defined(CLOCK_MONOTONIC)
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (uint64_t)ts.tv_sec * 1000000000u + (uint64_t)ts.tv_nsec;
+#else
+  return (uint64_t)((double)clock() * 1e9 / CLOCKS_PER_SEC);
+#endif
+}
+
+/* Statistics are collected only if |stats| is not NULL. */
+static BROTLI_INLINE uint64_t BrotliStatsStart(
+    const BrotliEncoderStats* stats) {
+  return stats ? BrotliStatsNow() : 0;
+}
+
+#define BROTLI_STATS_ADD(STATS, FIELD, VALUE)       \
+  do {                                              \
+    if (STATS) (STATS)->FIELD += (uint64_t)(VALUE); \
+  } while (0)
+
+#define BROTLI_STATS_ADD_TIME(STATS, FIELD, START)           \
+  do {                                                       \
+    if (STATS) (STATS)->FIELD += BrotliStatsNow() - (START); \
+  } while (0)
+
+#if defined(__cplusplus) || defined(c_plusplus)
+}  /* extern "C" */
+#endif
+
+#endif  /* BROTLI_ENC_STATS_H_ */
@@ -148,6 +148,65 @@ BROTLI_DEC_API BrotliDecoderState* BrotliDecoderCreateInstance(
  */
 BROTLI_DEC_API void BrotliDecoderDestroyInstance(BrotliDecoderState* state);
 
+/**
+ * Creates a deep copy of ::BrotliDecoderState instance.
+ *
+ * The copy has the same window contents, prefix codes, context maps and
+ * buffered input as @p state, and continues the same stream independently of
+ * it. Custom dictionary, if any, is shared; it @b MUST stay available for the
+ * lifetime of both instances.
+ *
+ * The copy uses the same memory allocator as @p state.
+ *
+ * @param state decoder instance to be copied
+ * @returns @c 0 if instance can not be allocated
+ * @returns pointer to the new ::BrotliDecoderState otherwise
+ */
+BROTLI_DEC_API BrotliDecoderState* BrotliDecoderCopyInstance(
+    const BrotliDecoderState* state);
+
+/**
+ * Decoder statistics, see ::BrotliDecoderGetStats.
+ *
+ * The counters are cheap enough to be always maintained: they are updated
+ * once per command, prefix code or meta-block, never per byte.
+ */
+typedef struct BrotliDecoderStats {
+  /** Number of non-empty meta-blocks, metadata excluded. */
+  uint64_t metablocks;
+  /** Number of meta-blocks stored uncompressed. */
+  uint64_t uncompressed_metablocks;
+  /** Number of metadata blocks. */
+  uint64_t metadata_blocks;
+  /** Number of insert-and-copy commands. */
+  uint64_t commands;
+  /** Number of bytes produced by Huffman-coded literals. */
+  uint64_t literal_bytes;
+  /** Number of bytes produced by backward references. */
+  uint64_t copy_bytes;
+  /** Number of static dictionary references. */
+  uint64_t dictionary_references;
+  /** Number of bytes produced by static dictionary references. */
+  uint64_t dictionary_bytes;
+  /** Number of bytes in uncompressed meta-blocks. */
+  uint64_t uncompressed_bytes;
+  /** Number of Huffman decoding tables built. */
+  uint64_t huffman_tables;
+  /** Total number of entries of the Huffman decoding tables built. */
+  uint64_t huffman_table_entries;
+  /** Number of ring buffer allocations, the first one included. */
+  uint64_t ringbuffer_allocations;
+} BrotliDecoderStats;
+
+/**
+ * Gets the statistics of the stream decoded so far.
+ *
+ * @param state decoder instance
+ * @param[out] stats statistics
+ */
+BROTLI_DEC_API void BrotliDecoderGetStats(
+    const BrotliDecoderState* state, BrotliDecoderStats* stats);
+
 /**
  * Performs one-shot memory-to-memory decompression.
  *
@@ -165,9 +165,59 @@ typedef enum BrotliEncoderParameter {
    *       memory. \n The rough formula of memory used for temporary input
    *       storage is `3 << lgBlock`.
    */
-  BROTLI_PARAM_LGBLOCK = 3
+  BROTLI_PARAM_LGBLOCK = 3,
+  /**
+   * Collect statistics, see ::BrotliEncoderGetStats.
+   *
+   * Values are @c 0 (default) and @c 1. Collecting statistics costs a few
+   * clock reads per meta-block. Unlike other parameters, this one can be
+   * changed at any time.
+   */
+  BROTLI_PARAM_STATS = 4
 } BrotliEncoderParameter;
 
+/**
+ * Encoder statistics, collected if ::BROTLI_PARAM_STATS is set.
+ *
+ * Times are measured with a monotonic clock, in nanoseconds. Qualities @c 0
+ * and @c 1 compress input fragments in a single stage, accounted for in
+ * @p fragment_ns only.
+ */
+typedef struct BrotliEncoderStats {
+  /** Number of input bytes consumed. */
+  uint64_t bytes_in;
+  /** Number of compressed bytes produced. */
+  uint64_t bytes_out;
+  /** Number of meta-blocks, or input fragments for qualities @c 0 and
+      @c 1. */
+  uint64_t metablocks;
+  /** Number of meta-blocks stored uncompressed. */
+  uint64_t uncompressed_metablocks;
+  /** Number of commands emitted. */
+  uint64_t commands;
+  /** Number of literals emitted. */
+  uint64_t literals;
+
+  /** Time spent finding backward references. */
+  uint64_t backward_references_ns;
+  /** Time spent splitting meta-blocks into blocks. */
+  uint64_t block_splitting_ns;
+  /** Number of literal, command and distance block types. */
+  uint64_t block_types;
+  /** Number of literal, command and distance blocks. */
+  uint64_t blocks;
+  /** Time spent clustering histograms. */
+  uint64_t clustering_ns;
+  /** Number of histograms before clustering. */
+  uint64_t histograms;
+  /** Number of histograms after clustering. */
+  uint64_t clusters;
+  /** Time spent building entropy codes and writing meta-blocks. */
+  uint64_t entropy_coding_ns;
+  /** Time spent compressing fragments, for qualities @c 0 and @c 1. */
+  uint64_t fragment_ns;
+} BrotliEncoderStats;
+
 /**
  * Opaque structure that holds encoder state.
  *
@@ -216,6 +266,46 @@ BROTLI_ENC_API BrotliEncoderState* BrotliEncoderCreateInstance(
  */
 BROTLI_ENC_API void BrotliEncoderDestroyInstance(BrotliEncoderState* state);
 
+/**
+ * Prepares ::BrotliEncoderState instance for compressing a new stream.
+ *
+ * Parameters are preserved, as well as the memory allocated for the ring
+ * buffer, hash tables and other internal buffers, so that the next stream
+ * does not pay the allocation cost again. Custom dictionary, if any, is
+ * discarded; ::BrotliEncoderSetCustomDictionary could be invoked again.
+ *
+ * @param state encoder instance to be reset
+ */
+BROTLI_ENC_API void BrotliEncoderReset(BrotliEncoderState* state);
+
+/**
+ * Creates a deep copy of ::BrotliEncoderState instance.
+ *
+ * The copy has the same parameters, custom dictionary, window contents, hash
+ * tables and pending output as @p state, and continues the same stream
+ * independently of it. Copying a primed instance is much cheaper than
+ * priming a new one, e.g. with ::BrotliEncoderSetCustomDictionary.
+ *
+ * The copy uses the same memory allocator as @p state.
+ *
+ * @param state encoder instance to be copied
+ * @returns @c 0 if instance can not be allocated or @p state is unusable
+ * @returns pointer to the new ::BrotliEncoderState otherwise
+ */
+BROTLI_ENC_API BrotliEncoderState* BrotliEncoderCopyInstance(
+    const BrotliEncoderState* state);
+
+/**
+ * Gets the statistics collected since the instance was created or reset.
+ *
+ * All the values are zero unless ::BROTLI_PARAM_STATS is set.
+ *
+ * @param state encoder instance
+ * @param[out] stats statistics
+ */
+BROTLI_ENC_API void BrotliEncoderGetStats(
+    const BrotliEncoderState* state, BrotliEncoderStats* stats);
+
 /* Calculates maximum input size that can be processed at once. */
 BROTLI_DEPRECATED BROTLI_ENC_API size_t BrotliEncoderInputBlockSize(
     BrotliEncoderState* state);
@@ -2,17 +2,29 @@
 #include <Python.h>
 #include <bytesobject.h>
 #include <structmember.h>
+#include <algorithm>
+#include <new>
+#include <queue>
 #include <vector>
 #include "../common/version.h"
 #include <brotli/decode.h>
 #include <brotli/encode.h>
 
+#if defined(_WIN32)
+#include <windows.h>
+#include <process.h>
+#else
+#include <pthread.h>
+#include <unistd.h>
+#endif
+
 #if PY_MAJOR_VERSION >= 3
 #define PyInt_Check PyLong_Check
 #define PyInt_AsLong PyLong_AsLong
 #endif
 
 static PyObject *BrotliError;
+static PyObject *BrotliOutputTooLargeError;
 
 static int as_bounded_int(PyObject *o, int* result, int lower_bound, int upper_bound) {
   long value = PyInt_AsLong(o);
@@ -87,11 +99,11 @@ static int lgblock_convertor(PyObject *o, int *lgblock) {
   return 1;
 }
 
-static BROTLI_BOOL compress_stream(BrotliEncoderState* enc, BrotliEncoderOperation op,
-                                   std::vector<uint8_t>* output, uint8_t* input, size_t input_length) {
+/* Same as "compress_stream", for callers that already released the GIL. */
+static BROTLI_BOOL compress_stream_unlocked(BrotliEncoderState* enc, BrotliEncoderOperation op,
+                                            std::vector<uint8_t>* output,
+                                            const uint8_t* input, size_t input_length) {
   BROTLI_BOOL ok = BROTLI_TRUE;
-  Py_BEGIN_ALLOW_THREADS
-
   size_t available_in = input_length;
   const uint8_t* next_in = input;
   size_t available_out = 0;
@@ -114,18 +126,325 @@ static BROTLI_BOOL compress_stream(BrotliEncoderState* enc, BrotliEncoderOperati
       continue;
     }
 
+    /* The last block is only encoded once the previous output is taken. */
+    if (op == BROTLI_OPERATION_FINISH && !BrotliEncoderIsFinished(enc)) {
+      continue;
+    }
+
+    break;
+  }
+
+  return ok;
+}
+
+static BROTLI_BOOL compress_stream(BrotliEncoderState* enc, BrotliEncoderOperation op,
+                                   std::vector<uint8_t>* output, uint8_t* input, size_t input_length) {
+  BROTLI_BOOL ok;
+  Py_BEGIN_ALLOW_THREADS
+  ok = compress_stream_unlocked(enc, op, output, input, input_length);
+  Py_END_ALLOW_THREADS
+  return ok;
+}
+
+static BROTLI_BOOL compress_stream_into(BrotliEncoderState* enc, BrotliEncoderOperation op,
+                                        uint8_t* output, size_t* output_length,
+                                        const uint8_t** next_in, size_t* available_in,
+                                        BROTLI_BOOL* output_exhausted) {
+  BROTLI_BOOL ok = BROTLI_TRUE;
+  *output_exhausted = BROTLI_FALSE;
+  Py_BEGIN_ALLOW_THREADS
+
+  size_t available_out = *output_length;
+  uint8_t* next_out = output;
+
+  while (ok) {
+    ok = BrotliEncoderCompressStream(enc, op,
+                                     available_in, next_in,
+                                     &available_out, &next_out, NULL);
+    if (!ok)
+      break;
+
+    if (*available_in || BrotliEncoderHasMoreOutput(enc)) {
+      if (!available_out) {
+        *output_exhausted = BROTLI_TRUE;
+        ok = BROTLI_FALSE;
+        break;
+      }
+      continue;
+    }
+
     break;
   }
 
+  *output_length -= available_out;
+
   Py_END_ALLOW_THREADS
   return ok;
 }
 
+/* Same as "decompress_stream", for callers that already released the GIL. */
+static BrotliDecoderResult decompress_stream_unlocked(BrotliDecoderState* dec,
+                                                      std::vector<uint8_t>* output,
+                                                      size_t max_length,
+                                                      const uint8_t** next_in,
+                                                      size_t* available_in) {
+  BrotliDecoderResult result;
+
+  for (;;) {
+    size_t available_out = 0;
+    result = BrotliDecoderDecompressStream(dec, available_in, next_in,
+                                           &available_out, 0, 0);
+    if (result == BROTLI_DECODER_RESULT_ERROR)
+      break;
+
+    // Request all available output unless the caller bounded it.
+    size_t buffer_length = max_length ? max_length - (*output).size() : 0;
+    const uint8_t* buffer = BrotliDecoderTakeOutput(dec, &buffer_length);
+    if (buffer_length) {
+      // Grow geometrically, but never allocate beyond the caller's bound.
+      size_t size = (*output).size() + buffer_length;
+      if (max_length && size > (*output).capacity()) {
+        (*output).reserve(std::min(std::max((*output).capacity() * 2, size),
+                                   max_length));
+      }
+      (*output).insert((*output).end(), buffer, buffer + buffer_length);
+    }
+
+    if (max_length && (*output).size() >= max_length)
+      break;
+
+    if (result != BROTLI_DECODER_RESULT_NEEDS_MORE_OUTPUT)
+      break;
+  }
+
+  return result;
+}
+
+static BrotliDecoderResult decompress_stream(BrotliDecoderState* dec,
+                                             std::vector<uint8_t>* output,
+                                             size_t max_length,
+                                             const uint8_t** next_in,
+                                             size_t* available_in) {
+  BrotliDecoderResult result;
+  Py_BEGIN_ALLOW_THREADS
+  result = decompress_stream_unlocked(dec, output, max_length,
+                                      next_in, available_in);
+  Py_END_ALLOW_THREADS
+  return result;
+}
+
+PyDoc_STRVAR(brotli_Dictionary_doc,
+"A custom dictionary prepared once and shared by many compressors and\n"
+"decompressors. Preparing the dictionary (hashing its contents) is the\n"
+"expensive part of using it; attaching a prepared dictionary to a new\n"
+"\"Compressor\" only copies the encoder state.\n"
+"\n"
+"Signature:\n"
+"  Dictionary(string, mode=MODE_GENERIC, quality=11, lgwin=22, lgblock=0)\n"
+"\n"
+"Args:\n"
+"  string (bytes): The dictionary data. Only last sliding window size bytes\n"
+"    will be used.\n"
+"  mode, quality, lgwin, lgblock (int, optional): Encoder parameters the\n"
+"    dictionary is prepared for; see \"Compressor\". Compressors using the\n"
+"    dictionary are bound to the same parameters.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If arguments are invalid.\n");
+
+typedef struct {
+  PyObject_HEAD
+  BrotliEncoderState* enc;
+  uint8_t* data;
+  size_t length;
+  int mode;
+  int quality;
+  int lgwin;
+  int lgblock;
+} brotli_Dictionary;
+
+static void brotli_Dictionary_dealloc(brotli_Dictionary* self) {
+  BrotliEncoderDestroyInstance(self->enc);
+  PyMem_Free(self->data);
+  #if PY_MAJOR_VERSION >= 3
+  Py_TYPE(self)->tp_free((PyObject*)self);
+  #else
+  self->ob_type->tp_free((PyObject*)self);
+  #endif
+}
+
+static PyObject* brotli_Dictionary_new(PyTypeObject *type, PyObject *args, PyObject *keywds) {
+  brotli_Dictionary *self;
+  self = (brotli_Dictionary *)type->tp_alloc(type, 0);
+
+  if (self != NULL) {
+    self->enc = NULL;
+    self->data = NULL;
+    self->length = 0;
+  }
+
+  return (PyObject *)self;
+}
+
+static int brotli_Dictionary_init(brotli_Dictionary *self, PyObject *args, PyObject *keywds) {
+  BrotliEncoderMode mode = BROTLI_MODE_GENERIC;
+  int quality = 11;
+  int lgwin = 22;
+  int lgblock = 0;
+  uint8_t* data;
+  size_t length;
+  int ok;
+
+  static const char *kwlist[] = {
+      "string", "mode", "quality", "lgwin", "lgblock", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "s#|O&O&O&O&:Dictionary",
+                    const_cast<char **>(kwlist),
+                    &data, &length,
+                    &mode_convertor, &mode,
+                    &quality_convertor, &quality,
+                    &lgwin_convertor, &lgwin,
+                    &lgblock_convertor, &lgblock);
+  if (!ok)
+    return -1;
+  if (self->enc) {
+    PyErr_SetString(BrotliError, "Dictionary is already initialized");
+    return -1;
+  }
+
+  /* Decoders keep a pointer to the data, so the dictionary owns a copy. */
+  self->data = (uint8_t*) PyMem_Malloc(length ? length : 1);
+  if (!self->data) {
+    PyErr_NoMemory();
+    return -1;
+  }
+  memcpy(self->data, data, length);
+  self->length = length;
+  self->mode = (int) mode;
+  self->quality = quality;
+  self->lgwin = lgwin;
+  self->lgblock = lgblock;
+
+  self->enc = BrotliEncoderCreateInstance(0, 0, 0);
+  if (!self->enc) {
+    PyErr_NoMemory();
+    return -1;
+  }
+  BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_MODE, (uint32_t)mode);
+  BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_QUALITY, (uint32_t)quality);
+  BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_LGWIN, (uint32_t)lgwin);
+  BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_LGBLOCK, (uint32_t)lgblock);
+
+  Py_BEGIN_ALLOW_THREADS
+  BrotliEncoderSetCustomDictionary(self->enc, self->length, self->data);
+  Py_END_ALLOW_THREADS
+
+  return 0;
+}
+
+static PyMemberDef brotli_Dictionary_members[] = {
+  {(char*) "mode", T_INT, offsetof(brotli_Dictionary, mode), READONLY, NULL},
+  {(char*) "quality", T_INT, offsetof(brotli_Dictionary, quality), READONLY, NULL},
+  {(char*) "lgwin", T_INT, offsetof(brotli_Dictionary, lgwin), READONLY, NULL},
+  {(char*) "lgblock", T_INT, offsetof(brotli_Dictionary, lgblock), READONLY, NULL},
+  {NULL}  /* Sentinel */
+};
+
+static PyTypeObject brotli_DictionaryType = {
+  #if PY_MAJOR_VERSION >= 3
+  PyVarObject_HEAD_INIT(NULL, 0)
+  #else
+  PyObject_HEAD_INIT(NULL)
+  0,                                     /* ob_size*/
+  #endif
+  "brotli.Dictionary",                   /* tp_name */
+  sizeof(brotli_Dictionary),             /* tp_basicsize */
+  0,                                     /* tp_itemsize */
+  (destructor)brotli_Dictionary_dealloc, /* tp_dealloc */
+  0,                                     /* tp_print */
+  0,                                     /* tp_getattr */
+  0,                                     /* tp_setattr */
+  0,                                     /* tp_compare */
+  0,                                     /* tp_repr */
+  0,                                     /* tp_as_number */
+  0,                                     /* tp_as_sequence */
+  0,                                     /* tp_as_mapping */
+  0,                                     /* tp_hash  */
+  0,                                     /* tp_call */
+  0,                                     /* tp_str */
+  0,                                     /* tp_getattro */
+  0,                                     /* tp_setattro */
+  0,                                     /* tp_as_buffer */
+  Py_TPFLAGS_DEFAULT,                    /* tp_flags */
+  brotli_Dictionary_doc,                 /* tp_doc */
+  0,                                     /* tp_traverse */
+  0,                                     /* tp_clear */
+  0,                                     /* tp_richcompare */
+  0,                                     /* tp_weaklistoffset */
+  0,                                     /* tp_iter */
+  0,                                     /* tp_iternext */
+  0,                                     /* tp_methods */
+  brotli_Dictionary_members,             /* tp_members */
+  0,                                     /* tp_getset */
+  0,                                     /* tp_base */
+  0,                                     /* tp_dict */
+  0,                                     /* tp_descr_get */
+  0,                                     /* tp_descr_set */
+  0,                                     /* tp_dictoffset */
+  (initproc)brotli_Dictionary_init,      /* tp_init */
+  0,                                     /* tp_alloc */
+  brotli_Dictionary_new,                 /* tp_new */
+};
+
+/* The "dictionary" argument: either raw bytes or a prepared Dictionary. */
+typedef struct {
+  brotli_Dictionary* prepared;  /* Borrowed reference, or NULL. */
+  const uint8_t* data;
+  size_t length;
+} dictionary_param;
+
+static int dictionary_convertor(PyObject *o, dictionary_param *dictionary) {
+  if (PyObject_TypeCheck(o, &brotli_DictionaryType)) {
+    brotli_Dictionary* prepared = (brotli_Dictionary*) o;
+    if (!prepared->enc) {
+      PyErr_SetString(BrotliError, "Dictionary is not initialized");
+      return 0;
+    }
+    dictionary->prepared = prepared;
+    dictionary->data = prepared->data;
+    dictionary->length = prepared->length;
+    return 1;
+  }
+
+  dictionary->prepared = NULL;
+  return PyArg_Parse(o, "s#:dictionary", &dictionary->data, &dictionary->length);
+}
+
+/* Fills unspecified (-1) encoder parameters from the prepared dictionary and
+   checks that the specified ones match it. */
+static int match_dictionary_params(brotli_Dictionary* dictionary,
+                                   BrotliEncoderMode* mode, int* quality,
+                                   int* lgwin, int* lgblock) {
+  if ((int) *mode == -1) *mode = (BrotliEncoderMode) dictionary->mode;
+  if (*quality == -1) *quality = dictionary->quality;
+  if (*lgwin == -1) *lgwin = dictionary->lgwin;
+  if (*lgblock == -1) *lgblock = dictionary->lgblock;
+
+  if ((int) *mode != dictionary->mode || *quality != dictionary->quality ||
+      *lgwin != dictionary->lgwin || *lgblock != dictionary->lgblock) {
+    PyErr_SetString(BrotliError, "Parameters do not match the dictionary");
+    return 0;
+  }
+
+  return 1;
+}
+
 PyDoc_STRVAR(brotli_Compressor_doc,
 "An object to compress a byte string.\n"
 "\n"
 "Signature:\n"
-"  Compressor(mode=MODE_GENERIC, quality=11, lgwin=22, lgblock=0, dictionary='')\n"
+"  Compressor(mode=MODE_GENERIC, quality=11, lgwin=22, lgblock=0, dictionary='',\n"
+"             stats=False)\n"
 "\n"
 "Args:\n"
 "  mode (int, optional): The compression mode can be MODE_GENERIC (default),\n"
@@ -138,8 +457,11 @@ PyDoc_STRVAR(brotli_Compressor_doc,
 "  lgblock (int, optional): Base 2 logarithm of the maximum input block size.\n"
 "    Range is 16 to 24. If set to 0, the value will be set based on the\n"
 "    quality. Defaults to 0.\n"
-"  dictionary (bytes, optional): Custom dictionary. Only last sliding window\n"
-"     size bytes will be used.\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary. Only last\n"
+"     sliding window size bytes will be used. Unspecified parameters are\n"
+"     taken from a prepared Dictionary, specified ones must match it.\n"
+"  stats (bool, optional): Collect the statistics returned by \"stats()\".\n"
+"    Defaults to False.\n"
 "\n"
 "Raises:\n"
 "  brotli.error: If arguments are invalid.\n");
@@ -147,10 +469,16 @@ PyDoc_STRVAR(brotli_Compressor_doc,
 typedef struct {
   PyObject_HEAD
   BrotliEncoderState* enc;
+  uint8_t* custom_dictionary;
+  size_t custom_dictionary_length;
+  PyObject* prepared_dictionary;
+  int collect_stats;
 } brotli_Compressor;
 
 static void brotli_Compressor_dealloc(brotli_Compressor* self) {
   BrotliEncoderDestroyInstance(self->enc);
+  PyMem_Free(self->custom_dictionary);
+  Py_XDECREF(self->prepared_dictionary);
   #if PY_MAJOR_VERSION >= 3
   Py_TYPE(self)->tp_free((PyObject*)self);
   #else
@@ -164,6 +492,10 @@ static PyObject* brotli_Compressor_new(PyTypeObject *type, PyObject *args, PyObj
 
   if (self != NULL) {
     self->enc = BrotliEncoderCreateInstance(0, 0, 0);
+    self->custom_dictionary = NULL;
+    self->custom_dictionary_length = 0;
+    self->prepared_dictionary = NULL;
+    self->collect_stats = 0;
   }
 
   return (PyObject *)self;
@@ -174,24 +506,61 @@ static int brotli_Compressor_init(brotli_Compressor *self, PyObject *args, PyObj
   int quality = -1;
   int lgwin = -1;
   int lgblock = -1;
-  uint8_t* custom_dictionary = NULL;
-  size_t custom_dictionary_length = 0;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  PyObject* stats = NULL;
   int ok;
 
   static const char *kwlist[] = {
-      "mode", "quality", "lgwin", "lgblock", "dictionary", NULL};
+      "mode", "quality", "lgwin", "lgblock", "dictionary", "stats", NULL};
 
-  ok = PyArg_ParseTupleAndKeywords(args, keywds, "|O&O&O&O&s#:Compressor",
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "|O&O&O&O&O&O:Compressor",
                     const_cast<char **>(kwlist),
                     &mode_convertor, &mode,
                     &quality_convertor, &quality,
                     &lgwin_convertor, &lgwin,
                     &lgblock_convertor, &lgblock,
-                    &custom_dictionary, &custom_dictionary_length);
+                    &dictionary_convertor, &dictionary,
+                    &stats);
   if (!ok)
     return -1;
   if (!self->enc)
     return -1;
+  if (stats) {
+    self->collect_stats = PyObject_IsTrue(stats);
+    if (self->collect_stats < 0)
+      return -1;
+  }
+
+  if (dictionary.prepared) {
+    BrotliEncoderState* enc;
+    if (!match_dictionary_params(dictionary.prepared, &mode, &quality,
+                                 &lgwin, &lgblock))
+      return -1;
+    /* Start from a copy of the primed encoder instead of hashing the
+       dictionary again. */
+    Py_BEGIN_ALLOW_THREADS
+    enc = BrotliEncoderCopyInstance(dictionary.prepared->enc);
+    Py_END_ALLOW_THREADS
+    if (!enc) {
+      PyErr_NoMemory();
+      return -1;
+    }
+    BrotliEncoderDestroyInstance(self->enc);
+    self->enc = enc;
+    BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_STATS,
+                              (uint32_t)self->collect_stats);
+    /* "__init__" may be called again; drop the previous dictionary. */
+    PyMem_Free(self->custom_dictionary);
+    self->custom_dictionary = NULL;
+    self->custom_dictionary_length = 0;
+    Py_INCREF(dictionary.prepared);
+    Py_XDECREF(self->prepared_dictionary);
+    self->prepared_dictionary = (PyObject*) dictionary.prepared;
+    return 0;
+  }
+
+  const uint8_t* custom_dictionary = dictionary.data;
+  size_t custom_dictionary_length = dictionary.length;
 
   if ((int) mode != -1)
     BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_MODE, (uint32_t)mode);
@@ -201,8 +570,26 @@ static int brotli_Compressor_init(brotli_Compressor *self, PyObject *args, PyObj
     BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_LGWIN, (uint32_t)lgwin);
   if (lgblock != -1)
     BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_LGBLOCK, (uint32_t)lgblock);
+  BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_STATS,
+                            (uint32_t)self->collect_stats);
+
+  /* "__init__" may be called again; drop the previous dictionary, so that
+     "reset()" does not bring it back. */
+  PyMem_Free(self->custom_dictionary);
+  self->custom_dictionary = NULL;
+  self->custom_dictionary_length = 0;
+  Py_CLEAR(self->prepared_dictionary);
 
   if (custom_dictionary_length != 0) {
+    /* Keep a copy to prime the encoder again after "reset()". */
+    self->custom_dictionary = (uint8_t*) PyMem_Malloc(custom_dictionary_length);
+    if (!self->custom_dictionary) {
+      PyErr_NoMemory();
+      return -1;
+    }
+    memcpy(self->custom_dictionary, custom_dictionary, custom_dictionary_length);
+    self->custom_dictionary_length = custom_dictionary_length;
+
     /* Unlike decoder, encoder processes dictionary immediately, that is why
        it makes sense to release python GIL. */
     Py_BEGIN_ALLOW_THREADS
@@ -226,7 +613,7 @@ PyDoc_STRVAR(brotli_Compressor_process_doc,
 "  compress(string)\n"
 "\n"
 "Args:\n"
-"  string (bytes): The input data\n"
+"  string (bytes-like): The input data\n"
 "\n"
 "Returns:\n"
 "  The compressed output data (bytes)\n"
@@ -237,11 +624,10 @@ PyDoc_STRVAR(brotli_Compressor_process_doc,
 static PyObject* brotli_Compressor_process(brotli_Compressor *self, PyObject *args) {
   PyObject* ret = NULL;
   std::vector<uint8_t> output;
-  uint8_t* input;
-  size_t input_length;
+  Py_buffer input;
   BROTLI_BOOL ok = BROTLI_TRUE;
 
-  ok = (BROTLI_BOOL)PyArg_ParseTuple(args, "s#:process", &input, &input_length);
+  ok = (BROTLI_BOOL)PyArg_ParseTuple(args, "s*:process", &input);
   if (!ok)
     return NULL;
 
@@ -251,9 +637,10 @@ static PyObject* brotli_Compressor_process(brotli_Compressor *self, PyObject *ar
   }
 
   ok = compress_stream(self->enc, BROTLI_OPERATION_PROCESS,
-                       &output, input, input_length);
+                       &output, (uint8_t*) input.buf, (size_t) input.len);
 
 end:
+  PyBuffer_Release(&input);
   if (ok) {
     ret = PyBytes_FromStringAndSize((char*)(output.size() ? &output[0] : NULL), output.size());
   } else {
@@ -263,6 +650,75 @@ end:
   return ret;
 }
 
+PyDoc_STRVAR(brotli_Compressor_process_into_doc,
+"Process \"string\" for compression, writing the compressed output data \n"
+"directly into the writable buffer \"output\" (e.g. a bytearray, memoryview \n"
+"or mmap).  This data should be concatenated to the output produced by any \n"
+"preceding calls to the \"process()\", \"process_into()\" or \"flush()\" \n"
+"methods.\n"
+"Processing stops when \"output\" is full. The input that was not consumed \n"
+"should then be passed to another call, with a new buffer; output that is \n"
+"still pending after all the input was consumed is emitted by the next \n"
+"call of any of these methods (e.g. \"process_into(b'', output)\").\n"
+"\n"
+"Signature:\n"
+"  process_into(string, output)\n"
+"\n"
+"Args:\n"
+"  string (bytes-like): The input data\n"
+"  output (buffer): Writable buffer receiving the compressed output data\n"
+"\n"
+"Returns:\n"
+"  A tuple (consumed, written) of the number of bytes consumed from \n"
+"  \"string\" and written to \"output\" (int, int)\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If compression fails\n");
+
+static PyObject* brotli_Compressor_process_into(brotli_Compressor *self, PyObject *args) {
+  PyObject* ret = NULL;
+  Py_buffer input;
+  Py_buffer output;
+  const uint8_t* next_in;
+  size_t input_length = 0;
+  size_t output_length = 0;
+  BROTLI_BOOL output_exhausted = BROTLI_FALSE;
+  BROTLI_BOOL ok = BROTLI_TRUE;
+
+  ok = (BROTLI_BOOL)PyArg_ParseTuple(args, "s*w*:process_into", &input, &output);
+  if (!ok)
+    return NULL;
+
+  if (!self->enc) {
+    ok = BROTLI_FALSE;
+    goto end;
+  }
+
+  next_in = (const uint8_t*) input.buf;
+  input_length = (size_t) input.len;
+  output_length = (size_t) output.len;
+  ok = compress_stream_into(self->enc, BROTLI_OPERATION_PROCESS,
+                            (uint8_t*) output.buf, &output_length,
+                            &next_in, &input_length,
+                            &output_exhausted);
+  /* From here on, the number of bytes consumed. */
+  input_length = (size_t) input.len - input_length;
+
+end:
+  PyBuffer_Release(&input);
+  PyBuffer_Release(&output);
+  if (ok || output_exhausted) {
+    /* A full buffer is not an error: the caller continues with the rest of
+       the input. */
+    ret = Py_BuildValue("(nn)", (Py_ssize_t) input_length,
+                        (Py_ssize_t) output_length);
+  } else {
+    PyErr_SetString(BrotliError, "BrotliEncoderCompressStream failed while processing the stream");
+  }
+
+  return ret;
+}
+
 PyDoc_STRVAR(brotli_Compressor_flush_doc,
 "Process all pending input, returning a string containing the remaining\n"
 "compressed data. This data should be concatenated to the output produced by\n"
@@ -306,7 +762,7 @@ PyDoc_STRVAR(brotli_Compressor_finish_doc,
 "to the output produced by any preceding calls to the \"process()\" or\n"
 "\"flush()\" methods.\n"
 "After calling \"finish()\", the \"process()\" and \"flush()\" methods\n"
-"cannot be called again, and a new \"Compressor\" object should be created.\n"
+"cannot be called again, until the \"Compressor\" object is \"reset()\".\n"
 "\n"
 "Signature:\n"
 "  finish(string)\n"
@@ -344,55 +800,216 @@ end:
   return ret;
 }
 
-static PyMemberDef brotli_Compressor_members[] = {
-  {NULL}  /* Sentinel */
-};
+PyDoc_STRVAR(brotli_Compressor_reset_doc,
+"Discard the current stream and prepare the compressor for a new one, with\n"
+"the same parameters and custom dictionary. Memory already allocated by the\n"
+"encoder (ring buffer, hash tables) is reused, which makes compressing many\n"
+"small streams with a single \"Compressor\" cheaper than creating a new one\n"
+"for each of them.\n"
+"\n"
+"Signature:\n"
+"  reset()\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If the compressor can not be reset\n");
 
-static PyMethodDef brotli_Compressor_methods[] = {
-  {"process", (PyCFunction)brotli_Compressor_process, METH_VARARGS, brotli_Compressor_process_doc},
-  {"flush", (PyCFunction)brotli_Compressor_flush, METH_NOARGS, brotli_Compressor_flush_doc},
-  {"finish", (PyCFunction)brotli_Compressor_finish, METH_NOARGS, brotli_Compressor_finish_doc},
-  {NULL}  /* Sentinel */
-};
+static PyObject* brotli_Compressor_reset(brotli_Compressor *self) {
+  if (!self->enc) {
+    PyErr_SetString(BrotliError, "BrotliEncoderReset failed");
+    return NULL;
+  }
 
-static PyTypeObject brotli_CompressorType = {
-  #if PY_MAJOR_VERSION >= 3
-  PyVarObject_HEAD_INIT(NULL, 0)
-  #else
-  PyObject_HEAD_INIT(NULL)
-  0,                                     /* ob_size*/
-  #endif
-  "brotli.Compressor",                   /* tp_name */
-  sizeof(brotli_Compressor),             /* tp_basicsize */
-  0,                                     /* tp_itemsize */
-  (destructor)brotli_Compressor_dealloc, /* tp_dealloc */
-  0,                                     /* tp_print */
-  0,                                     /* tp_getattr */
-  0,                                     /* tp_setattr */
-  0,                                     /* tp_compare */
-  0,                                     /* tp_repr */
-  0,                                     /* tp_as_number */
-  0,                                     /* tp_as_sequence */
-  0,                                     /* tp_as_mapping */
-  0,                                     /* tp_hash  */
-  0,                                     /* tp_call */
-  0,                                     /* tp_str */
-  0,                                     /* tp_getattro */
-  0,                                     /* tp_setattro */
-  0,                                     /* tp_as_buffer */
-  Py_TPFLAGS_DEFAULT,                    /* tp_flags */
-  brotli_Compressor_doc,                 /* tp_doc */
-  0,                                     /* tp_traverse */
-  0,                                     /* tp_clear */
-  0,                                     /* tp_richcompare */
-  0,                                     /* tp_weaklistoffset */
-  0,                                     /* tp_iter */
-  0,                                     /* tp_iternext */
-  brotli_Compressor_methods,             /* tp_methods */
-  brotli_Compressor_members,             /* tp_members */
-  0,                                     /* tp_getset */
-  0,                                     /* tp_base */
-  0,                                     /* tp_dict */
+  if (self->prepared_dictionary) {
+    BrotliEncoderState* enc;
+    Py_BEGIN_ALLOW_THREADS
+    enc = BrotliEncoderCopyInstance(
+        ((brotli_Dictionary*) self->prepared_dictionary)->enc);
+    Py_END_ALLOW_THREADS
+    if (!enc)
+      return PyErr_NoMemory();
+    BrotliEncoderDestroyInstance(self->enc);
+    self->enc = enc;
+    BrotliEncoderSetParameter(self->enc, BROTLI_PARAM_STATS,
+                              (uint32_t)self->collect_stats);
+    Py_RETURN_NONE;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  BrotliEncoderReset(self->enc);
+  if (self->custom_dictionary_length != 0) {
+    BrotliEncoderSetCustomDictionary(self->enc, self->custom_dictionary_length,
+                                     self->custom_dictionary);
+  }
+  Py_END_ALLOW_THREADS
+
+  Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(brotli_Compressor_copy_doc,
+"Return a copy of the compressor. The copy continues the same stream\n"
+"independently of the original: both can be fed different data from this\n"
+"point on. This is useful to compress several inputs that share a common\n"
+"prefix without compressing the prefix more than once.\n"
+"\n"
+"Signature:\n"
+"  copy()\n"
+"\n"
+"Returns:\n"
+"  A new \"Compressor\" object.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If the compressor can not be copied\n");
+
+static PyObject* brotli_Compressor_copy(brotli_Compressor *self) {
+  brotli_Compressor *copy;
+
+  if (!self->enc) {
+    PyErr_SetString(BrotliError, "BrotliEncoderCopyInstance failed");
+    return NULL;
+  }
+
+  copy = (brotli_Compressor *)Py_TYPE(self)->tp_alloc(Py_TYPE(self), 0);
+  if (copy == NULL)
+    return NULL;
+  copy->enc = NULL;
+  copy->custom_dictionary = NULL;
+  copy->custom_dictionary_length = 0;
+  copy->prepared_dictionary = NULL;
+  copy->collect_stats = self->collect_stats;
+
+  if (self->custom_dictionary_length != 0) {
+    copy->custom_dictionary =
+        (uint8_t*) PyMem_Malloc(self->custom_dictionary_length);
+    if (!copy->custom_dictionary) {
+      Py_DECREF(copy);
+      return PyErr_NoMemory();
+    }
+    memcpy(copy->custom_dictionary, self->custom_dictionary,
+           self->custom_dictionary_length);
+    copy->custom_dictionary_length = self->custom_dictionary_length;
+  }
+  Py_XINCREF(self->prepared_dictionary);
+  copy->prepared_dictionary = self->prepared_dictionary;
+
+  Py_BEGIN_ALLOW_THREADS
+  copy->enc = BrotliEncoderCopyInstance(self->enc);
+  Py_END_ALLOW_THREADS
+
+  if (!copy->enc) {
+    Py_DECREF(copy);
+    PyErr_SetString(BrotliError, "BrotliEncoderCopyInstance failed");
+    return NULL;
+  }
+
+  return (PyObject *)copy;
+}
+
+PyDoc_STRVAR(brotli_Compressor_stats_doc,
+"Return the statistics of the encoder since the compressor was created or\n"
+"reset. Times are in seconds.\n"
+"\n"
+"Signature:\n"
+"  stats()\n"
+"\n"
+"Returns:\n"
+"  A dict with the following keys:\n"
+"    bytes_in, bytes_out: Input consumed and compressed output produced.\n"
+"    metablocks: Meta-blocks emitted; input fragments for quality 0 and 1.\n"
+"    uncompressed_metablocks: Meta-blocks stored uncompressed.\n"
+"    commands, literals: Commands and literals emitted.\n"
+"    backward_references_time: Finding backward references.\n"
+"    block_splitting_time, block_types, blocks: Splitting meta-blocks into\n"
+"      literal, command and distance blocks.\n"
+"    clustering_time, histograms, clusters: Clustering histograms.\n"
+"    entropy_coding_time: Building entropy codes, writing meta-blocks.\n"
+"    fragment_time: All the work of quality 0 and 1, which compress input\n"
+"      fragments in a single stage.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If the compressor was not created with \"stats=True\"\n");
+
+static PyObject* brotli_Compressor_stats(brotli_Compressor *self) {
+  BrotliEncoderStats stats;
+
+  if (!self->enc || !self->collect_stats) {
+    PyErr_SetString(BrotliError, "Statistics are not collected");
+    return NULL;
+  }
+
+  BrotliEncoderGetStats(self->enc, &stats);
+  return Py_BuildValue(
+      "{s:K,s:K,s:K,s:K,s:K,s:K,s:d,s:d,s:K,s:K,s:d,s:K,s:K,s:d,s:d}",
+      "bytes_in", (unsigned long long)stats.bytes_in,
+      "bytes_out", (unsigned long long)stats.bytes_out,
+      "metablocks", (unsigned long long)stats.metablocks,
+      "uncompressed_metablocks",
+      (unsigned long long)stats.uncompressed_metablocks,
+      "commands", (unsigned long long)stats.commands,
+      "literals", (unsigned long long)stats.literals,
+      "backward_references_time", stats.backward_references_ns / 1e9,
+      "block_splitting_time", stats.block_splitting_ns / 1e9,
+      "block_types", (unsigned long long)stats.block_types,
+      "blocks", (unsigned long long)stats.blocks,
+      "clustering_time", stats.clustering_ns / 1e9,
+      "histograms", (unsigned long long)stats.histograms,
+      "clusters", (unsigned long long)stats.clusters,
+      "entropy_coding_time", stats.entropy_coding_ns / 1e9,
+      "fragment_time", stats.fragment_ns / 1e9);
+}
+
+static PyMemberDef brotli_Compressor_members[] = {
+  {NULL}  /* Sentinel */
+};
+
+static PyMethodDef brotli_Compressor_methods[] = {
+  {"process", (PyCFunction)brotli_Compressor_process, METH_VARARGS, brotli_Compressor_process_doc},
+  {"process_into", (PyCFunction)brotli_Compressor_process_into, METH_VARARGS, brotli_Compressor_process_into_doc},
+  {"flush", (PyCFunction)brotli_Compressor_flush, METH_NOARGS, brotli_Compressor_flush_doc},
+  {"finish", (PyCFunction)brotli_Compressor_finish, METH_NOARGS, brotli_Compressor_finish_doc},
+  {"reset", (PyCFunction)brotli_Compressor_reset, METH_NOARGS, brotli_Compressor_reset_doc},
+  {"copy", (PyCFunction)brotli_Compressor_copy, METH_NOARGS, brotli_Compressor_copy_doc},
+  {"stats", (PyCFunction)brotli_Compressor_stats, METH_NOARGS, brotli_Compressor_stats_doc},
+  {NULL}  /* Sentinel */
+};
+
+static PyTypeObject brotli_CompressorType = {
+  #if PY_MAJOR_VERSION >= 3
+  PyVarObject_HEAD_INIT(NULL, 0)
+  #else
+  PyObject_HEAD_INIT(NULL)
+  0,                                     /* ob_size*/
+  #endif
+  "brotli.Compressor",                   /* tp_name */
+  sizeof(brotli_Compressor),             /* tp_basicsize */
+  0,                                     /* tp_itemsize */
+  (destructor)brotli_Compressor_dealloc, /* tp_dealloc */
+  0,                                     /* tp_print */
+  0,                                     /* tp_getattr */
+  0,                                     /* tp_setattr */
+  0,                                     /* tp_compare */
+  0,                                     /* tp_repr */
+  0,                                     /* tp_as_number */
+  0,                                     /* tp_as_sequence */
+  0,                                     /* tp_as_mapping */
+  0,                                     /* tp_hash  */
+  0,                                     /* tp_call */
+  0,                                     /* tp_str */
+  0,                                     /* tp_getattro */
+  0,                                     /* tp_setattro */
+  0,                                     /* tp_as_buffer */
+  Py_TPFLAGS_DEFAULT,                    /* tp_flags */
+  brotli_Compressor_doc,                 /* tp_doc */
+  0,                                     /* tp_traverse */
+  0,                                     /* tp_clear */
+  0,                                     /* tp_richcompare */
+  0,                                     /* tp_weaklistoffset */
+  0,                                     /* tp_iter */
+  0,                                     /* tp_iternext */
+  brotli_Compressor_methods,             /* tp_methods */
+  brotli_Compressor_members,             /* tp_members */
+  0,                                     /* tp_getset */
+  0,                                     /* tp_base */
+  0,                                     /* tp_dict */
   0,                                     /* tp_descr_get */
   0,                                     /* tp_descr_set */
   0,                                     /* tp_dictoffset */
@@ -401,77 +1018,2133 @@ static PyTypeObject brotli_CompressorType = {
   brotli_Compressor_new,                 /* tp_new */
 };
 
-PyDoc_STRVAR(brotli_decompress__doc__,
-"Decompress a compressed byte string.\n"
+PyDoc_STRVAR(brotli_Decompressor_doc,
+"An object to decompress a byte string.\n"
+"\n"
+"Signature:\n"
+"  Decompressor(dictionary='', max_output_size=0)\n"
+"\n"
+"Args:\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary. MUST be\n"
+"     the same data as passed to the compressor.\n"
+"  max_output_size (int, optional): Maximum total size of the decompressed\n"
+"     stream. \"process()\" raises brotli.OutputTooLargeError as soon as\n"
+"     it is exceeded, and so does every later call. Zero means unbounded.\n"
+"     Defaults to 0.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If arguments are invalid.\n");
+
+typedef struct {
+  PyObject_HEAD
+  BrotliDecoderState* dec;
+  PyObject* unconsumed_tail;
+  PyObject* custom_dictionary;
+  PyObject* prepared_dictionary;
+  size_t max_output_size;
+  size_t total_out;
+} brotli_Decompressor;
+
+static void brotli_Decompressor_dealloc(brotli_Decompressor* self) {
+  BrotliDecoderDestroyInstance(self->dec);
+  Py_XDECREF(self->unconsumed_tail);
+  Py_XDECREF(self->custom_dictionary);
+  Py_XDECREF(self->prepared_dictionary);
+  #if PY_MAJOR_VERSION >= 3
+  Py_TYPE(self)->tp_free((PyObject*)self);
+  #else
+  self->ob_type->tp_free((PyObject*)self);
+  #endif
+}
+
+static PyObject* brotli_Decompressor_new(PyTypeObject *type, PyObject *args, PyObject *keywds) {
+  brotli_Decompressor *self;
+  self = (brotli_Decompressor *)type->tp_alloc(type, 0);
+
+  if (self != NULL) {
+    self->dec = BrotliDecoderCreateInstance(0, 0, 0);
+    self->unconsumed_tail = PyBytes_FromStringAndSize(NULL, 0);
+    self->custom_dictionary = NULL;
+    self->prepared_dictionary = NULL;
+    self->max_output_size = 0;
+    self->total_out = 0;
+    if (self->unconsumed_tail == NULL) {
+      Py_DECREF(self);
+      return NULL;
+    }
+  }
+
+  return (PyObject *)self;
+}
+
+static int brotli_Decompressor_init(brotli_Decompressor *self, PyObject *args, PyObject *keywds) {
+  dictionary_param dictionary = {NULL, NULL, 0};
+  Py_ssize_t max_output_size = 0;
+  int ok;
+
+  static const char *kwlist[] = {"dictionary", "max_output_size", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "|O&n:Decompressor",
+                    const_cast<char **>(kwlist),
+                    &dictionary_convertor, &dictionary, &max_output_size);
+  if (!ok)
+    return -1;
+  if (!self->dec)
+    return -1;
+  if (max_output_size < 0) {
+    PyErr_SetString(BrotliError, "Invalid max_output_size. Must be non-negative.");
+    return -1;
+  }
+  self->max_output_size = (size_t) max_output_size;
+
+  const uint8_t* custom_dictionary = dictionary.data;
+  size_t custom_dictionary_length = dictionary.length;
+
+  if (dictionary.prepared) {
+    /* The prepared dictionary owns its data; just keep it alive. */
+    Py_INCREF(dictionary.prepared);
+    Py_XDECREF(self->prepared_dictionary);
+    self->prepared_dictionary = (PyObject*) dictionary.prepared;
+    BrotliDecoderSetCustomDictionary(self->dec, custom_dictionary_length,
+                                     custom_dictionary);
+  } else if (custom_dictionary_length != 0) {
+    /* Decoder keeps a pointer to the dictionary; it has to outlive the
+       caller's object, so keep a private copy. Copies of this decompressor
+       share it. */
+    self->custom_dictionary = PyBytes_FromStringAndSize(
+        (const char*) custom_dictionary, custom_dictionary_length);
+    if (!self->custom_dictionary)
+      return -1;
+    BrotliDecoderSetCustomDictionary(self->dec, custom_dictionary_length,
+        (const uint8_t*) PyBytes_AS_STRING(self->custom_dictionary));
+  }
+
+  return 0;
+}
+
+PyDoc_STRVAR(brotli_Decompressor_process_doc,
+"Process \"string\" for decompression, returning a string that contains \n"
+"decompressed output data.  This data should be concatenated to the output \n"
+"produced by any preceding calls to the \"process()\" method. \n"
+"If \"max_length\" is non-zero, at most \"max_length\" bytes are returned; \n"
+"input left unprocessed because of that limit is stored in the \n"
+"\"unconsumed_tail\" attribute and must be passed to a subsequent \n"
+"\"process()\" call. Output already decoded but not returned is kept in \n"
+"internal buffers until then.\n"
+"\n"
+"Signature:\n"
+"  process(string, max_length=0)\n"
+"\n"
+"Args:\n"
+"  string (bytes-like): The input data\n"
+"  max_length (int, optional): Maximum size of the returned data. Zero\n"
+"    means unbounded. Defaults to 0.\n"
+"\n"
+"Returns:\n"
+"  The decompressed output data (bytes)\n"
+"\n"
+"Raises:\n"
+"  brotli.OutputTooLargeError: If the stream exceeds \"max_output_size\"\n"
+"  brotli.error: If decompression fails\n");
+
+static PyObject* brotli_Decompressor_process(brotli_Decompressor *self, PyObject *args, PyObject *keywds) {
+  PyObject* ret = NULL;
+  PyObject* tail;
+  std::vector<uint8_t> output;
+  Py_buffer buffer;
+  const uint8_t* input;
+  size_t input_length;
+  Py_ssize_t max_length = 0;
+  size_t limit;
+  BrotliDecoderResult result;
+  int ok;
+
+  static const char *kwlist[] = {"string", "max_length", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "s*|n:process",
+                        const_cast<char **>(kwlist),
+                        &buffer, &max_length);
+  if (!ok)
+    return NULL;
+
+  if (max_length < 0) {
+    PyBuffer_Release(&buffer);
+    PyErr_SetString(BrotliError, "Invalid max_length. Must be non-negative.");
+    return NULL;
+  }
+
+  if (!self->dec) {
+    ok = 0;
+    goto end;
+  }
+
+  limit = (size_t) max_length;
+  if (self->max_output_size) {
+    if (self->total_out > self->max_output_size) {
+      PyBuffer_Release(&buffer);
+      PyErr_SetString(BrotliOutputTooLargeError,
+                      "Decompressed data exceeds max_output_size");
+      return NULL;
+    }
+    // Decode one byte past the limit to detect that it is exceeded.
+    size_t remaining = self->max_output_size - self->total_out + 1;
+    if (!limit || limit > remaining)
+      limit = remaining;
+  }
+
+  input = (const uint8_t*) buffer.buf;
+  input_length = (size_t) buffer.len;
+  result = decompress_stream(self->dec, &output, limit,
+                             &input, &input_length);
+  self->total_out += output.size();
+  if (self->max_output_size && self->total_out > self->max_output_size) {
+    PyBuffer_Release(&buffer);
+    PyErr_SetString(BrotliOutputTooLargeError,
+                    "Decompressed data exceeds max_output_size");
+    return NULL;
+  }
+  ok = result != BROTLI_DECODER_RESULT_ERROR &&
+       !(result == BROTLI_DECODER_RESULT_SUCCESS && input_length != 0);
+
+  if (ok) {
+    tail = PyBytes_FromStringAndSize((const char*) input, input_length);
+    if (tail == NULL) {
+      PyBuffer_Release(&buffer);
+      return NULL;
+    }
+    Py_DECREF(self->unconsumed_tail);
+    self->unconsumed_tail = tail;
+  }
+
+end:
+  PyBuffer_Release(&buffer);
+  if (ok) {
+    ret = PyBytes_FromStringAndSize((char*)(output.size() ? &output[0] : NULL), output.size());
+  } else {
+    PyErr_SetString(BrotliError, "BrotliDecoderDecompressStream failed while processing the stream");
+  }
+
+  return ret;
+}
+
+PyDoc_STRVAR(brotli_Decompressor_is_finished_doc,
+"Checks if decoder instance reached the final state.\n"
+"\n"
+"Signature:\n"
+"  is_finished()\n"
+"\n"
+"Returns:\n"
+"  True  if the decoder is in a state where it reached the end of the input\n"
+"        and produced all of the output\n"
+"  False otherwise\n");
+
+static PyObject* brotli_Decompressor_is_finished(brotli_Decompressor *self) {
+  if (self->dec && BrotliDecoderIsFinished(self->dec)) {
+    Py_RETURN_TRUE;
+  }
+  Py_RETURN_FALSE;
+}
+
+PyDoc_STRVAR(brotli_Decompressor_copy_doc,
+"Return a copy of the decompressor. The copy continues the same stream\n"
+"independently of the original, including \"unconsumed_tail\".\n"
+"\n"
+"Signature:\n"
+"  copy()\n"
+"\n"
+"Returns:\n"
+"  A new \"Decompressor\" object.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If the decompressor can not be copied\n");
+
+static PyObject* brotli_Decompressor_copy(brotli_Decompressor *self) {
+  brotli_Decompressor *copy;
+
+  if (!self->dec) {
+    PyErr_SetString(BrotliError, "BrotliDecoderCopyInstance failed");
+    return NULL;
+  }
+
+  copy = (brotli_Decompressor *)Py_TYPE(self)->tp_alloc(Py_TYPE(self), 0);
+  if (copy == NULL)
+    return NULL;
+
+  Py_INCREF(self->unconsumed_tail);
+  copy->unconsumed_tail = self->unconsumed_tail;
+  /* Decoder state refers to the dictionary data, so share it. */
+  Py_XINCREF(self->custom_dictionary);
+  copy->custom_dictionary = self->custom_dictionary;
+  Py_XINCREF(self->prepared_dictionary);
+  copy->prepared_dictionary = self->prepared_dictionary;
+  copy->max_output_size = self->max_output_size;
+  copy->total_out = self->total_out;
+
+  Py_BEGIN_ALLOW_THREADS
+  copy->dec = BrotliDecoderCopyInstance(self->dec);
+  Py_END_ALLOW_THREADS
+
+  if (!copy->dec) {
+    Py_DECREF(copy);
+    PyErr_SetString(BrotliError, "BrotliDecoderCopyInstance failed");
+    return NULL;
+  }
+
+  return (PyObject *)copy;
+}
+
+PyDoc_STRVAR(brotli_Decompressor_stats_doc,
+"Return the statistics of the stream decoded so far.\n"
+"\n"
+"Signature:\n"
+"  stats()\n"
+"\n"
+"Returns:\n"
+"  A dict with the following keys:\n"
+"    metablocks: Non-empty meta-blocks, metadata excluded.\n"
+"    uncompressed_metablocks, uncompressed_bytes: Meta-blocks stored\n"
+"      uncompressed and their size.\n"
+"    metadata_blocks: Metadata blocks.\n"
+"    commands: Insert-and-copy commands.\n"
+"    literal_bytes: Output produced by literals.\n"
+"    copy_bytes: Output produced by backward references.\n"
+"    dictionary_references, dictionary_bytes: Static dictionary references\n"
+"      and the output they produced.\n"
+"    huffman_tables, huffman_table_entries: Huffman decoding tables built\n"
+"      and their total size.\n"
+"    ringbuffer_allocations: Ring buffer allocations, the first one\n"
+"      included.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If the decompressor is unusable\n");
+
+static PyObject* brotli_Decompressor_stats(brotli_Decompressor *self) {
+  BrotliDecoderStats stats;
+
+  if (!self->dec) {
+    PyErr_SetString(BrotliError, "BrotliDecoderGetStats failed");
+    return NULL;
+  }
+
+  BrotliDecoderGetStats(self->dec, &stats);
+  return Py_BuildValue(
+      "{s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K}",
+      "metablocks", (unsigned long long)stats.metablocks,
+      "uncompressed_metablocks",
+      (unsigned long long)stats.uncompressed_metablocks,
+      "metadata_blocks", (unsigned long long)stats.metadata_blocks,
+      "commands", (unsigned long long)stats.commands,
+      "literal_bytes", (unsigned long long)stats.literal_bytes,
+      "copy_bytes", (unsigned long long)stats.copy_bytes,
+      "dictionary_references",
+      (unsigned long long)stats.dictionary_references,
+      "dictionary_bytes", (unsigned long long)stats.dictionary_bytes,
+      "uncompressed_bytes", (unsigned long long)stats.uncompressed_bytes,
+      "huffman_tables", (unsigned long long)stats.huffman_tables,
+      "huffman_table_entries",
+      (unsigned long long)stats.huffman_table_entries,
+      "ringbuffer_allocations",
+      (unsigned long long)stats.ringbuffer_allocations);
+}
+
+static PyMemberDef brotli_Decompressor_members[] = {
+  {(char*) "unconsumed_tail", T_OBJECT_EX, offsetof(brotli_Decompressor, unconsumed_tail), READONLY,
+   (char*) "Input not consumed by the last \"process()\" call because of \"max_length\"."},
+  {NULL}  /* Sentinel */
+};
+
+static PyMethodDef brotli_Decompressor_methods[] = {
+  {"process", (PyCFunction)brotli_Decompressor_process, METH_VARARGS | METH_KEYWORDS, brotli_Decompressor_process_doc},
+  {"is_finished", (PyCFunction)brotli_Decompressor_is_finished, METH_NOARGS, brotli_Decompressor_is_finished_doc},
+  {"copy", (PyCFunction)brotli_Decompressor_copy, METH_NOARGS, brotli_Decompressor_copy_doc},
+  {"stats", (PyCFunction)brotli_Decompressor_stats, METH_NOARGS, brotli_Decompressor_stats_doc},
+  {NULL}  /* Sentinel */
+};
+
+static PyTypeObject brotli_DecompressorType = {
+  #if PY_MAJOR_VERSION >= 3
+  PyVarObject_HEAD_INIT(NULL, 0)
+  #else
+  PyObject_HEAD_INIT(NULL)
+  0,                                     /* ob_size*/
+  #endif
+  "brotli.Decompressor",                 /* tp_name */
+  sizeof(brotli_Decompressor),           /* tp_basicsize */
+  0,                                     /* tp_itemsize */
+  (destructor)brotli_Decompressor_dealloc, /* tp_dealloc */
+  0,                                     /* tp_print */
+  0,                                     /* tp_getattr */
+  0,                                     /* tp_setattr */
+  0,                                     /* tp_compare */
+  0,                                     /* tp_repr */
+  0,                                     /* tp_as_number */
+  0,                                     /* tp_as_sequence */
+  0,                                     /* tp_as_mapping */
+  0,                                     /* tp_hash  */
+  0,                                     /* tp_call */
+  0,                                     /* tp_str */
+  0,                                     /* tp_getattro */
+  0,                                     /* tp_setattro */
+  0,                                     /* tp_as_buffer */
+  Py_TPFLAGS_DEFAULT,                    /* tp_flags */
+  brotli_Decompressor_doc,               /* tp_doc */
+  0,                                     /* tp_traverse */
+  0,                                     /* tp_clear */
+  0,                                     /* tp_richcompare */
+  0,                                     /* tp_weaklistoffset */
+  0,                                     /* tp_iter */
+  0,                                     /* tp_iternext */
+  brotli_Decompressor_methods,           /* tp_methods */
+  brotli_Decompressor_members,           /* tp_members */
+  0,                                     /* tp_getset */
+  0,                                     /* tp_base */
+  0,                                     /* tp_dict */
+  0,                                     /* tp_descr_get */
+  0,                                     /* tp_descr_set */
+  0,                                     /* tp_dictoffset */
+  (initproc)brotli_Decompressor_init,    /* tp_init */
+  0,                                     /* tp_alloc */
+  brotli_Decompressor_new,               /* tp_new */
+};
+
+/* Warm encoder instances kept by "compress" for reuse by subsequent calls
+   with the same parameters. The pool is process-global, shared by all
+   threads, rather than per-thread: it is only touched with the GIL held,
+   which serializes access to it. An encoder is taken out of the pool before
+   the GIL is released to use it, so no two threads ever share one.
+
+   Pooled encoders are created with a counting allocator, so that the pool
+   stays within ENCODER_POOL_MAX_BYTES: an encoder that is larger than the
+   whole budget (e.g. quality 11 with a large window) is destroyed instead of
+   being kept, and older entries are evicted to make room for a new one. */
+#define ENCODER_POOL_SIZE 4
+#define ENCODER_POOL_MAX_BYTES ((size_t)32 << 20)
+
+/* Allocations are prefixed with their size; the header keeps the payload
+   aligned as malloc would. */
+#define COUNTED_HEADER_SIZE 16
+
+static void* counted_alloc(void* opaque, size_t size) {
+  uint8_t* block = (uint8_t*) malloc(size + COUNTED_HEADER_SIZE);
+  if (!block)
+    return NULL;
+  *(size_t*) block = size;
+  *(size_t*) opaque += size;
+  return block + COUNTED_HEADER_SIZE;
+}
+
+static void counted_free(void* opaque, void* address) {
+  if (!address)
+    return;
+  uint8_t* block = (uint8_t*) address - COUNTED_HEADER_SIZE;
+  *(size_t*) opaque -= *(size_t*) block;
+  free(block);
+}
+
+typedef struct {
+  BrotliEncoderState* enc;
+  /* Bytes currently allocated by "enc"; its allocator opaque. */
+  size_t* allocated;
+  BrotliEncoderMode mode;
+  int quality;
+  int lgwin;
+  int lgblock;
+} pooled_encoder;
+
+static pooled_encoder encoder_pool[ENCODER_POOL_SIZE];
+/* Next slot to evict when the pool is full. */
+static size_t encoder_pool_next = 0;
+
+static void pooled_encoder_destroy(pooled_encoder* entry) {
+  if (entry->enc) {
+    BrotliEncoderDestroyInstance(entry->enc);
+    entry->enc = NULL;
+  }
+  free(entry->allocated);
+  entry->allocated = NULL;
+}
+
+static void encoder_pool_clear() {
+  for (size_t i = 0; i < ENCODER_POOL_SIZE; ++i)
+    pooled_encoder_destroy(&encoder_pool[i]);
+  encoder_pool_next = 0;
+}
+
+/* Takes a warm encoder matching the parameters in "entry" out of the pool, or
+   creates a new one. Returns false on allocation failure. */
+static bool encoder_pool_acquire(pooled_encoder* entry) {
+  for (size_t i = 0; i < ENCODER_POOL_SIZE; ++i) {
+    pooled_encoder* slot = &encoder_pool[i];
+    if (slot->enc && slot->mode == entry->mode &&
+        slot->quality == entry->quality && slot->lgwin == entry->lgwin &&
+        slot->lgblock == entry->lgblock) {
+      *entry = *slot;
+      slot->enc = NULL;
+      slot->allocated = NULL;
+      return true;
+    }
+  }
+
+  entry->allocated = (size_t*) malloc(sizeof(size_t));
+  if (!entry->allocated)
+    return false;
+  *entry->allocated = 0;
+  entry->enc = BrotliEncoderCreateInstance(counted_alloc, counted_free,
+                                           entry->allocated);
+  if (!entry->enc) {
+    pooled_encoder_destroy(entry);
+    return false;
+  }
+  BrotliEncoderSetParameter(entry->enc, BROTLI_PARAM_MODE, (uint32_t)entry->mode);
+  BrotliEncoderSetParameter(entry->enc, BROTLI_PARAM_QUALITY, (uint32_t)entry->quality);
+  BrotliEncoderSetParameter(entry->enc, BROTLI_PARAM_LGWIN, (uint32_t)entry->lgwin);
+  BrotliEncoderSetParameter(entry->enc, BROTLI_PARAM_LGBLOCK, (uint32_t)entry->lgblock);
+  return true;
+}
+
+/* Returns an encoder to the pool, or destroys it if it does not fit. */
+static void encoder_pool_release(pooled_encoder* entry) {
+  if (*entry->allocated > ENCODER_POOL_MAX_BYTES) {
+    pooled_encoder_destroy(entry);
+    return;
+  }
+  BrotliEncoderReset(entry->enc);
+
+  size_t pooled_bytes = *entry->allocated;
+  pooled_encoder* slot = NULL;
+  for (size_t i = 0; i < ENCODER_POOL_SIZE; ++i) {
+    if (encoder_pool[i].enc)
+      pooled_bytes += *encoder_pool[i].allocated;
+    else if (!slot)
+      slot = &encoder_pool[i];
+  }
+  /* Evict in round-robin order until there is a free slot and the budget is
+     met; this terminates since "entry" alone fits the budget. */
+  while (!slot || pooled_bytes > ENCODER_POOL_MAX_BYTES) {
+    pooled_encoder* victim = &encoder_pool[encoder_pool_next];
+    encoder_pool_next = (encoder_pool_next + 1) % ENCODER_POOL_SIZE;
+    if (!victim->enc)
+      continue;
+    pooled_bytes -= *victim->allocated;
+    pooled_encoder_destroy(victim);
+    slot = victim;
+  }
+  *slot = *entry;
+  entry->enc = NULL;
+  entry->allocated = NULL;
+}
+
+PyDoc_STRVAR(brotli_clear_encoder_pool__doc__,
+"Free the encoder instances kept by \"compress\" for reuse.\n"
+"\n"
+"\"compress\" keeps a few warm encoder instances, up to 32 MiB in total, so\n"
+"that subsequent calls with the same parameters do not pay for setting them\n"
+"up again. This releases that memory.\n"
+"\n"
+"The pool is shared by all threads of the process. It is safe to use from\n"
+"several threads only because it is accessed with the GIL held; an encoder\n"
+"is taken out of the pool before the GIL is released to compress with it.\n"
+"\n"
+"Signature:\n"
+"  clear_encoder_pool()\n");
+
+static PyObject* brotli_clear_encoder_pool(PyObject *self, PyObject *args) {
+  encoder_pool_clear();
+  Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(brotli_compress__doc__,
+"Compress a byte string.\n"
+"\n"
+"Encoder instances are kept in a process-global pool for reuse by later\n"
+"calls with the same parameters; see \"clear_encoder_pool\". The pool is\n"
+"only accessed with the GIL held, which makes it safe to share between\n"
+"threads.\n"
+"\n"
+"Signature:\n"
+"  compress(string, mode=MODE_GENERIC, quality=11, lgwin=22, lgblock=0,\n"
+"           dictionary='')\n"
+"\n"
+"Args:\n"
+"  string (bytes): The input data.\n"
+"  mode (int, optional): The compression mode can be MODE_GENERIC (default),\n"
+"    MODE_TEXT (for UTF-8 format text input) or MODE_FONT (for WOFF 2.0). \n"
+"  quality (int, optional): Controls the compression-speed vs compression-\n"
+"    density tradeoff. The higher the quality, the slower the compression.\n"
+"    Range is 0 to 11. Defaults to 11.\n"
+"  lgwin (int, optional): Base 2 logarithm of the sliding window size. Range\n"
+"    is 10 to 24. Defaults to 22.\n"
+"  lgblock (int, optional): Base 2 logarithm of the maximum input block size.\n"
+"    Range is 16 to 24. If set to 0, the value will be set based on the\n"
+"    quality. Defaults to 0.\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary. Only last\n"
+"     sliding window size bytes will be used. Unspecified parameters are\n"
+"     taken from a prepared Dictionary, specified ones must match it.\n"
+"\n"
+"Returns:\n"
+"  The compressed byte string.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If arguments are invalid, or compressor fails.\n");
+
+static PyObject* brotli_compress(PyObject *self, PyObject *args, PyObject *keywds) {
+  PyObject *ret = NULL;
+  uint8_t *input;
+  size_t length;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  BrotliEncoderMode mode = (BrotliEncoderMode) -1;
+  int quality = -1;
+  int lgwin = -1;
+  int lgblock = -1;
+  std::vector<uint8_t> overflow;
+  BROTLI_BOOL output_exhausted = BROTLI_FALSE;
+  BROTLI_BOOL ok;
+
+  static const char *kwlist[] = {
+      "string", "mode", "quality", "lgwin", "lgblock", "dictionary", NULL};
+
+  ok = (BROTLI_BOOL)PyArg_ParseTupleAndKeywords(args, keywds, "s#|O&O&O&O&O&:compress",
+                        const_cast<char **>(kwlist),
+                        &input, &length,
+                        &mode_convertor, &mode,
+                        &quality_convertor, &quality,
+                        &lgwin_convertor, &lgwin,
+                        &lgblock_convertor, &lgblock,
+                        &dictionary_convertor, &dictionary);
+  if (!ok)
+    return NULL;
+
+  if (dictionary.prepared) {
+    if (!match_dictionary_params(dictionary.prepared, &mode, &quality,
+                                 &lgwin, &lgblock))
+      return NULL;
+  } else {
+    if ((int) mode == -1) mode = BROTLI_MODE_GENERIC;
+    if (quality == -1) quality = 11;
+    if (lgwin == -1) lgwin = 22;
+    if (lgblock == -1) lgblock = 0;
+  }
+  const uint8_t* custom_dictionary = dictionary.data;
+  size_t custom_dictionary_length = dictionary.length;
+
+  size_t output_length = BrotliEncoderMaxCompressedSize(length);
+  if (!output_length) {
+    PyErr_SetString(BrotliError, "Input is too large");
+    return NULL;
+  }
+  ret = PyBytes_FromStringAndSize(NULL, output_length);
+  if (ret == NULL)
+    return NULL;
+  uint8_t* output = (uint8_t*) PyBytes_AS_STRING(ret);
+
+  if (quality == 10 && lgwin >= 16 && lgblock == 0 &&
+      custom_dictionary_length == 0) {
+    /* Quality 10 has a dedicated one-shot path that does not use a
+       persistent encoder instance. It raises smaller windows to 16 bits,
+       so those go through the encoder instance below. */
+    /* >>> Pure C block; release python GIL. */
+    Py_BEGIN_ALLOW_THREADS
+    ok = BrotliEncoderCompress(quality, lgwin, mode, length, input,
+                               &output_length, output);
+    Py_END_ALLOW_THREADS
+    /* <<< Pure C block end. Python GIL reacquired. */
+  } else {
+    /* Drive an encoder instance, writing straight into the result buffer.
+       Prepared dictionaries are copied; other encoders come from the pool. */
+    pooled_encoder entry = {NULL, NULL, mode, quality, lgwin, lgblock};
+    BrotliEncoderState* enc;
+    if (dictionary.prepared) {
+      Py_BEGIN_ALLOW_THREADS
+      enc = BrotliEncoderCopyInstance(dictionary.prepared->enc);
+      Py_END_ALLOW_THREADS
+    } else {
+      enc = encoder_pool_acquire(&entry) ? entry.enc : NULL;
+    }
+    if (!enc) {
+      Py_DECREF(ret);
+      return PyErr_NoMemory();
+    }
+    if (!dictionary.prepared && custom_dictionary_length != 0) {
+      Py_BEGIN_ALLOW_THREADS
+      BrotliEncoderSetCustomDictionary(enc, custom_dictionary_length,
+                                       custom_dictionary);
+      Py_END_ALLOW_THREADS
+    }
+    const uint8_t* next_in = input;
+    ok = compress_stream_into(enc, BROTLI_OPERATION_FINISH,
+                              output, &output_length,
+                              &next_in, &length, &output_exhausted);
+    if (!ok && output_exhausted) {
+      /* The streaming encoder is not bound by the one-shot size limit;
+         collect whatever does not fit the buffer. */
+      ok = compress_stream(enc, BROTLI_OPERATION_FINISH, &overflow,
+                           (uint8_t*) next_in, length);
+    }
+    if (ok)
+      ok = BrotliEncoderIsFinished(enc);
+    if (dictionary.prepared) {
+      BrotliEncoderDestroyInstance(enc);
+    } else if (ok) {
+      encoder_pool_release(&entry);
+    } else {
+      pooled_encoder_destroy(&entry);
+    }
+  }
+
+  if (!ok) {
+    Py_DECREF(ret);
+    PyErr_SetString(BrotliError, "BrotliEncoderCompress failed");
+    return NULL;
+  }
+
+  if (_PyBytes_Resize(&ret, output_length + overflow.size()) < 0)
+    return NULL;
+  if (overflow.size()) {
+    memcpy(PyBytes_AS_STRING(ret) + output_length, &overflow[0], overflow.size());
+  }
+
+  return ret;
+}
+
+PyDoc_STRVAR(brotli_decompress__doc__,
+"Decompress a compressed byte string.\n"
+"\n"
+"Signature:\n"
+"  decompress(string, dictionary='', max_output_size=0)\n"
+"\n"
+"Args:\n"
+"  string (bytes): The compressed input data.\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary. MUST be\n"
+"     the same data as passed to compress method.\n"
+"  max_output_size (int, optional): Maximum size of the decompressed data.\n"
+"     Decoding stops as soon as it is exceeded, and no more than that is\n"
+"     allocated for the output. Zero means unbounded. Defaults to 0.\n"
+"\n"
+"Returns:\n"
+"  The decompressed byte string.\n"
+"\n"
+"Raises:\n"
+"  brotli.OutputTooLargeError: If the output exceeds \"max_output_size\".\n"
+"  brotli.error: If decompressor fails.\n");
+
+static PyObject* brotli_decompress(PyObject *self, PyObject *args, PyObject *keywds) {
+  PyObject *ret = NULL;
+  const uint8_t *input;
+  size_t length;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  Py_ssize_t max_output_size = 0;
+  int ok;
+
+  static const char *kwlist[] = {"string", "dictionary", "max_output_size",
+                                 NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "s#|O&n:decompress",
+                        const_cast<char **>(kwlist),
+                        &input, &length,
+                        &dictionary_convertor, &dictionary,
+                        &max_output_size);
+  if (!ok)
+    return NULL;
+
+  if (max_output_size < 0) {
+    PyErr_SetString(BrotliError, "Invalid max_output_size. Must be non-negative.");
+    return NULL;
+  }
+
+  const uint8_t* custom_dictionary = dictionary.data;
+  size_t custom_dictionary_length = dictionary.length;
+
+  std::vector<uint8_t> output;
+
+  BrotliDecoderState* state = BrotliDecoderCreateInstance(0, 0, 0);
+  if (custom_dictionary_length != 0) {
+    BrotliDecoderSetCustomDictionary(state, custom_dictionary_length, custom_dictionary);
+  }
+
+  // Decode one byte past the limit to detect that it is exceeded.
+  size_t max_length = max_output_size ? (size_t) max_output_size + 1 : 0;
+  BrotliDecoderResult result = decompress_stream(state, &output, max_length,
+                                                 &input, &length);
+  ok = result == BROTLI_DECODER_RESULT_SUCCESS;
+  BrotliDecoderDestroyInstance(state);
+
+  if (max_output_size && output.size() > (size_t) max_output_size) {
+    PyErr_SetString(BrotliOutputTooLargeError,
+                    "Decompressed data exceeds max_output_size");
+  } else if (ok) {
+    ret = PyBytes_FromStringAndSize((char*)(output.size() ? &output[0] : NULL), output.size());
+  } else {
+    PyErr_SetString(BrotliError, "BrotliDecompress failed");
+  }
+
+  return ret;
+}
+
+PyDoc_STRVAR(brotli_decompress_into__doc__,
+"Decompress a compressed byte string directly into a writable buffer.\n"
+"\n"
+"Signature:\n"
+"  decompress_into(string, output)\n"
+"\n"
+"Args:\n"
+"  string (bytes): The compressed input data.\n"
+"  output (buffer): Writable buffer (e.g. a bytearray, memoryview or mmap)\n"
+"     receiving the decompressed data.\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary. MUST be\n"
+"     the same data as passed to compress method.\n"
+"\n"
+"Returns:\n"
+"  The number of bytes written to \"output\" (int).\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If decompressor fails, or \"output\" is too small.\n");
+
+static PyObject* brotli_decompress_into(PyObject *self, PyObject *args, PyObject *keywds) {
+  PyObject *ret = NULL;
+  const uint8_t *input;
+  size_t length;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  Py_buffer output;
+  int ok;
+
+  static const char *kwlist[] = {"string", "output", "dictionary", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "s#w*|O&:decompress_into",
+                        const_cast<char **>(kwlist),
+                        &input, &length, &output,
+                        &dictionary_convertor, &dictionary);
+  if (!ok)
+    return NULL;
+
+  const uint8_t* custom_dictionary = dictionary.data;
+  size_t custom_dictionary_length = dictionary.length;
+
+  size_t output_length = (size_t) output.len;
+  size_t available_out = output_length;
+  uint8_t* next_out = (uint8_t*) output.buf;
+  BrotliDecoderResult result;
+
+  /* >>> Pure C block; release python GIL. */
+  Py_BEGIN_ALLOW_THREADS
+
+  BrotliDecoderState* state = BrotliDecoderCreateInstance(0, 0, 0);
+  if (custom_dictionary_length != 0) {
+    BrotliDecoderSetCustomDictionary(state, custom_dictionary_length, custom_dictionary);
+  }
+
+  result = BrotliDecoderDecompressStream(state, &length, &input,
+                                         &available_out, &next_out, 0);
+  BrotliDecoderDestroyInstance(state);
+
+  Py_END_ALLOW_THREADS
+  /* <<< Pure C block end. Python GIL reacquired. */
+
+  PyBuffer_Release(&output);
+
+  if (result == BROTLI_DECODER_RESULT_SUCCESS) {
+    ret = PyLong_FromSize_t(output_length - available_out);
+  } else if (result == BROTLI_DECODER_RESULT_NEEDS_MORE_OUTPUT) {
+    PyErr_SetString(BrotliError, "Output buffer is too small");
+  } else {
+    PyErr_SetString(BrotliError, "BrotliDecompress failed");
+  }
+
+  return ret;
+}
+
+/* Reads the stream header and metablock headers without decoding. */
+
+typedef struct {
+  const uint8_t* data;
+  size_t length;
+  size_t pos;  /* In bits. */
+} header_reader;
+
+static BROTLI_BOOL read_header_bits(header_reader* reader, int n,
+                                    uint32_t* value) {
+  uint32_t bits = 0;
+  int i;
+  if (reader->length * 8 - reader->pos < (size_t)n)
+    return BROTLI_FALSE;
+  for (i = 0; i < n; ++i, ++reader->pos) {
+    bits |= (uint32_t)((reader->data[reader->pos >> 3] >>
+                        (reader->pos & 7)) & 1) << i;
+  }
+  *value = bits;
+  return BROTLI_TRUE;
+}
+
+/* Skips the padding up to the next byte boundary, which must be zero, and
+   then "bytes" bytes. */
+static BROTLI_BOOL skip_header_bytes(header_reader* reader, size_t bytes) {
+  uint32_t padding;
+  if (!read_header_bits(reader, (int)((8 - (reader->pos & 7)) & 7),
+                        &padding) || padding != 0)
+    return BROTLI_FALSE;
+  if (reader->length - (reader->pos >> 3) < bytes)
+    return BROTLI_FALSE;
+  reader->pos += bytes * 8;
+  return BROTLI_TRUE;
+}
+
+/* Walks the metablock headers of a stream, skipping uncompressed and metadata
+   metablocks. Returns 1 and sets "*size" if the decompressed size follows
+   from the headers, 0 if a compressed metablock other than the last one has
+   to be decoded to find the next header, and -1 if the stream is invalid. */
+static int walk_metablock_headers(const uint8_t* input, size_t length,
+                                  size_t* size) {
+  header_reader reader = {input, length, 0};
+  uint32_t bits;
+  uint32_t nibbles;
+  size_t total = 0;
+  int i;
+
+  /* Window bits, see section 9.1 of the spec. */
+  if (!read_header_bits(&reader, 1, &bits))
+    return -1;
+  if (bits) {
+    if (!read_header_bits(&reader, 3, &bits))
+      return -1;
+    if (bits == 0) {
+      if (!read_header_bits(&reader, 3, &bits) || bits == 1)
+        return -1;
+    }
+  }
+
+  for (;;) {
+    uint32_t is_last;
+    uint32_t is_uncompressed = 0;
+    size_t metablock_length = 0;
+    if (!read_header_bits(&reader, 1, &is_last))
+      return -1;
+    if (is_last) {
+      if (!read_header_bits(&reader, 1, &bits))
+        return -1;
+      if (bits)
+        break;
+    }
+    if (!read_header_bits(&reader, 2, &nibbles))
+      return -1;
+    if (nibbles == 3) {
+      /* Metadata: reserved bit, length bytes, then the skipped bytes. */
+      if (!read_header_bits(&reader, 1, &bits) || bits != 0 ||
+          !read_header_bits(&reader, 2, &nibbles))
+        return -1;
+      if (nibbles) {
+        for (i = 0; i < (int)nibbles; ++i) {
+          if (!read_header_bits(&reader, 8, &bits) ||
+              (i + 1 == (int)nibbles && nibbles > 1 && bits == 0))
+            return -1;
+          metablock_length |= (size_t)bits << (i * 8);
+        }
+        ++metablock_length;
+      }
+      if (!skip_header_bytes(&reader, metablock_length))
+        return -1;
+      if (is_last)
+        break;
+      continue;
+    }
+    nibbles += 4;
+    for (i = 0; i < (int)nibbles; ++i) {
+      if (!read_header_bits(&reader, 4, &bits) ||
+          (i + 1 == (int)nibbles && nibbles > 4 && bits == 0))
+        return -1;
+      metablock_length |= (size_t)bits << (i * 4);
+    }
+    ++metablock_length;
+    total += metablock_length;
+    if (is_last)
+      break;
+    if (!read_header_bits(&reader, 1, &is_uncompressed))
+      return -1;
+    if (!is_uncompressed)
+      return 0;
+    if (!skip_header_bytes(&reader, metablock_length))
+      return -1;
+  }
+
+  *size = total;
+  return 1;
+}
+
+/* CRC-32 of the decompressed data, as computed by zlib. Eight bytes are
+   processed at a time, with a table for each position ("slicing by 8"). */
+static uint32_t crc32_table[8][256];
+
+static void init_crc32_table(void) {
+  uint32_t i;
+  int j;
+  for (i = 0; i < 256; ++i) {
+    uint32_t crc = i;
+    for (j = 0; j < 8; ++j)
+      crc = (crc >> 1) ^ (0xEDB88320 & (0 - (crc & 1)));
+    crc32_table[0][i] = crc;
+  }
+  for (i = 0; i < 256; ++i) {
+    for (j = 1; j < 8; ++j) {
+      uint32_t crc = crc32_table[j - 1][i];
+      crc32_table[j][i] = (crc >> 8) ^ crc32_table[0][crc & 0xFF];
+    }
+  }
+}
+
+static uint32_t update_crc32(uint32_t crc, const uint8_t* data,
+                             size_t length) {
+  crc = ~crc;
+  for (; length >= 8; data += 8, length -= 8) {
+    uint32_t low = crc ^ ((uint32_t)data[0] | (uint32_t)data[1] << 8 |
+                          (uint32_t)data[2] << 16 | (uint32_t)data[3] << 24);
+    uint32_t high = (uint32_t)data[4] | (uint32_t)data[5] << 8 |
+                    (uint32_t)data[6] << 16 | (uint32_t)data[7] << 24;
+    crc = crc32_table[7][low & 0xFF] ^ crc32_table[6][(low >> 8) & 0xFF] ^
+          crc32_table[5][(low >> 16) & 0xFF] ^ crc32_table[4][low >> 24] ^
+          crc32_table[3][high & 0xFF] ^ crc32_table[2][(high >> 8) & 0xFF] ^
+          crc32_table[1][(high >> 16) & 0xFF] ^ crc32_table[0][high >> 24];
+  }
+  while (length--)
+    crc = crc32_table[0][(crc ^ *data++) & 0xFF] ^ (crc >> 8);
+  return ~crc;
+}
+
+/* Decodes the available input, discarding the output: it is taken from the
+   decoder without being copied. The output bytes are added to "*total", and
+   to the CRC-32 in "*crc" unless it is NULL. */
+static BrotliDecoderResult discard_output(BrotliDecoderState* dec,
+                                          const uint8_t** next_in,
+                                          size_t* available_in,
+                                          size_t* total, uint32_t* crc) {
+  BrotliDecoderResult result;
+
+  for (;;) {
+    size_t available_out = 0;
+    result = BrotliDecoderDecompressStream(dec, available_in, next_in,
+                                           &available_out, 0, 0);
+    if (result == BROTLI_DECODER_RESULT_ERROR)
+      break;
+
+    size_t buffer_length = 0;
+    const uint8_t* buffer = BrotliDecoderTakeOutput(dec, &buffer_length);
+    *total += buffer_length;
+    if (crc)
+      *crc = update_crc32(*crc, buffer, buffer_length);
+
+    if (result != BROTLI_DECODER_RESULT_NEEDS_MORE_OUTPUT)
+      break;
+  }
+
+  return result;
+}
+
+PyDoc_STRVAR(brotli_decompressed_size__doc__,
+"Find the decompressed size of a compressed byte string.\n"
+"\n"
+"The size is read from the metablock headers. Uncompressed and metadata\n"
+"metablocks are skipped, and reading stops at the last metablock, so a\n"
+"stream made of a single compressed metablock (as written by \"compress\"\n"
+"for quality 2 and up, unless the input is large) is sized without\n"
+"decoding. A compressed metablock that is not the last one can only be\n"
+"skipped by decoding it; then the whole stream is decoded, without keeping\n"
+"the output. Together with \"decompress_into\" this allows decompressing\n"
+"into a single buffer of the right size.\n"
+"\n"
+"Signature:\n"
+"  decompressed_size(string)\n"
+"\n"
+"Args:\n"
+"  string (bytes): The compressed input data.\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary. MUST be\n"
+"     the same data as passed to compress method.\n"
+"\n"
+"Returns:\n"
+"  The exact decompressed size (int). Compressed data that is not decoded\n"
+"  is not checked, so a corrupt stream may still fail to decompress.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If the headers are invalid, or decoding fails.\n");
+
+static PyObject* brotli_decompressed_size(PyObject *self, PyObject *args, PyObject *keywds) {
+  const uint8_t *input;
+  size_t length;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  size_t size = 0;
+  int ok;
+
+  static const char *kwlist[] = {"string", "dictionary", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "s#|O&:decompressed_size",
+                        const_cast<char **>(kwlist),
+                        &input, &length,
+                        &dictionary_convertor, &dictionary);
+  if (!ok)
+    return NULL;
+
+  ok = walk_metablock_headers(input, length, &size);
+  if (ok < 0) {
+    PyErr_SetString(BrotliError, "Invalid metablock header");
+    return NULL;
+  }
+  if (ok) {
+    return PyLong_FromSize_t(size);
+  }
+
+  const uint8_t* custom_dictionary = dictionary.data;
+  size_t custom_dictionary_length = dictionary.length;
+  BrotliDecoderResult result;
+
+  /* >>> Pure C block; release python GIL. */
+  Py_BEGIN_ALLOW_THREADS
+
+  BrotliDecoderState* state = BrotliDecoderCreateInstance(0, 0, 0);
+  if (custom_dictionary_length != 0) {
+    BrotliDecoderSetCustomDictionary(state, custom_dictionary_length, custom_dictionary);
+  }
+
+  result = discard_output(state, &input, &length, &size, NULL);
+  BrotliDecoderDestroyInstance(state);
+
+  Py_END_ALLOW_THREADS
+  /* <<< Pure C block end. Python GIL reacquired. */
+
+  if (result != BROTLI_DECODER_RESULT_SUCCESS) {
+    PyErr_SetString(BrotliError, "BrotliDecompress failed");
+    return NULL;
+  }
+
+  return PyLong_FromSize_t(size);
+}
+
+/* Size of the chunks read from file objects by "verify". */
+static const Py_ssize_t kVerifyReadSize = 1 << 20;
+
+PyDoc_STRVAR(brotli_verify__doc__,
+"Check that compressed data decodes, without keeping the output.\n"
+"\n"
+"The output is discarded as it is decoded, so memory use does not depend on\n"
+"the size of the data. Bytes-like input is decoded with the GIL released\n"
+"for the whole run; a file object is read in chunks, and the GIL is\n"
+"released while each chunk is decoded.\n"
+"\n"
+"Signature:\n"
+"  verify(data, dictionary='', checksum=False)\n"
+"\n"
+"Args:\n"
+"  data (bytes-like or file): The compressed data, or a binary file object\n"
+"     to read it from.\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary. MUST be\n"
+"     the same data as passed to compress method.\n"
+"  checksum (bool, optional): Compute the CRC-32 of the decompressed data,\n"
+"     as \"zlib.crc32\" does. Defaults to False.\n"
+"\n"
+"Returns:\n"
+"  A (length, crc32) tuple: the size of the decompressed data, and its\n"
+"  CRC-32, or None if \"checksum\" is False.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If the data does not decode, is truncated, or is followed\n"
+"     by garbage.\n");
+
+static PyObject* brotli_verify(PyObject *self, PyObject *args, PyObject *keywds) {
+  PyObject* data;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  int checksum = 0;
+  Py_buffer buffer;
+  const uint8_t* input;
+  size_t length;
+  size_t total = 0;
+  uint32_t crc = 0;
+  BrotliDecoderResult result = BROTLI_DECODER_RESULT_NEEDS_MORE_INPUT;
+  BrotliDecoderState* state;
+  int ok;
+
+  static const char *kwlist[] = {"data", "dictionary", "checksum", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "O|O&i:verify",
+                        const_cast<char **>(kwlist),
+                        &data, &dictionary_convertor, &dictionary,
+                        &checksum);
+  if (!ok)
+    return NULL;
+
+  uint32_t* crc_out = checksum ? &crc : NULL;
+  state = BrotliDecoderCreateInstance(0, 0, 0);
+  if (!state)
+    return PyErr_NoMemory();
+  if (dictionary.length != 0) {
+    BrotliDecoderSetCustomDictionary(state, dictionary.length,
+                                     dictionary.data);
+  }
+
+  if (PyObject_CheckBuffer(data)) {
+    if (PyObject_GetBuffer(data, &buffer, PyBUF_SIMPLE) < 0) {
+      BrotliDecoderDestroyInstance(state);
+      return NULL;
+    }
+    input = (const uint8_t*) buffer.buf;
+    length = (size_t) buffer.len;
+
+    /* >>> Pure C block; release python GIL. */
+    Py_BEGIN_ALLOW_THREADS
+    result = discard_output(state, &input, &length, &total, crc_out);
+    Py_END_ALLOW_THREADS
+    /* <<< Pure C block end. Python GIL reacquired. */
+
+    PyBuffer_Release(&buffer);
+  } else {
+    for (;;) {
+      PyObject* chunk = PyObject_CallMethod(data, (char*) "read",
+                                            (char*) "n", kVerifyReadSize);
+      if (!chunk) {
+        BrotliDecoderDestroyInstance(state);
+        return NULL;
+      }
+      if (PyObject_GetBuffer(chunk, &buffer, PyBUF_SIMPLE) < 0) {
+        Py_DECREF(chunk);
+        BrotliDecoderDestroyInstance(state);
+        return NULL;
+      }
+      input = (const uint8_t*) buffer.buf;
+      length = (size_t) buffer.len;
+      size_t chunk_length = length;
+      if (length && result == BROTLI_DECODER_RESULT_NEEDS_MORE_INPUT) {
+        Py_BEGIN_ALLOW_THREADS
+        result = discard_output(state, &input, &length, &total, crc_out);
+        Py_END_ALLOW_THREADS
+      }
+      PyBuffer_Release(&buffer);
+      Py_DECREF(chunk);
+      /* Stop at the end of the file, on errors, and on input left over after
+         the end of the stream, which is garbage. */
+      if (!chunk_length || length || result == BROTLI_DECODER_RESULT_ERROR)
+        break;
+    }
+  }
+  BrotliDecoderDestroyInstance(state);
+
+  if (result == BROTLI_DECODER_RESULT_NEEDS_MORE_INPUT) {
+    PyErr_SetString(BrotliError, "Compressed stream ended before the end of "
+                                 "the stream was reached");
+    return NULL;
+  }
+  if (result != BROTLI_DECODER_RESULT_SUCCESS) {
+    PyErr_SetString(BrotliError, "BrotliDecompress failed");
+    return NULL;
+  }
+  if (length) {
+    PyErr_SetString(BrotliError, "Garbage after the end of the compressed "
+                                 "stream");
+    return NULL;
+  }
+  if (!checksum) {
+    return Py_BuildValue("(nO)", (Py_ssize_t) total, Py_None);
+  }
+  return Py_BuildValue("(nk)", (Py_ssize_t) total, (unsigned long) crc);
+}
+
+/* Batch API: independent items are spread over native worker threads that
+   run with the GIL released for the whole batch. */
+
+typedef struct {
+  Py_buffer input;
+  std::vector<uint8_t> output;
+  BROTLI_BOOL ok;
+} batch_item;
+
+typedef struct {
+  batch_item* items;
+  size_t count;
+  BROTLI_BOOL compress;
+  BrotliEncoderMode mode;
+  int quality;
+  int lgwin;
+  int lgblock;
+  brotli_Dictionary* prepared_dictionary;
+  const uint8_t* dictionary;
+  size_t dictionary_length;
+#if defined(_WIN32)
+  volatile LONG next;
+#else
+  volatile size_t next;
+#endif
+} batch_job;
+
+static size_t batch_next_index(batch_job* job) {
+#if defined(_WIN32)
+  return (size_t) InterlockedIncrement(&job->next) - 1;
+#else
+  return __sync_fetch_and_add(&job->next, 1);
+#endif
+}
+
+static BROTLI_BOOL batch_compress_item(batch_job* job, BrotliEncoderState** enc,
+                                       batch_item* item) {
+  BrotliEncoderState* s = *enc;
+  BROTLI_BOOL ok;
+
+  if (job->prepared_dictionary) {
+    s = BrotliEncoderCopyInstance(job->prepared_dictionary->enc);
+  } else if (!s) {
+    s = BrotliEncoderCreateInstance(0, 0, 0);
+    if (s) {
+      BrotliEncoderSetParameter(s, BROTLI_PARAM_MODE, (uint32_t)job->mode);
+      BrotliEncoderSetParameter(s, BROTLI_PARAM_QUALITY, (uint32_t)job->quality);
+      BrotliEncoderSetParameter(s, BROTLI_PARAM_LGWIN, (uint32_t)job->lgwin);
+      BrotliEncoderSetParameter(s, BROTLI_PARAM_LGBLOCK, (uint32_t)job->lgblock);
+    }
+    *enc = s;
+  }
+  if (!s)
+    return BROTLI_FALSE;
+
+  if (!job->prepared_dictionary && job->dictionary_length != 0) {
+    BrotliEncoderSetCustomDictionary(s, job->dictionary_length, job->dictionary);
+  }
+  try {
+    ok = compress_stream_unlocked(s, BROTLI_OPERATION_FINISH, &item->output,
+                                  (const uint8_t*) item->input.buf,
+                                  (size_t) item->input.len);
+  } catch (const std::bad_alloc&) {
+    /* The encoder is left mid-stream; it is dropped below. */
+    std::vector<uint8_t>().swap(item->output);
+    ok = BROTLI_FALSE;
+  }
+  if (ok)
+    ok = BrotliEncoderIsFinished(s);
+
+  if (job->prepared_dictionary) {
+    BrotliEncoderDestroyInstance(s);
+  } else if (ok) {
+    /* Keep the worker's encoder warm for its next item. */
+    BrotliEncoderReset(s);
+  } else {
+    BrotliEncoderDestroyInstance(s);
+    *enc = NULL;
+  }
+  return ok;
+}
+
+static BROTLI_BOOL batch_decompress_item(batch_job* job, batch_item* item) {
+  const uint8_t* next_in = (const uint8_t*) item->input.buf;
+  size_t available_in = (size_t) item->input.len;
+  BrotliDecoderResult result;
+
+  BrotliDecoderState* dec = BrotliDecoderCreateInstance(0, 0, 0);
+  if (!dec)
+    return BROTLI_FALSE;
+  if (job->dictionary_length != 0) {
+    BrotliDecoderSetCustomDictionary(dec, job->dictionary_length,
+                                     job->dictionary);
+  }
+  try {
+    result = decompress_stream_unlocked(dec, &item->output, 0,
+                                        &next_in, &available_in);
+  } catch (const std::bad_alloc&) {
+    std::vector<uint8_t>().swap(item->output);
+    result = BROTLI_DECODER_RESULT_ERROR;
+  }
+  BrotliDecoderDestroyInstance(dec);
+  return result == BROTLI_DECODER_RESULT_SUCCESS && !available_in;
+}
+
+static void batch_worker(batch_job* job) {
+  BrotliEncoderState* enc = NULL;
+  for (;;) {
+    size_t i = batch_next_index(job);
+    if (i >= job->count)
+      break;
+    batch_item* item = &job->items[i];
+    item->ok = job->compress ? batch_compress_item(job, &enc, item)
+                             : batch_decompress_item(job, item);
+  }
+  BrotliEncoderDestroyInstance(enc);
+}
+
+#if defined(_WIN32)
+typedef HANDLE batch_thread;
+
+static unsigned __stdcall batch_thread_main(void* job) {
+  batch_worker((batch_job*) job);
+  return 0;
+}
+
+static BROTLI_BOOL batch_thread_start(batch_thread* thread, batch_job* job) {
+  *thread = (HANDLE) _beginthreadex(NULL, 0, batch_thread_main, job, 0, NULL);
+  return *thread != 0;
+}
+
+static void batch_thread_join(batch_thread thread) {
+  WaitForSingleObject(thread, INFINITE);
+  CloseHandle(thread);
+}
+
+static int batch_cpu_count(void) {
+  SYSTEM_INFO info;
+  GetSystemInfo(&info);
+  return (int) info.dwNumberOfProcessors;
+}
+#else
+typedef pthread_t batch_thread;
+
+static void* batch_thread_main(void* job) {
+  batch_worker((batch_job*) job);
+  return NULL;
+}
+
+static BROTLI_BOOL batch_thread_start(batch_thread* thread, batch_job* job) {
+  return pthread_create(thread, NULL, batch_thread_main, job) == 0;
+}
+
+static void batch_thread_join(batch_thread thread) {
+  pthread_join(thread, NULL);
+}
+
+static int batch_cpu_count(void) {
+#if defined(_SC_NPROCESSORS_ONLN)
+  long count = sysconf(_SC_NPROCESSORS_ONLN);
+  return count > 0 ? (int) count : 1;
+#else
+  return 1;
+#endif
+}
+#endif
+
+/* Runs the job on up to "threads" threads, the calling one included. If a
+   worker can not be started, the remaining ones pick up its share. */
+static void batch_run(batch_job* job, int threads) {
+  std::vector<batch_thread> workers;
+  if (threads <= 0)
+    threads = batch_cpu_count();
+  if ((size_t) threads > job->count)
+    threads = (int) job->count;
+  for (int i = 1; i < threads; ++i) {
+    batch_thread thread;
+    if (!batch_thread_start(&thread, job))
+      break;
+    workers.push_back(thread);
+  }
+  batch_worker(job);
+  for (size_t i = 0; i < workers.size(); ++i) {
+    batch_thread_join(workers[i]);
+  }
+}
+
+/* Collects the buffers of "items" into "job", runs it with the GIL released
+   and converts the outputs to a list. Failed items are replaced with a
+   "brotli.error" instance carrying "error_message". */
+static PyObject* batch_execute(batch_job* job, PyObject* items, int threads,
+                               const char* error_message) {
+  PyObject* seq = PySequence_Fast(items, "Items must be a sequence");
+  if (seq == NULL)
+    return NULL;
+
+  size_t count = (size_t) PySequence_Fast_GET_SIZE(seq);
+  std::vector<batch_item> batch(count);
+  size_t acquired = 0;
+  PyObject* ret = NULL;
+
+  for (; acquired < count; ++acquired) {
+    PyObject* item = PySequence_Fast_GET_ITEM(seq, acquired);
+    if (PyObject_GetBuffer(item, &batch[acquired].input, PyBUF_SIMPLE) < 0)
+      goto end;
+    batch[acquired].ok = BROTLI_FALSE;
+  }
+
+  job->items = count ? &batch[0] : NULL;
+  job->count = count;
+  job->next = 0;
+
+  /* >>> Pure C block; release python GIL. */
+  Py_BEGIN_ALLOW_THREADS
+  batch_run(job, threads);
+  Py_END_ALLOW_THREADS
+  /* <<< Pure C block end. Python GIL reacquired. */
+
+  ret = PyList_New(count);
+  if (ret == NULL)
+    goto end;
+  for (size_t i = 0; i < count; ++i) {
+    PyObject* value;
+    if (batch[i].ok) {
+      value = PyBytes_FromStringAndSize(
+          batch[i].output.size() ? (char*) &batch[i].output[0] : NULL,
+          batch[i].output.size());
+    } else {
+      value = PyObject_CallFunction(BrotliError, (char*) "s", error_message);
+    }
+    if (value == NULL) {
+      Py_CLEAR(ret);
+      goto end;
+    }
+    PyList_SET_ITEM(ret, i, value);
+    std::vector<uint8_t>().swap(batch[i].output);
+  }
+
+end:
+  for (size_t i = 0; i < acquired; ++i) {
+    PyBuffer_Release(&batch[i].input);
+  }
+  Py_DECREF(seq);
+  return ret;
+}
+
+static int threads_convertor(PyObject *o, int *threads) {
+  if (!PyInt_Check(o)) {
+    PyErr_SetString(BrotliError, "Invalid number of threads");
+    return 0;
+  }
+
+  *threads = (int) PyInt_AsLong(o);
+  if (*threads < 0) {
+    PyErr_SetString(BrotliError, "Invalid number of threads. Can't be negative.");
+    return 0;
+  }
+
+  return 1;
+}
+
+PyDoc_STRVAR(brotli_compress_many__doc__,
+"Compress a sequence of byte strings, spreading them over several threads.\n"
 "\n"
 "Signature:\n"
-"  decompress(string)\n"
+"  compress_many(strings, mode=MODE_GENERIC, quality=11, lgwin=22,\n"
+"                lgblock=0, dictionary='', threads=0)\n"
 "\n"
 "Args:\n"
-"  string (bytes): The compressed input data.\n"
-"  dictionary (bytes, optional): Custom dictionary. MUST be the same data\n"
-"     as passed to compress method.\n"
+"  strings (sequence of bytes): The input data items, compressed as\n"
+"    independent streams.\n"
+"  mode, quality, lgwin, lgblock, dictionary (optional): Same as for\n"
+"    \"compress\"; applied to every item.\n"
+"  threads (int, optional): Number of threads to use. If set to 0, the\n"
+"    number of CPUs is used. Defaults to 0.\n"
 "\n"
 "Returns:\n"
-"  The decompressed byte string.\n"
+"  A list with the compressed byte string of each item, in the order of\n"
+"  \"strings\". Items that could not be compressed are replaced with a\n"
+"  \"brotli.error\" instance instead of failing the whole batch.\n"
 "\n"
 "Raises:\n"
-"  brotli.error: If decompressor fails.\n");
+"  brotli.error: If arguments are invalid.\n");
 
-static PyObject* brotli_decompress(PyObject *self, PyObject *args, PyObject *keywds) {
-  PyObject *ret = NULL;
-  const uint8_t *input, *custom_dictionary;
-  size_t length, custom_dictionary_length;
+static PyObject* brotli_compress_many(PyObject *self, PyObject *args, PyObject *keywds) {
+  PyObject *items;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  BrotliEncoderMode mode = (BrotliEncoderMode) -1;
+  int quality = -1;
+  int lgwin = -1;
+  int lgblock = -1;
+  int threads = 0;
   int ok;
 
-  static const char *kwlist[] = {"string", "dictionary", NULL};
+  static const char *kwlist[] = {
+      "strings", "mode", "quality", "lgwin", "lgblock", "dictionary",
+      "threads", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "O|O&O&O&O&O&O&:compress_many",
+                        const_cast<char **>(kwlist),
+                        &items,
+                        &mode_convertor, &mode,
+                        &quality_convertor, &quality,
+                        &lgwin_convertor, &lgwin,
+                        &lgblock_convertor, &lgblock,
+                        &dictionary_convertor, &dictionary,
+                        &threads_convertor, &threads);
+  if (!ok)
+    return NULL;
+
+  if (dictionary.prepared) {
+    if (!match_dictionary_params(dictionary.prepared, &mode, &quality,
+                                 &lgwin, &lgblock))
+      return NULL;
+  } else {
+    if ((int) mode == -1) mode = BROTLI_MODE_GENERIC;
+    if (quality == -1) quality = 11;
+    if (lgwin == -1) lgwin = 22;
+    if (lgblock == -1) lgblock = 0;
+  }
+
+  batch_job job;
+  job.compress = BROTLI_TRUE;
+  job.mode = mode;
+  job.quality = quality;
+  job.lgwin = lgwin;
+  job.lgblock = lgblock;
+  job.prepared_dictionary = dictionary.prepared;
+  job.dictionary = dictionary.data;
+  job.dictionary_length = dictionary.length;
+
+  return batch_execute(&job, items, threads, "BrotliEncoderCompress failed");
+}
+
+PyDoc_STRVAR(brotli_decompress_many__doc__,
+"Decompress a sequence of compressed byte strings, spreading them over\n"
+"several threads.\n"
+"\n"
+"Signature:\n"
+"  decompress_many(strings, dictionary='', threads=0)\n"
+"\n"
+"Args:\n"
+"  strings (sequence of bytes): The compressed input data items, each one\n"
+"    a complete stream.\n"
+"  dictionary (bytes or Dictionary, optional): Custom dictionary, applied to\n"
+"    every item. MUST be the same data as passed to compress method.\n"
+"  threads (int, optional): Number of threads to use. If set to 0, the\n"
+"    number of CPUs is used. Defaults to 0.\n"
+"\n"
+"Returns:\n"
+"  A list with the decompressed byte string of each item, in the order of\n"
+"  \"strings\". Items that could not be decompressed are replaced with a\n"
+"  \"brotli.error\" instance instead of failing the whole batch.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If arguments are invalid.\n");
+
+static PyObject* brotli_decompress_many(PyObject *self, PyObject *args, PyObject *keywds) {
+  PyObject *items;
+  dictionary_param dictionary = {NULL, NULL, 0};
+  int threads = 0;
+  int ok;
 
-  custom_dictionary = NULL;
-  custom_dictionary_length = 0;
+  static const char *kwlist[] = {"strings", "dictionary", "threads", NULL};
 
-  ok = PyArg_ParseTupleAndKeywords(args, keywds, "s#|s#:decompress",
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "O|O&O&:decompress_many",
                         const_cast<char **>(kwlist),
-                        &input, &length,
-                        &custom_dictionary, &custom_dictionary_length);
+                        &items,
+                        &dictionary_convertor, &dictionary,
+                        &threads_convertor, &threads);
   if (!ok)
     return NULL;
 
-  std::vector<uint8_t> output;
+  batch_job job;
+  job.compress = BROTLI_FALSE;
+  job.prepared_dictionary = dictionary.prepared;
+  job.dictionary = dictionary.data;
+  job.dictionary_length = dictionary.length;
 
-  /* >>> Pure C block; release python GIL. */
-  Py_BEGIN_ALLOW_THREADS
+  return batch_execute(&job, items, threads, "BrotliDecompress failed");
+}
 
-  BrotliDecoderState* state = BrotliDecoderCreateInstance(0, 0, 0);
-  if (custom_dictionary_length != 0) {
-    BrotliDecoderSetCustomDictionary(state, custom_dictionary_length, custom_dictionary);
+/* Sorts the suffixes of "text", whose symbols are below "alphabet", by prefix
+   doubling with radix sort. */
+static void suffix_array(const std::vector<int32_t>& text, int32_t alphabet,
+                         std::vector<int32_t>* sa) {
+  int32_t n = (int32_t) text.size();
+  std::vector<int32_t> rank(text);
+  std::vector<int32_t> tmp(n);
+  std::vector<int32_t> count(std::max(alphabet, n), 0);
+  int32_t classes = alphabet;
+  int32_t i;
+
+  sa->resize(n);
+  if (n == 0) return;
+  int32_t* order = &(*sa)[0];
+  for (i = 0; i < n; ++i) count[rank[i]]++;
+  for (i = 1; i < classes; ++i) count[i] += count[i - 1];
+  for (i = n - 1; i >= 0; --i) order[--count[rank[i]]] = i;
+
+  for (int32_t k = 1; k < n; k <<= 1) {
+    /* Order by the rank of the second half, then stable sort by the first. */
+    int32_t p = 0;
+    for (i = k < n ? n - k : 0; i < n; ++i) tmp[p++] = i;
+    for (i = 0; i < n; ++i) {
+      if (order[i] >= k) tmp[p++] = order[i] - k;
+    }
+    std::fill(count.begin(), count.begin() + classes, 0);
+    for (i = 0; i < n; ++i) count[rank[i]]++;
+    for (i = 1; i < classes; ++i) count[i] += count[i - 1];
+    for (i = n - 1; i >= 0; --i) order[--count[rank[tmp[i]]]] = tmp[i];
+
+    tmp.swap(rank);
+    rank[order[0]] = 0;
+    classes = 1;
+    for (i = 1; i < n; ++i) {
+      int32_t a = order[i - 1];
+      int32_t b = order[i];
+      if (tmp[a] != tmp[b] ||
+          (a + k < n ? tmp[a + k] : -1) != (b + k < n ? tmp[b + k] : -1)) {
+        classes++;
+      }
+      rank[b] = classes - 1;
+    }
+    if (classes == n) break;
   }
+}
 
-  BrotliDecoderResult result = BROTLI_DECODER_RESULT_NEEDS_MORE_OUTPUT;
-  while (result == BROTLI_DECODER_RESULT_NEEDS_MORE_OUTPUT) {
-    size_t available_out = 0;
-    result = BrotliDecoderDecompressStream(state, &length, &input,
-                                           &available_out, 0, 0);
-    const uint8_t* next_out = BrotliDecoderTakeOutput(state, &available_out);
-    if (available_out != 0)
-      output.insert(output.end(), next_out, next_out + available_out);
+/* Kasai's algorithm; "lcp[i]" is the length of the common prefix of the
+   suffixes "sa[i - 1]" and "sa[i]". */
+static void lcp_array(const std::vector<int32_t>& text,
+                      const std::vector<int32_t>& sa,
+                      std::vector<int32_t>* lcp) {
+  int32_t n = (int32_t) text.size();
+  std::vector<int32_t> rank(n);
+  int32_t h = 0;
+  int32_t i;
+
+  lcp->assign(n, 0);
+  for (i = 0; i < n; ++i) rank[sa[i]] = i;
+  for (i = 0; i < n; ++i) {
+    if (rank[i] == 0) {
+      h = 0;
+      continue;
+    }
+    int32_t j = sa[rank[i] - 1];
+    while (i + h < n && j + h < n && text[i + h] == text[j + h]) h++;
+    (*lcp)[rank[i]] = h;
+    if (h > 0) h--;
   }
-  ok = result == BROTLI_DECODER_RESULT_SUCCESS;
-  BrotliDecoderDestroyInstance(state);
+}
+
+/* Dictionary training.
+
+   The samples are concatenated, each one followed by a unique separator
+   symbol, so that no repeat crosses a sample boundary. Repeated substrings
+   are the LCP intervals of the suffix array of that text. Only the first
+   occurrence in a sample profits from the dictionary, the following ones are
+   found in the window anyway, so an interval is scored by the number of
+   distinct samples it occurs in. */
+
+/* Repeats shorter than this are cheaper to encode as literals. */
+static const int32_t kTrainMinLength = 8;
+/* Longer repeats are truncated; this bounds the cost of rescoring. */
+static const int32_t kTrainMaxLength = 1024;
+/* Rough number of bytes a dictionary reference costs. */
+static const int32_t kTrainReferenceCost = 3;
+
+/* A repeated substring: the suffixes "sa[lb..rb]" start with it. */
+typedef struct {
+  int32_t lb;
+  int32_t rb;
+  int32_t length;
+} train_candidate;
+
+/* An open LCP interval during the bottom-up traversal. */
+typedef struct {
+  int32_t lcp;
+  int32_t lb;
+  int32_t dups;
+  int32_t child_samples;  /* The most samples any child interval occurs in. */
+} train_interval;
+
+/* Collects the LCP intervals that occur in at least two samples. Intervals
+   are enumerated bottom-up with a stack; "dups" counts the suffixes of an
+   interval whose sample already has an earlier suffix in it (Hui's method),
+   so the number of samples is the interval size minus "dups". An interval
+   with a child that occurs in as many samples is skipped: the longer string
+   of the child is worth more in the same samples. */
+static void train_collect(const std::vector<int32_t>& sa,
+                          const std::vector<int32_t>& lcp,
+                          const std::vector<int32_t>& sample_of,
+                          int32_t num_samples,
+                          std::vector<train_candidate>* candidates,
+                          std::vector<double>* densities) {
+  int32_t n = (int32_t) sa.size();
+  std::vector<train_interval> stack;
+  std::vector<int32_t> last(num_samples, -1);
+  train_interval root = {0, 0, 0, 0};
+
+  stack.push_back(root);
+  last[sample_of[sa[0]]] = 0;
+  for (int32_t i = 1; i <= n; ++i) {
+    int32_t h = i < n ? lcp[i] : 0;
+    int32_t lb = i - 1;
+    int32_t carry_dups = 0;
+    int32_t carry_samples = 0;
+    while (h < stack.back().lcp) {
+      train_interval top = stack.back();
+      stack.pop_back();
+      int32_t samples = i - top.lb - top.dups;
+      if (top.lcp >= kTrainMinLength && samples >= 2 &&
+          samples > top.child_samples) {
+        train_candidate candidate;
+        candidate.lb = top.lb;
+        candidate.rb = i - 1;
+        candidate.length = std::min(top.lcp, kTrainMaxLength);
+        candidates->push_back(candidate);
+        /* An upper bound of the gain per dictionary byte. */
+        densities->push_back((double) samples *
+            (candidate.length - kTrainReferenceCost) / candidate.length);
+      }
+      lb = top.lb;
+      if (h <= stack.back().lcp) {
+        stack.back().dups += top.dups;
+        stack.back().child_samples =
+            std::max(stack.back().child_samples, samples);
+      } else {
+        carry_dups = top.dups;
+        carry_samples = samples;
+      }
+    }
+    if (h > stack.back().lcp) {
+      train_interval pushed = {h, lb, carry_dups, carry_samples};
+      stack.push_back(pushed);
+    }
+    if (i == n) break;
+
+    /* The deepest open interval holding the previous suffix of the same
+       sample is the lowest common ancestor of the two. */
+    int32_t sample = sample_of[sa[i]];
+    int32_t j = last[sample];
+    last[sample] = i;
+    if (j < 0) continue;
+    size_t low = 0;
+    size_t high = stack.size();
+    while (high - low > 1) {
+      size_t middle = (low + high) / 2;
+      if (stack[middle].lb <= j) {
+        low = middle;
+      } else {
+        high = middle;
+      }
+    }
+    stack[low].dups++;
+  }
+}
+
+/* Selects candidates greedily by gain per byte, where the gain only counts
+   bytes not yet covered by a selected candidate. Gains only decrease, so
+   a stale score is an upper bound and is refreshed lazily. Returns the
+   dictionary with the best candidates last, where the distances to them
+   are the shortest. */
+static void train_select(const std::vector<int32_t>& text,
+                         const std::vector<int32_t>& sa,
+                         const std::vector<int32_t>& sample_of,
+                         int32_t num_samples,
+                         const std::vector<train_candidate>& candidates,
+                         const std::vector<double>& densities,
+                         size_t size, std::vector<uint8_t>* dictionary) {
+  std::priority_queue<std::pair<double, int32_t> > queue;
+  std::vector<uint8_t> covered(text.size(), 0);
+  std::vector<int32_t> seen(num_samples, -1);
+  std::vector<int32_t> selected;
+  size_t remaining = size;
+
+  for (size_t c = 0; c < candidates.size(); ++c) {
+    queue.push(std::make_pair(densities[c], (int32_t) c));
+  }
+  while (!queue.empty() && remaining >= (size_t) kTrainMinLength) {
+    int32_t c = queue.top().second;
+    const train_candidate& candidate = candidates[c];
+    queue.pop();
+    if ((size_t) candidate.length > remaining) continue;
+
+    int64_t gain = 0;
+    for (int32_t i = candidate.lb; i <= candidate.rb; ++i) {
+      int32_t position = sa[i];
+      int32_t sample = sample_of[position];
+      if (seen[sample] == c) continue;
+      seen[sample] = c;
+      int32_t uncovered = 0;
+      for (int32_t k = 0; k < candidate.length; ++k) {
+        uncovered += !covered[position + k];
+      }
+      if (uncovered > kTrainReferenceCost) {
+        gain += uncovered - kTrainReferenceCost;
+      }
+    }
+    if (gain <= 0) continue;
+    double density = (double) gain / candidate.length;
+    if (!queue.empty() && density < queue.top().first) {
+      queue.push(std::make_pair(density, c));
+      continue;
+    }
+
+    selected.push_back(c);
+    remaining -= candidate.length;
+    for (int32_t i = candidate.lb; i <= candidate.rb; ++i) {
+      std::fill(covered.begin() + sa[i],
+                covered.begin() + sa[i] + candidate.length, 1);
+    }
+  }
+
+  dictionary->clear();
+  dictionary->reserve(size - remaining);
+  for (size_t i = selected.size(); i-- > 0;) {
+    const train_candidate& candidate = candidates[selected[i]];
+    int32_t position = sa[candidate.lb];
+    for (int32_t k = 0; k < candidate.length; ++k) {
+      dictionary->push_back((uint8_t) text[position + k]);
+    }
+  }
+}
+
+PyDoc_STRVAR(brotli_train_dictionary__doc__,
+"Train a custom dictionary on a set of samples.\n"
+"\n"
+"Substrings that occur in many samples are selected by their frequency and\n"
+"length, as found in the suffix array of the samples. The most valuable\n"
+"ones are placed at the end of the dictionary, where the distances to them\n"
+"are the cheapest to encode.\n"
+"\n"
+"Signature:\n"
+"  train_dictionary(samples, size=65536)\n"
+"\n"
+"Args:\n"
+"  samples (sequence of bytes): Typical inputs; each one is expected to be\n"
+"    compressed as a separate stream.\n"
+"  size (int, optional): The maximum size of the dictionary. Defaults to\n"
+"    64 KiB.\n"
+"\n"
+"Returns:\n"
+"  The dictionary, as a byte string. It is shorter than \"size\" if the\n"
+"  samples have fewer repeats worth a reference.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If arguments are invalid.\n");
+
+static PyObject* brotli_train_dictionary(PyObject *self, PyObject *args, PyObject *keywds) {
+  PyObject *samples;
+  Py_ssize_t size = 1 << 16;
+  int ok;
+
+  static const char *kwlist[] = {"samples", "size", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "O|n:train_dictionary",
+                        const_cast<char **>(kwlist),
+                        &samples, &size);
+  if (!ok)
+    return NULL;
+
+  if (size <= 0 || size > (1 << BROTLI_MAX_WINDOW_BITS)) {
+    PyErr_SetString(BrotliError, "Invalid dictionary size");
+    return NULL;
+  }
+
+  PyObject* seq = PySequence_Fast(samples, "Samples must be a sequence");
+  if (seq == NULL)
+    return NULL;
+
+  /* Each sample is followed by its own separator symbol. */
+  Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+  Py_ssize_t total = count;
+  std::vector<int32_t> text;
+  std::vector<int32_t> sample_of;
+  for (Py_ssize_t i = 0; i < count; ++i) {
+    Py_buffer buffer;
+    if (PyObject_GetBuffer(PySequence_Fast_GET_ITEM(seq, i), &buffer,
+                           PyBUF_SIMPLE) < 0) {
+      Py_DECREF(seq);
+      return NULL;
+    }
+    total += buffer.len;
+    if (total > 0x7FFFFFFF - 256) {
+      PyBuffer_Release(&buffer);
+      Py_DECREF(seq);
+      PyErr_SetString(BrotliError, "Samples are too large");
+      return NULL;
+    }
+    const uint8_t* data = (const uint8_t*) buffer.buf;
+    text.insert(text.end(), data, data + buffer.len);
+    text.push_back(256 + (int32_t) i);
+    sample_of.insert(sample_of.end(), buffer.len + 1, (int32_t) i);
+    PyBuffer_Release(&buffer);
+  }
+  Py_DECREF(seq);
 
+  std::vector<uint8_t> dictionary;
+  if (count > 0) {
+    /* >>> Pure C block; release python GIL. */
+    Py_BEGIN_ALLOW_THREADS
+    std::vector<int32_t> sa;
+    std::vector<int32_t> lcp;
+    std::vector<train_candidate> candidates;
+    std::vector<double> densities;
+    suffix_array(text, 256 + (int32_t) count, &sa);
+    lcp_array(text, sa, &lcp);
+    train_collect(sa, lcp, sample_of, (int32_t) count, &candidates,
+                  &densities);
+    std::vector<int32_t>().swap(lcp);
+    train_select(text, sa, sample_of, (int32_t) count, candidates, densities,
+                 (size_t) size, &dictionary);
+    Py_END_ALLOW_THREADS
+    /* <<< Pure C block end. Python GIL reacquired. */
+  }
+
+  return PyBytes_FromStringAndSize(
+      dictionary.size() ? (char*) &dictionary[0] : NULL, dictionary.size());
+}
+
+/* Finds the longest match with an earlier position for each suffix of "sa",
+   scanning it in the direction "step". Among the suffixes on that side, the
+   closest one that starts earlier in the text is the previous (or next)
+   smaller value of "sa"; a stack yields all of them in linear time. Each
+   entry keeps the minimum LCP between it and the entry above it, so the LCP
+   with the current suffix is at hand when the entry is on top. */
+static void find_earlier_matches(const std::vector<int32_t>& sa,
+                                 const std::vector<int32_t>& lcp, int step,
+                                 std::vector<int32_t>* lengths,
+                                 std::vector<int32_t>* sources) {
+  int32_t n = (int32_t) sa.size();
+  std::vector<std::pair<int32_t, int32_t> > stack;
+  int32_t i = step > 0 ? 0 : n - 1;
+
+  for (; i >= 0 && i < n; i += step) {
+    if (!stack.empty()) {
+      /* The LCP of the adjacent suffixes "i - step" and "i". */
+      int32_t h = step > 0 ? lcp[i] : lcp[i + 1];
+      stack.back().second = std::min(stack.back().second, h);
+    }
+    while (!stack.empty() && sa[stack.back().first] > sa[i]) {
+      int32_t h = stack.back().second;
+      stack.pop_back();
+      if (!stack.empty()) {
+        stack.back().second = std::min(stack.back().second, h);
+      }
+    }
+    if (!stack.empty()) {
+      (*lengths)[i] = stack.back().second;
+      (*sources)[i] = sa[stack.back().first];
+    }
+    stack.push_back(std::make_pair(i, (int32_t) 0x7FFFFFFF));
+  }
+}
+
+/* Creates an array.array('i') holding "values". */
+static PyObject* int32_array(PyObject* array_type,
+                             const std::vector<int32_t>& values) {
+  PyObject* result = PyObject_CallFunction(array_type, "s", "i");
+  if (result == NULL || values.empty())
+    return result;
+  const char* data = (const char*) &values[0];
+  Py_ssize_t size = (Py_ssize_t) (values.size() * sizeof(int32_t));
+#if PY_MAJOR_VERSION >= 3
+  PyObject* none = PyObject_CallMethod(result, "frombytes", "y#", data, size);
+#else
+  PyObject* none = PyObject_CallMethod(result, "fromstring", "s#", data, size);
+#endif
+  if (none == NULL) {
+    Py_DECREF(result);
+    return NULL;
+  }
+  Py_DECREF(none);
+  return result;
+}
+
+PyDoc_STRVAR(brotli_find_opt_references__doc__,
+"Find the longest backward reference for each position of the input.\n"
+"\n"
+"This is the simple mode of the \"find_opt_references\" research tool. When\n"
+"two earlier positions give a match of the same length, the one whose suffix\n"
+"sorts first is used, as the tool does.\n"
+"\n"
+"The suffix array is built on a single thread. The GIL is released while it\n"
+"is built, so other Python threads keep running, and several inputs can be\n"
+"analyzed at the same time from different threads.\n"
+"\n"
+"Signature:\n"
+"  find_opt_references(string, min_length=1, skip=1)\n"
+"\n"
+"Args:\n"
+"  string (bytes): The input data.\n"
+"  min_length (int, optional): Shorter references are left out. Defaults\n"
+"    to 1.\n"
+"  skip (int, optional): References at positions below this are left out.\n"
+"    Defaults to 1.\n"
+"\n"
+"Returns:\n"
+"  A (positions, distances, lengths) tuple of array.array('i') objects,\n"
+"  with one entry per reference, in the order of positions.\n"
+"\n"
+"Raises:\n"
+"  brotli.error: If arguments are invalid.\n");
+
+static PyObject* brotli_find_opt_references(PyObject *self, PyObject *args, PyObject *keywds) {
+  Py_buffer input;
+  int min_length = 1;
+  int skip = 1;
+  int ok;
+
+  static const char *kwlist[] = {"string", "min_length", "skip", NULL};
+
+  ok = PyArg_ParseTupleAndKeywords(args, keywds, "s*|ii:find_opt_references",
+                                   const_cast<char **>(kwlist),
+                                   &input, &min_length, &skip);
+  if (!ok)
+    return NULL;
+
+  if (min_length < 1 || skip < 0) {
+    PyBuffer_Release(&input);
+    PyErr_SetString(BrotliError, "Invalid min_length or skip");
+    return NULL;
+  }
+  if (input.len > 0x7FFFFFFF) {
+    PyBuffer_Release(&input);
+    PyErr_SetString(BrotliError, "Input is too large");
+    return NULL;
+  }
+
+  int32_t n = (int32_t) input.len;
+  std::vector<int32_t> positions;
+  std::vector<int32_t> distances;
+  std::vector<int32_t> lengths;
+
+  /* >>> Pure C block; release python GIL. */
+  Py_BEGIN_ALLOW_THREADS
+  const uint8_t* data = (const uint8_t*) input.buf;
+  std::vector<int32_t> text(data, data + n);
+  std::vector<int32_t> sa;
+  std::vector<int32_t> lcp;
+  suffix_array(text, 256, &sa);
+  lcp_array(text, sa, &lcp);
+  std::vector<int32_t>().swap(text);
+
+  std::vector<int32_t> left_lengths(n, 0);
+  std::vector<int32_t> left_sources(n, -1);
+  std::vector<int32_t> right_lengths(n, 0);
+  std::vector<int32_t> right_sources(n, -1);
+  find_earlier_matches(sa, lcp, 1, &left_lengths, &left_sources);
+  find_earlier_matches(sa, lcp, -1, &right_lengths, &right_sources);
+  std::vector<int32_t>().swap(lcp);
+
+  /* Keep the longer match of both sides, indexed by position. On a tie the
+     left side wins, as in "PrintReference" of the research tool. */
+  std::vector<int32_t> best_lengths(n, 0);
+  std::vector<int32_t> best_sources(n, -1);
+  for (int32_t i = 0; i < n; ++i) {
+    int32_t length = left_lengths[i];
+    int32_t source = left_sources[i];
+    if (right_lengths[i] > length) {
+      length = right_lengths[i];
+      source = right_sources[i];
+    }
+    best_lengths[sa[i]] = length;
+    best_sources[sa[i]] = source;
+  }
+  for (int32_t position = skip; position < n; ++position) {
+    if (best_lengths[position] < min_length) continue;
+    positions.push_back(position);
+    distances.push_back(position - best_sources[position]);
+    lengths.push_back(best_lengths[position]);
+  }
   Py_END_ALLOW_THREADS
   /* <<< Pure C block end. Python GIL reacquired. */
 
-  if (ok) {
-    ret = PyBytes_FromStringAndSize((char*)(output.size() ? &output[0] : NULL), output.size());
-  } else {
-    PyErr_SetString(BrotliError, "BrotliDecompress failed");
-  }
+  PyBuffer_Release(&input);
 
+  PyObject* array_module = PyImport_ImportModule("array");
+  if (array_module == NULL)
+    return NULL;
+  PyObject* array_type = PyObject_GetAttrString(array_module, "array");
+  Py_DECREF(array_module);
+  if (array_type == NULL)
+    return NULL;
+  PyObject* ret = Py_BuildValue("(NNN)",
+                                int32_array(array_type, positions),
+                                int32_array(array_type, distances),
+                                int32_array(array_type, lengths));
+  Py_DECREF(array_type);
   return ret;
 }
 
 static PyMethodDef brotli_methods[] = {
+  {"compress", (PyCFunction)brotli_compress, METH_VARARGS | METH_KEYWORDS, brotli_compress__doc__},
+  {"clear_encoder_pool", (PyCFunction)brotli_clear_encoder_pool, METH_NOARGS, brotli_clear_encoder_pool__doc__},
   {"decompress", (PyCFunction)brotli_decompress, METH_VARARGS | METH_KEYWORDS, brotli_decompress__doc__},
+  {"decompress_into", (PyCFunction)brotli_decompress_into, METH_VARARGS | METH_KEYWORDS, brotli_decompress_into__doc__},
+  {"decompressed_size", (PyCFunction)brotli_decompressed_size, METH_VARARGS | METH_KEYWORDS, brotli_decompressed_size__doc__},
+  {"verify", (PyCFunction)brotli_verify, METH_VARARGS | METH_KEYWORDS, brotli_verify__doc__},
+  {"compress_many", (PyCFunction)brotli_compress_many, METH_VARARGS | METH_KEYWORDS, brotli_compress_many__doc__},
+  {"decompress_many", (PyCFunction)brotli_decompress_many, METH_VARARGS | METH_KEYWORDS, brotli_decompress_many__doc__},
+  {"train_dictionary", (PyCFunction)brotli_train_dictionary, METH_VARARGS | METH_KEYWORDS, brotli_train_dictionary__doc__},
+  {"find_opt_references", (PyCFunction)brotli_find_opt_references, METH_VARARGS | METH_KEYWORDS, brotli_find_opt_references__doc__},
   {NULL, NULL, 0, NULL}
 };
 
@@ -509,12 +3182,33 @@ PyMODINIT_FUNC INIT_BROTLI(void) {
     PyModule_AddObject(m, "error", BrotliError);
   }
 
+  BrotliOutputTooLargeError = PyErr_NewException(
+      (char*) "brotli.OutputTooLargeError", BrotliError, NULL);
+  if (BrotliOutputTooLargeError != NULL) {
+    Py_INCREF(BrotliOutputTooLargeError);
+    PyModule_AddObject(m, "OutputTooLargeError", BrotliOutputTooLargeError);
+  }
+
+  init_crc32_table();
+
   if (PyType_Ready(&brotli_CompressorType) < 0) {
     RETURN_NULL;
   }
   Py_INCREF(&brotli_CompressorType);
   PyModule_AddObject(m, "Compressor", (PyObject *)&brotli_CompressorType);
 
+  if (PyType_Ready(&brotli_DecompressorType) < 0) {
+    RETURN_NULL;
+  }
+  Py_INCREF(&brotli_DecompressorType);
+  PyModule_AddObject(m, "Decompressor", (PyObject *)&brotli_DecompressorType);
+
+  if (PyType_Ready(&brotli_DictionaryType) < 0) {
+    RETURN_NULL;
+  }
+  Py_INCREF(&brotli_DictionaryType);
+  PyModule_AddObject(m, "Dictionary", (PyObject *)&brotli_DictionaryType);
+
   PyModule_AddIntConstant(m, "MODE_GENERIC", (int) BROTLI_MODE_GENERIC);
   PyModule_AddIntConstant(m, "MODE_TEXT", (int) BROTLI_MODE_TEXT);
   PyModule_AddIntConstant(m, "MODE_FONT", (int) BROTLI_MODE_FONT);
@@ -3,9 +3,13 @@
 
 from __future__ import print_function
 import argparse
+import hashlib
+import json
+import multiprocessing
 import sys
 import os
 import platform
+import tempfile
 
 import brotli
 
@@ -17,6 +21,16 @@ DEFAULT_PARAMS = {
     'lgblock': 0,
 }
 
+# size of the buffer used to stream data through the encoder and decoder
+BUFFER_SIZE = 1 << 16
+
+# name of the file, in the top directory, that records what was compressed
+# in recursive mode
+MANIFEST_NAME = '.bro-manifest.json'
+
+# os.replace is atomic on all platforms, but only available on python3.x
+_replace = getattr(os, 'replace', os.rename)
+
 
 def get_binary_stdio(stream):
     """ Return the specified standard input, output or errors stream as a
@@ -46,6 +60,220 @@ def get_binary_stdio(stream):
             return orig_stdio.buffer
 
 
+def compress_stream(infile, outfile, buffer_size=BUFFER_SIZE, **params):
+    """ Compress 'infile' into 'outfile' in chunks of 'buffer_size' bytes,
+    read into a single reused buffer.
+    """
+    compressor = brotli.Compressor(**params)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        length = infile.readinto(buffer)
+        if not length:
+            break
+        outfile.write(compressor.process(view[:length]))
+    outfile.write(compressor.finish())
+
+
+def decompress_stream(infile, outfile, buffer_size=BUFFER_SIZE,
+                      dictionary=''):
+    """ Decompress 'infile' into 'outfile' in chunks of 'buffer_size' bytes,
+    read into a single reused buffer. The decompressed output is produced in
+    chunks of at most 'buffer_size' bytes as well.
+    """
+    decompressor = brotli.Decompressor(dictionary=dictionary)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        length = infile.readinto(buffer)
+        if not length:
+            break
+        data = view[:length]
+        while True:
+            output = decompressor.process(data, max_length=buffer_size)
+            outfile.write(output)
+            data = decompressor.unconsumed_tail
+            # A full chunk may leave more output buffered in the decoder.
+            if not data and len(output) < buffer_size:
+                break
+    if not decompressor.is_finished():
+        raise brotli.error('Input is truncated')
+
+
+def file_digest(path):
+    """ Return the SHA-256 hex digest of the contents of file 'path'. """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_atomic(path, write):
+    """ Call 'write' with a temporary file in the directory of 'path', then
+    move it over 'path', so that readers never see a partial file.
+    """
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory or '.', prefix='.' + name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            write(outfile)
+        _replace(temp_path, path)
+    except:
+        os.unlink(temp_path)
+        raise
+
+
+# encoder parameters of the recursive mode worker processes
+_worker_params = None
+
+
+def _init_worker(params):
+    global _worker_params
+    _worker_params = params
+
+
+def _compress_tree_file(task):
+    """ Compress file 'path' into its '.br' sibling in a worker process,
+    unless its contents still have the 'expected_digest'.
+
+    Return (path, digest, compressed, error message).
+    """
+    path, expected_digest = task
+
+    def write(outfile):
+        with open(path, 'rb') as infile:
+            compress_stream(infile, outfile, **_worker_params)
+
+    try:
+        digest = file_digest(path)
+        if digest == expected_digest and os.path.isfile(path + '.br'):
+            return path, digest, False, None
+        write_atomic(path + '.br', write)
+        return path, digest, True, None
+    except (brotli.error, EnvironmentError) as e:
+        return path, None, False, str(e)
+
+
+def _load_manifest(path):
+    try:
+        with open(path, 'r') as manifest_file:
+            return json.load(manifest_file).get('files', {})
+    except (EnvironmentError, ValueError, AttributeError):
+        # A missing or broken manifest only costs a full run.
+        return {}
+
+
+def compress_tree(root, jobs=None, manifest=None, **params):
+    """ Compress every file under directory 'root' into a '.br' sibling,
+    using 'jobs' worker processes (all CPUs by default).
+
+    A manifest of (path, size, mtime, content digest, params) is kept in
+    file 'manifest' (MANIFEST_NAME in 'root' by default). Files with the same
+    size and mtime as recorded, or with the same contents, are skipped as
+    long as their '.br' file exists and 'params' did not change.
+
+    Return a (compressed, skipped, errors) tuple, where 'errors' is a list of
+    (path, message) pairs.
+    """
+    manifest = manifest or os.path.join(root, MANIFEST_NAME)
+    # The dictionary is recorded by digest only.
+    recorded_params = dict(params)
+    if recorded_params.pop('dictionary', None):
+        recorded_params['dictionary'] = hashlib.sha256(
+            params['dictionary']).hexdigest()
+    old_files = _load_manifest(manifest)
+    files = {}
+    tasks = []
+    stats = {}
+    skipped = 0
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(directory, name)
+            if (name.endswith('.br') or
+                    os.path.abspath(path) == os.path.abspath(manifest) or
+                    os.path.islink(path) or not os.path.isfile(path)):
+                continue
+            key = os.path.relpath(path, root).replace(os.sep, '/')
+            stat = os.stat(path)
+            entry = old_files.get(key)
+            if entry is not None and entry.get('params') != recorded_params:
+                entry = None
+            if (entry is not None and entry.get('size') == stat.st_size and
+                    entry.get('mtime') == stat.st_mtime and
+                    os.path.isfile(path + '.br')):
+                files[key] = entry
+                skipped += 1
+                continue
+            tasks.append((path, entry and entry.get('digest')))
+            stats[path] = (key, stat)
+
+    compressed = 0
+    errors = []
+    if jobs == 1:
+        _init_worker(params)
+        results = map(_compress_tree_file, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (params,))
+        results = pool.imap_unordered(_compress_tree_file, tasks)
+    try:
+        for path, digest, was_compressed, error in results:
+            if error is not None:
+                errors.append((path, error))
+                continue
+            key, stat = stats[path]
+            files[key] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'digest': digest,
+                'params': recorded_params,
+            }
+            if was_compressed:
+                compressed += 1
+            else:
+                skipped += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        def write(manifest_file):
+            manifest_file.write(json.dumps(
+                {'version': 1, 'files': files}, indent=1,
+                sort_keys=True).encode('utf-8'))
+
+        write_atomic(manifest, write)
+
+    return compressed, skipped, errors
+
+
+def read_samples(paths):
+    """ Read the sample files for dictionary training. Directories in 'paths'
+    contribute every regular file under them, except for '.br' files and
+    manifests.
+    """
+    samples = []
+    for path in paths:
+        if not os.path.isdir(path):
+            with open(path, 'rb') as infile:
+                samples.append(infile.read())
+            continue
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                sample_path = os.path.join(directory, name)
+                if (name.endswith('.br') or name == MANIFEST_NAME or
+                        os.path.islink(sample_path) or
+                        not os.path.isfile(sample_path)):
+                    continue
+                with open(sample_path, 'rb') as infile:
+                    samples.append(infile.read())
+    return samples
+
+
 def main(args=None):
 
     parser = argparse.ArgumentParser(
@@ -80,6 +308,37 @@ def main(args=None):
         action='store_true',
         help='Decompress input file',
         default=False)
+    parser.add_argument(
+        '-r',
+        '--recursive',
+        metavar='DIR',
+        type=str,
+        dest='directory',
+        help='Compress every file under DIR into a .br file next to it, '
+        'skipping files unchanged since the last run',
+        default=None)
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        metavar='N',
+        type=int,
+        help='Number of worker processes in recursive mode. Defaults to the '
+        'number of CPUs.',
+        default=None)
+    parser.add_argument(
+        '--train',
+        metavar='PATH',
+        type=str,
+        nargs='+',
+        help='Train a custom dictionary on the sample files PATH, or on '
+        'every file under directories PATH, and write it to the output',
+        default=None)
+    parser.add_argument(
+        '--dictionary-size',
+        metavar='SIZE',
+        type=int,
+        help='Maximum size of a trained dictionary. Defaults to 65536.',
+        default=1 << 16)
     params = parser.add_argument_group('optional encoder parameters')
     params.add_argument(
         '-m',
@@ -126,19 +385,40 @@ def main(args=None):
 
     options = parser.parse_args(args=args)
 
-    if options.infile:
+    if options.directory:
+        if options.decompress or options.infile or options.outfile:
+            parser.error('-r can not be combined with -d, -i or -o')
+        if not os.path.isdir(options.directory):
+            parser.error('directory "%s" not found' % options.directory)
+        if options.jobs is not None and options.jobs < 1:
+            parser.error('-j must be at least 1')
+
+    if options.train:
+        if options.decompress or options.infile or options.directory:
+            parser.error('--train can not be combined with -d, -i or -r')
+        for path in options.train:
+            if not os.path.exists(path):
+                parser.error('file "%s" not found' % path)
+        if options.dictionary_size < 1:
+            parser.error('--dictionary-size must be at least 1')
+
+    # Recursive mode and training do not read from infile; recursive mode
+    # does not write to outfile either.
+    if options.train or options.directory:
+        infile = None
+    elif options.infile:
         if not os.path.isfile(options.infile):
             parser.error('file "%s" not found' % options.infile)
-        with open(options.infile, 'rb') as infile:
-            data = infile.read()
+        infile = open(options.infile, 'rb')
     else:
         if sys.stdin.isatty():
             # interactive console, just quit
             parser.error('no input')
         infile = get_binary_stdio('stdin')
-        data = infile.read()
 
-    if options.outfile:
+    if options.directory:
+        outfile = None
+    elif options.outfile:
         if os.path.isfile(options.outfile) and not options.force:
             parser.error('output file exists')
         outfile = open(options.outfile, 'wb')
@@ -153,12 +433,38 @@ def main(args=None):
     else:
         custom_dictionary = ''
 
+    if options.train:
+        try:
+            outfile.write(brotli.train_dictionary(
+                read_samples(options.train), size=options.dictionary_size))
+        except brotli.error as e:
+            parser.exit(1, 'bro: error: %s' % e)
+        finally:
+            outfile.close()
+        return
+
+    if options.directory:
+        _, _, errors = compress_tree(
+            options.directory,
+            jobs=options.jobs,
+            mode=options.mode,
+            quality=options.quality,
+            lgwin=options.lgwin,
+            lgblock=options.lgblock,
+            dictionary=custom_dictionary)
+        for path, message in errors:
+            print('bro: error: %s: %s' % (message, path), file=sys.stderr)
+        if errors:
+            parser.exit(1)
+        return
+
     try:
         if options.decompress:
-            data = brotli.decompress(data, dictionary=custom_dictionary)
+            decompress_stream(infile, outfile, dictionary=custom_dictionary)
         else:
-            data = brotli.compress(
-                data,
+            compress_stream(
+                infile,
+                outfile,
                 mode=options.mode,
                 quality=options.quality,
                 lgwin=options.lgwin,
@@ -167,9 +473,9 @@ def main(args=None):
     except brotli.error as e:
         parser.exit(1,
                     'bro: error: %s: %s' % (e, options.infile or 'sys.stdin'))
-
-    outfile.write(data)
-    outfile.close()
+    finally:
+        infile.close()
+        outfile.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,597 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+"""Functions to compress and decompress data using the Brotli library."""
+
+import bisect
+import io
+import struct
+
+import _brotli
+
+
+# The library version.
+__version__ = _brotli.__version__
+
+# The compression mode.
+MODE_GENERIC = _brotli.MODE_GENERIC
+MODE_TEXT = _brotli.MODE_TEXT
+MODE_FONT = _brotli.MODE_FONT
+
+# The Dictionary object.
+Dictionary = _brotli.Dictionary
+
+# The Compressor object.
+Compressor = _brotli.Compressor
+
+# Compress a byte string.
+compress = _brotli.compress
+
+# Free the encoder instances kept by "compress" for reuse.
+clear_encoder_pool = _brotli.clear_encoder_pool
+
+# The Decompressor object.
+Decompressor = _brotli.Decompressor
+
+# Decompress a compressed byte string.
+decompress = _brotli.decompress
+
+# Decompress a compressed byte string into a writable buffer.
+decompress_into = _brotli.decompress_into
+
+# Find the decompressed size of a compressed byte string.
+decompressed_size = _brotli.decompressed_size
+
+# Check that compressed data decodes, without keeping the output.
+verify = _brotli.verify
+
+# Compress a sequence of byte strings on several threads.
+compress_many = _brotli.compress_many
+
+# Decompress a sequence of compressed byte strings on several threads.
+decompress_many = _brotli.decompress_many
+
+# Train a custom dictionary on a set of samples.
+train_dictionary = _brotli.train_dictionary
+
+# Raised if compression or decompression fails.
+error = _brotli.error
+
+# Raised if decompressed data exceeds "max_output_size".
+OutputTooLargeError = _brotli.OutputTooLargeError
+
+# The framed format splits the input into frames that are compressed as
+# independent Brotli streams, so that they can be processed in parallel.
+# All integers are little-endian:
+#
+#   framed := MAGIC frame* end
+#   frame  := compressed_size:u32 uncompressed_size:u32 data[compressed_size]
+#   end    := 0:u32 0:u32
+#
+# Frame data is a complete Brotli stream; a frame is never empty, so a zero
+# compressed size marks the end.
+#
+# A seekable stream is a framed stream followed by an index of the frames:
+#
+#   index := entry[count + 1] count:u32 INDEX_MAGIC
+#   entry := compressed_offset:u64 uncompressed_offset:u64
+#
+# Entries point at the frame headers, in order; the last one points at the end
+# marker and holds the total uncompressed size.
+_FRAMED_MAGIC = b'\xceBRF'
+_FRAME_HEADER = struct.Struct('<II')
+_MAX_FRAME_SIZE = 1 << 30
+_INDEX_MAGIC = b'\xceBRI'
+_INDEX_ENTRY = struct.Struct('<QQ')
+_INDEX_FOOTER = struct.Struct('<I4s')
+
+
+def _parse_frames(data):
+    """Returns the (offset, compressed size, uncompressed size) of each frame
+    of a framed stream, and the position right after its end marker."""
+    view = memoryview(data)
+    if view[:len(_FRAMED_MAGIC)].tobytes() != _FRAMED_MAGIC:
+        raise error('Invalid framed stream header')
+    frames = []
+    position = len(_FRAMED_MAGIC)
+    while True:
+        if len(view) - position < _FRAME_HEADER.size:
+            raise error('Truncated framed stream')
+        compressed_size, uncompressed_size = _FRAME_HEADER.unpack_from(
+            view, position)
+        position += _FRAME_HEADER.size
+        if compressed_size == 0:
+            return frames, position
+        if len(view) - position < compressed_size:
+            raise error('Truncated framed stream')
+        frames.append((position, compressed_size, uncompressed_size))
+        position += compressed_size
+
+
+def _parse_index_footer(footer):
+    """Returns the size of the index ending with the given footer bytes."""
+    count, magic = _INDEX_FOOTER.unpack(footer)
+    if magic != _INDEX_MAGIC:
+        raise error('Invalid seekable stream index')
+    return (count + 1) * _INDEX_ENTRY.size + _INDEX_FOOTER.size
+
+
+def compress_framed(string, frame_size=1 << 22, threads=0, **kwargs):
+    """Compress a byte string into the framed format, using several threads.
+
+    Args:
+      string (bytes): The input data.
+      frame_size (int, optional): Amount of input data in each frame. Smaller
+        frames give more parallelism at the cost of compression ratio. Range
+        is 1 to 2**30. Defaults to 4 MiB.
+      threads (int, optional): Number of threads to use. If set to 0, the
+        number of CPUs is used. Defaults to 0.
+      **kwargs: Same as for "compress"; applied to every frame.
+
+    Returns:
+      The framed compressed byte string.
+
+    Raises:
+      brotli.error: If arguments are invalid, or compressor fails.
+    """
+    if not 0 < frame_size <= _MAX_FRAME_SIZE:
+        raise error('Invalid frame_size. Range is 1 to 2**30.')
+    view = memoryview(string)
+    frames = [view[i:i + frame_size] for i in range(0, len(view), frame_size)]
+    chunks = [_FRAMED_MAGIC]
+    for frame, output in zip(frames,
+                             compress_many(frames, threads=threads, **kwargs)):
+        if isinstance(output, error):
+            raise output
+        chunks.append(_FRAME_HEADER.pack(len(output), len(frame)))
+        chunks.append(output)
+    chunks.append(_FRAME_HEADER.pack(0, 0))
+    return b''.join(chunks)
+
+
+def decompress_framed(string, threads=0, dictionary=b''):
+    """Decompress a framed compressed byte string, using several threads.
+
+    Args:
+      string (bytes): The framed compressed input data.
+      threads (int, optional): Number of threads to use. If set to 0, the
+        number of CPUs is used. Defaults to 0.
+      dictionary (bytes or Dictionary, optional): Custom dictionary. MUST be
+        the same data as passed to compress method.
+
+    Returns:
+      The decompressed byte string.
+
+    Raises:
+      brotli.error: If the input is not a valid framed stream, or
+        decompressor fails.
+    """
+    view = memoryview(string)
+    frames, end = _parse_frames(view)
+    if end != len(view):
+        # Seekable streams carry an index after the end marker.
+        if (len(view) - end < _INDEX_FOOTER.size or
+            _parse_index_footer(view[-_INDEX_FOOTER.size:].tobytes()) !=
+                len(view) - end):
+            raise error('Garbage after the end of the framed stream')
+    outputs = decompress_many(
+        [view[offset:offset + size] for offset, size, _ in frames],
+        threads=threads, dictionary=dictionary)
+    for (_, _, uncompressed_size), output in zip(frames, outputs):
+        if isinstance(output, error):
+            raise output
+        if len(output) != uncompressed_size:
+            raise error('Frame size does not match its header')
+    return b''.join(outputs)
+
+
+class SeekableWriter(io.BufferedIOBase):
+    """Writes a seekable stream to a binary file object.
+
+    Data is compressed in frames of "frame_size" bytes; frames that fill up
+    during a single "write" call are compressed in parallel. The index is
+    written by "close", which does not close the underlying file object.
+
+    Args:
+      fileobj (file): The binary file object to write to.
+      frame_size (int, optional): Amount of input data in each frame. Smaller
+        frames make random access cheaper at the cost of compression ratio.
+        Range is 1 to 2**30. Defaults to 1 MiB.
+      threads (int, optional): Number of threads to use. If set to 0, the
+        number of CPUs is used. Defaults to 0.
+      **kwargs: Same as for "compress"; applied to every frame.
+
+    Raises:
+      brotli.error: If arguments are invalid, or compressor fails.
+    """
+
+    def __init__(self, fileobj, frame_size=1 << 20, threads=0, **kwargs):
+        if not 0 < frame_size <= _MAX_FRAME_SIZE:
+            raise error('Invalid frame_size. Range is 1 to 2**30.')
+        self._fileobj = fileobj
+        self._frame_size = frame_size
+        self._threads = threads
+        self._kwargs = kwargs
+        self._buffer = bytearray()
+        self._index = []
+        self._compressed_position = len(_FRAMED_MAGIC)
+        self._uncompressed_position = 0
+        fileobj.write(_FRAMED_MAGIC)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        length = len(memoryview(data))
+        self._buffer += data
+        if len(self._buffer) >= self._frame_size:
+            self._write_frames(len(self._buffer) -
+                               len(self._buffer) % self._frame_size)
+        return length
+
+    def _write_frames(self, size):
+        frames = [self._buffer[i:i + self._frame_size]
+                  for i in range(0, size, self._frame_size)]
+        outputs = compress_many(frames, threads=self._threads, **self._kwargs)
+        for frame, output in zip(frames, outputs):
+            if isinstance(output, error):
+                raise output
+            self._index.append(
+                (self._compressed_position, self._uncompressed_position))
+            self._fileobj.write(_FRAME_HEADER.pack(len(output), len(frame)))
+            self._fileobj.write(output)
+            self._compressed_position += _FRAME_HEADER.size + len(output)
+            self._uncompressed_position += len(frame)
+        del self._buffer[:size]
+
+    def flush(self):
+        """Flushes the underlying file object. Data that does not fill a
+        frame yet stays buffered until more data is written or "close"."""
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        self._fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._write_frames(len(self._buffer))
+            self._index.append(
+                (self._compressed_position, self._uncompressed_position))
+            chunks = [_FRAME_HEADER.pack(0, 0)]
+            chunks.extend(_INDEX_ENTRY.pack(*entry) for entry in self._index)
+            chunks.append(
+                _INDEX_FOOTER.pack(len(self._index) - 1, _INDEX_MAGIC))
+            self._fileobj.write(b''.join(chunks))
+            self._fileobj.flush()
+        finally:
+            super(SeekableWriter, self).close()
+
+
+class SeekableReader(io.BufferedIOBase):
+    """Reads a seekable stream from a seekable binary file object.
+
+    Only the frames that cover the requested data are read and decompressed,
+    so "seek" and short "read" calls are cheap anywhere in the stream. The
+    most recently decompressed frame is kept for subsequent reads. Closing
+    the reader does not close the underlying file object.
+
+    Args:
+      fileobj (file): The seekable binary file object to read from.
+      dictionary (bytes or Dictionary, optional): Custom dictionary. MUST be
+        the same data as passed to compress method.
+
+    Raises:
+      brotli.error: If the input is not a valid seekable stream.
+    """
+
+    def __init__(self, fileobj, dictionary=b''):
+        self._fileobj = fileobj
+        self._dictionary = dictionary
+        fileobj.seek(0, io.SEEK_END)
+        file_size = fileobj.tell()
+        if file_size < _INDEX_FOOTER.size:
+            raise error('Invalid seekable stream index')
+        fileobj.seek(file_size - _INDEX_FOOTER.size)
+        index_size = _parse_index_footer(fileobj.read(_INDEX_FOOTER.size))
+        if file_size < len(_FRAMED_MAGIC) + index_size:
+            raise error('Invalid seekable stream index')
+        fileobj.seek(file_size - index_size)
+        index = fileobj.read(index_size - _INDEX_FOOTER.size)
+        entries = [_INDEX_ENTRY.unpack_from(index, i)
+                   for i in range(0, len(index), _INDEX_ENTRY.size)]
+        self._compressed_offsets = [entry[0] for entry in entries]
+        self._uncompressed_offsets = [entry[1] for entry in entries]
+        self._size = self._uncompressed_offsets[-1]
+        self._position = 0
+        self._frame = None
+        self._frame_data = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError('Invalid whence ({}, should be 0, 1 or 2)'.format(
+                whence))
+        if position < 0:
+            raise ValueError('Negative seek position {}'.format(position))
+        self._position = position
+        return position
+
+    def _load_frame(self, frame):
+        if frame == self._frame:
+            return self._frame_data
+        self._fileobj.seek(self._compressed_offsets[frame])
+        header = self._fileobj.read(_FRAME_HEADER.size)
+        if len(header) != _FRAME_HEADER.size:
+            raise error('Truncated seekable stream')
+        compressed_size, uncompressed_size = _FRAME_HEADER.unpack(header)
+        expected_size = (self._uncompressed_offsets[frame + 1] -
+                         self._uncompressed_offsets[frame])
+        if (compressed_size == 0 or uncompressed_size == 0 or
+                uncompressed_size != expected_size):
+            raise error('Frame does not match the seekable stream index')
+        # Stop decoding a corrupt frame as soon as it exceeds its size.
+        try:
+            data = decompress(self._fileobj.read(compressed_size),
+                              dictionary=self._dictionary,
+                              max_output_size=uncompressed_size)
+        except OutputTooLargeError:
+            data = None
+        if data is None or len(data) != uncompressed_size:
+            raise error('Frame size does not match its header')
+        self._frame = frame
+        self._frame_data = data
+        return data
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if size is None or size < 0:
+            size = self._size
+        chunks = []
+        while size > 0 and self._position < self._size:
+            frame = bisect.bisect_right(
+                self._uncompressed_offsets, self._position) - 1
+            data = self._load_frame(frame)
+            start = self._position - self._uncompressed_offsets[frame]
+            chunk = data[start:start + size]
+            chunks.append(chunk)
+            self._position += len(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    read1 = read
+
+    def readinto(self, b):
+        data = self.read(len(memoryview(b)))
+        memoryview(b)[:len(data)] = data
+        return len(data)
+
+
+class _DecompressReader(io.RawIOBase):
+    """Raw stream that decompresses a binary file object on demand."""
+
+    def __init__(self, fileobj, read_size, dictionary):
+        self._fileobj = fileobj
+        self._read_size = read_size
+        self._decompressor = Decompressor(dictionary=dictionary)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b)
+        if not len(view):
+            return 0
+        while not self._decompressor.is_finished():
+            # Drain the output the decoder already holds before reading on.
+            data = self._decompressor.process(
+                self._decompressor.unconsumed_tail, max_length=len(view))
+            if not data:
+                compressed = self._fileobj.read(self._read_size)
+                if not compressed:
+                    raise error('Compressed file ended before the end of '
+                                'the stream was reached')
+                data = self._decompressor.process(
+                    compressed, max_length=len(view))
+            if data:
+                view[:len(data)] = data
+                return len(data)
+        if self._fileobj.read(1):
+            raise error('Garbage after the end of the compressed stream')
+        return 0
+
+
+class BrotliFile(io.BufferedIOBase):
+    """A file object that compresses or decompresses a Brotli stream.
+
+    Reading and writing go through a "Decompressor" or "Compressor" in chunks
+    of "buffer_size" bytes, so memory use does not depend on the size of the
+    stream. Like "gzip.GzipFile", the class supports the usual buffered I/O
+    methods, including "readinto", "readline" and iteration over lines.
+
+    Args:
+      filename (str or file): The name of the file to open, or a binary file
+        object to read from or write to. A file object is not closed by
+        "close".
+      mode (str, optional): One of 'rb', 'wb' or 'xb'; the 'b' can be
+        omitted. Defaults to 'rb'. There is no append mode: a Brotli stream
+        can not be continued once finished, and a second stream written
+        after it would be rejected as trailing garbage when reading.
+      buffer_size (int, optional): Size of the internal buffers for data read
+        from or written to the file. Defaults to io.DEFAULT_BUFFER_SIZE.
+      dictionary (bytes or Dictionary, optional): Custom dictionary.
+      **kwargs: Same as for "Compressor"; only valid for writing.
+
+    Raises:
+      brotli.error: If arguments are invalid.
+    """
+
+    def __init__(self, filename, mode='rb', buffer_size=io.DEFAULT_BUFFER_SIZE,
+                 dictionary=b'', **kwargs):
+        if mode not in ('r', 'rb', 'w', 'wb', 'x', 'xb'):
+            raise ValueError('Invalid mode: {!r}'.format(mode))
+        if buffer_size <= 0:
+            raise ValueError('Invalid buffer_size: {!r}'.format(buffer_size))
+        self._reading = mode.startswith('r')
+        if self._reading and kwargs:
+            raise error('Compression parameters are only valid for writing')
+        if hasattr(filename, 'read') or hasattr(filename, 'write'):
+            self._fileobj = filename
+            self._owns_fileobj = False
+        else:
+            self._fileobj = io.open(filename, mode[0] + 'b')
+            self._owns_fileobj = True
+        self._buffer_size = buffer_size
+        try:
+            if self._reading:
+                self._buffer = io.BufferedReader(
+                    _DecompressReader(self._fileobj, buffer_size, dictionary),
+                    buffer_size)
+            else:
+                self._compressor = Compressor(dictionary=dictionary, **kwargs)
+                self._pending = bytearray()
+        except:
+            if self._owns_fileobj:
+                self._fileobj.close()
+            raise
+
+    def _check_can_read(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if not self._reading:
+            raise io.UnsupportedOperation('File not open for reading')
+
+    def _check_can_write(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if self._reading:
+            raise io.UnsupportedOperation('File not open for writing')
+
+    def readable(self):
+        return not self.closed and self._reading
+
+    def writable(self):
+        return not self.closed and not self._reading
+
+    def seekable(self):
+        return False
+
+    def fileno(self):
+        return self._fileobj.fileno()
+
+    def read(self, size=-1):
+        self._check_can_read()
+        return self._buffer.read(size)
+
+    def read1(self, size=-1):
+        self._check_can_read()
+        return self._buffer.read1(size)
+
+    def readinto(self, b):
+        self._check_can_read()
+        return self._buffer.readinto(b)
+
+    def readline(self, size=-1):
+        self._check_can_read()
+        return self._buffer.readline(size)
+
+    def peek(self, size=0):
+        self._check_can_read()
+        return self._buffer.peek(size)
+
+    def write(self, data):
+        self._check_can_write()
+        length = len(memoryview(data))
+        self._pending += data
+        if len(self._pending) >= self._buffer_size:
+            self._fileobj.write(self._compressor.process(self._pending))
+            del self._pending[:]
+        return length
+
+    def flush(self):
+        """Writes out all data written so far, so that it can be decompressed
+        without waiting for the end of the stream."""
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if not self._reading and self._compressor is not None:
+            self._fileobj.write(self._compressor.process(self._pending))
+            del self._pending[:]
+            self._fileobj.write(self._compressor.flush())
+            self._fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._reading:
+                self._buffer.close()
+            else:
+                self._fileobj.write(self._compressor.process(self._pending))
+                self._fileobj.write(self._compressor.finish())
+                del self._pending[:]
+        finally:
+            try:
+                if self._owns_fileobj:
+                    self._fileobj.close()
+            finally:
+                self._compressor = None
+                super(BrotliFile, self).close()
+
+
+def open(filename, mode='rb', buffer_size=io.DEFAULT_BUFFER_SIZE,
+         dictionary=b'', encoding=None, errors=None, newline=None, **kwargs):
+    """Open a Brotli compressed file in binary or text mode.
+
+    Args:
+      filename (str or file): The name of the file to open, or a file object
+        to read from or write to.
+      mode (str, optional): One of 'rb', 'wb' or 'xb' for binary mode, or
+        'rt', 'wt' or 'xt' for text mode. Defaults to 'rb'.
+      buffer_size (int, optional): Size of the internal buffers. Defaults to
+        io.DEFAULT_BUFFER_SIZE.
+      dictionary (bytes or Dictionary, optional): Custom dictionary.
+      encoding, errors, newline (str, optional): Same as for "io.open"; only
+        valid in text mode.
+      **kwargs: Same as for "Compressor"; only valid for writing.
+
+    Returns:
+      A "BrotliFile" in binary mode, or an "io.TextIOWrapper" around it in
+      text mode.
+
+    Raises:
+      brotli.error: If arguments are invalid.
+    """
+    if 't' in mode:
+        if 'b' in mode:
+            raise ValueError('Invalid mode: {!r}'.format(mode))
+    elif encoding is not None or errors is not None or newline is not None:
+        raise ValueError('Text options are only valid in text mode')
+    binary_file = BrotliFile(filename, mode.replace('t', ''), buffer_size,
+                             dictionary, **kwargs)
+    if 't' in mode:
+        return io.TextIOWrapper(binary_file, encoding, errors, newline)
+    return binary_file
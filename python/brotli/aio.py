@@ -0,0 +1,323 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+"""Asynchronous adapters for the Brotli compressor and decompressor.
+
+Calls that may do a lot of work are processed in an executor. The native code
+releases the GIL while it works, so the event loop keeps running meanwhile.
+Calls that are known to be cheap, less than "inline_threshold" bytes of work,
+are processed on the event loop thread, where a thread hop would cost more
+than the work itself.
+
+The work of a call does not follow from the size of its argument: the
+encoder compresses a whole block on the call that fills its buffer, and the
+output of the decoder depends on the compression ratio. So the compressor
+counts all input not flushed yet and always offloads at high qualities, and
+the decompressor only runs calls inline whose output is bounded by
+"max_length", estimating the rest from the ratio seen so far.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import os
+
+import brotli
+
+# Calls doing less work than this are processed on the event loop thread.
+INLINE_THRESHOLD = 1 << 16
+
+# From this quality on, the compressor always runs in the executor; even a
+# small block takes many milliseconds.
+OFFLOAD_QUALITY = 10
+
+# The input size at which the stream adapters read and decompress.
+READ_SIZE = 1 << 16
+
+_default_executor = None
+
+
+def _get_running_loop():
+    """Returns the event loop of the running coroutine."""
+    try:
+        return asyncio.get_running_loop()
+    except AttributeError:
+        # Python < 3.7.
+        return asyncio.get_event_loop()
+
+
+def _get_default_executor():
+    """Returns the shared executor, with one worker per CPU."""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 1)
+    return _default_executor
+
+
+class _Adapter(object):
+    """Serializes calls to a native object, running large ones in an
+    executor. Each object has at most one call in flight, so the executor
+    queue is bounded by the number of live objects."""
+
+    def __init__(self, executor, inline_threshold):
+        self._executor = executor
+        self._inline_threshold = inline_threshold
+        self._lock = asyncio.Lock()
+
+    async def _call(self, work, method, *args, **kwargs):
+        """Calls "method", inline if "work" (an estimate of the bytes it
+        processes, or None if unknown) is below the inline threshold."""
+        await self._lock.acquire()
+        if work is not None and work < self._inline_threshold:
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._lock.release()
+        loop = _get_running_loop()
+        future = loop.run_in_executor(
+            self._executor or _get_default_executor(),
+            functools.partial(method, *args, **kwargs))
+        # The native object stays busy until the job is done, even if the
+        # caller is cancelled; only then can the next call start.
+        future.add_done_callback(lambda _: self._lock.release())
+        return await asyncio.shield(future)
+
+
+class Compressor(_Adapter):
+    """An asynchronous version of "brotli.Compressor".
+
+    Args:
+      executor (concurrent.futures.Executor, optional): The executor for
+        large calls. Defaults to a shared pool with one thread per CPU.
+      inline_threshold (int, optional): Calls are processed on the event
+        loop thread while the input not flushed yet, including the current
+        chunk, is smaller than this. From quality 10 on, calls always go
+        to the executor. Defaults to 64 KiB.
+      **kwargs: Same as for "brotli.Compressor".
+
+    Raises:
+      brotli.error: If arguments are invalid.
+    """
+
+    def __init__(self, executor=None, inline_threshold=INLINE_THRESHOLD,
+                 **kwargs):
+        super(Compressor, self).__init__(executor, inline_threshold)
+        self._compressor = brotli.Compressor(**kwargs)
+        quality = kwargs.get('quality')
+        if quality is None:
+            dictionary = kwargs.get('dictionary')
+            quality = (dictionary.quality
+                       if isinstance(dictionary, brotli.Dictionary) else 11)
+        self._offload = quality >= OFFLOAD_QUALITY
+        # Input not flushed yet. Any call may compress all of it: the one
+        # that fills the input block, "flush" and "finish".
+        self._pending = 0
+
+    def _work(self):
+        return None if self._offload else self._pending
+
+    async def process(self, string):
+        """Same as "brotli.Compressor.process"."""
+        self._pending += len(memoryview(string))
+        return await self._call(self._work(), self._compressor.process,
+                                string)
+
+    async def flush(self):
+        """Same as "brotli.Compressor.flush"."""
+        work, self._pending = self._work(), 0
+        return await self._call(work, self._compressor.flush)
+
+    async def finish(self):
+        """Same as "brotli.Compressor.finish"."""
+        work, self._pending = self._work(), 0
+        return await self._call(work, self._compressor.finish)
+
+    def stats(self):
+        """Same as "brotli.Compressor.stats"."""
+        return self._compressor.stats()
+
+
+class Decompressor(_Adapter):
+    """An asynchronous version of "brotli.Decompressor".
+
+    Args:
+      executor (concurrent.futures.Executor, optional): The executor for
+        large calls. Defaults to a shared pool with one thread per CPU.
+      inline_threshold (int, optional): Calls with a "max_length" below
+        this are processed on the event loop thread if their output,
+        estimated from the compression ratio so far, is smaller than this
+        too. Unbounded calls, and calls before the first output, always go
+        to the executor. Defaults to 64 KiB.
+      dictionary (bytes or Dictionary, optional): Custom dictionary.
+      max_output_size (int, optional): Maximum total size of the
+        decompressed stream; see "brotli.Decompressor".
+
+    Raises:
+      brotli.error: If arguments are invalid.
+    """
+
+    def __init__(self, executor=None, inline_threshold=INLINE_THRESHOLD,
+                 dictionary=b'', max_output_size=0):
+        super(Decompressor, self).__init__(executor, inline_threshold)
+        self._decompressor = brotli.Decompressor(
+            dictionary=dictionary, max_output_size=max_output_size)
+        # Totals for the compression ratio.
+        self._total_in = 0
+        self._total_out = 0
+
+    @property
+    def unconsumed_tail(self):
+        """Same as "brotli.Decompressor.unconsumed_tail"."""
+        return self._decompressor.unconsumed_tail
+
+    def is_finished(self):
+        """Same as "brotli.Decompressor.is_finished"."""
+        return self._decompressor.is_finished()
+
+    def stats(self):
+        """Same as "brotli.Decompressor.stats"."""
+        return self._decompressor.stats()
+
+    def _expected_output(self, size, max_length):
+        """Estimates the output of decompressing "size" more bytes, or
+        returns None if it is unbounded or unknown."""
+        # Without "max_length" a few bytes may expand to any size.
+        if not max_length or (size and not self._total_out):
+            return None
+        # The decoder may decode ahead of the output it returns.
+        ratio = self._total_out / max(self._total_in, 1)
+        return max(max_length, int(size * ratio))
+
+    async def process(self, string, max_length=0):
+        """Same as "brotli.Decompressor.process"."""
+        size = len(memoryview(string))
+        data = await self._call(self._expected_output(size, max_length),
+                                self._decompressor.process, string,
+                                max_length=max_length)
+        self._total_in += size - len(self._decompressor.unconsumed_tail)
+        self._total_out += len(data)
+        return data
+
+
+class StreamWriter(object):
+    """Compresses data into an "asyncio.StreamWriter".
+
+    Every "write" waits for the underlying writer to drain, so a slow peer
+    slows down the producer instead of growing the transport buffer.
+    "close" finishes the Brotli stream but leaves the underlying writer open.
+
+    Args:
+      writer (asyncio.StreamWriter): The writer for the compressed data.
+      **kwargs: Same as for "Compressor".
+
+    Raises:
+      brotli.error: If arguments are invalid.
+    """
+
+    def __init__(self, writer, **kwargs):
+        self._writer = writer
+        self._compressor = Compressor(**kwargs)
+
+    async def _send(self, data):
+        if data:
+            self._writer.write(data)
+            await self._writer.drain()
+
+    async def write(self, data):
+        await self._send(await self._compressor.process(data))
+
+    async def flush(self):
+        """Sends all data written so far, so that the peer can decompress it
+        without waiting for the end of the stream."""
+        await self._send(await self._compressor.flush())
+
+    async def close(self):
+        await self._send(await self._compressor.finish())
+
+
+class StreamReader(object):
+    """Decompresses data from an "asyncio.StreamReader".
+
+    Compressed data is only read as decompressed data is consumed, and each
+    call decompresses a bounded amount of output, so a fast peer can not
+    make the reader buffer an unbounded amount of data.
+
+    Args:
+      reader (asyncio.StreamReader): The reader of the compressed data.
+      read_size (int, optional): Amount of data read from "reader" and
+        decompressed at a time. Defaults to 64 KiB.
+      **kwargs: Same as for "Decompressor".
+
+    Raises:
+      brotli.error: If arguments are invalid.
+    """
+
+    def __init__(self, reader, read_size=READ_SIZE, **kwargs):
+        self._reader = reader
+        self._read_size = read_size
+        self._decompressor = Decompressor(**kwargs)
+        self._buffer = bytearray()
+
+    async def _fill(self, size):
+        """Decompresses up to "size" more bytes into the buffer. Returns
+        False at the end of the stream."""
+        while not self._decompressor.is_finished():
+            # Drain the output the decoder already holds before reading on.
+            data = await self._decompressor.process(
+                self._decompressor.unconsumed_tail, max_length=size)
+            if not data:
+                compressed = await self._reader.read(self._read_size)
+                if not compressed:
+                    raise brotli.error('Compressed stream ended before the '
+                                       'end of the stream was reached')
+                data = await self._decompressor.process(
+                    compressed, max_length=size)
+            if data:
+                self._buffer += data
+                return True
+        if await self._reader.read(1):
+            raise brotli.error('Garbage after the end of the compressed stream')
+        return False
+
+    def _take(self, size):
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def at_eof(self):
+        """Returns True if the stream is finished and the buffer is empty."""
+        return self._decompressor.is_finished() and not self._buffer
+
+    async def read(self, n=-1):
+        """Reads up to "n" bytes; all data up to the end of the stream if "n"
+        is negative. Returns an empty bytes object at the end."""
+        if n < 0:
+            while await self._fill(self._read_size):
+                pass
+            return self._take(len(self._buffer))
+        if not self._buffer and n:
+            await self._fill(n)
+        return self._take(n)
+
+    async def readline(self):
+        """Reads one line, including the trailing newline if present."""
+        start = 0
+        while True:
+            end = self._buffer.find(b'\n', start)
+            if end >= 0:
+                return self._take(end + 1)
+            start = len(self._buffer)
+            if not await self._fill(self._read_size):
+                return self._take(len(self._buffer))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await self.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
@@ -0,0 +1,413 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+"""Benchmark of the Brotli extension.
+
+Measures compression and decompression speed, compression ratio and peak
+memory for every combination of quality, lgwin and mode, on the given files
+and writes the results as JSON. Without files, the "tests/testdata" corpus of
+the source tree is used; an installed package has no such corpus, so files
+must be given:
+
+  python -m brotli.bench -q 1,5,9-11 --lgwin 22 -o new.json [FILE ...]
+
+Two result files are compared with:
+
+  python -m brotli.bench --compare old.json new.json
+
+which lists the significant changes, and exits with status 1 if any of them
+is a regression.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import argparse
+import ctypes
+import json
+import math
+import os
+import platform
+import re
+import sys
+import time
+
+import brotli
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# The corpus used when no files are given; only present in the source tree.
+TESTDATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'tests',
+    'testdata')
+
+QUALITIES = list(range(0, 12))
+LGWINS = list(range(10, 25))
+MODES = [brotli.MODE_GENERIC, brotli.MODE_TEXT, brotli.MODE_FONT]
+
+# Each timed sample repeats the operation for at least this many seconds, so
+# that timer resolution does not matter for small files.
+MIN_TIME = 0.01
+
+# Format version of the result files.
+VERSION = 1
+
+_METRICS = ('compress', 'decompress')
+
+
+def testdata_paths():
+    """Returns the uncompressed, non-empty files of "tests/testdata"."""
+    if not os.path.isdir(TESTDATA_DIR):
+        return []
+    paths = []
+    for name in sorted(os.listdir(TESTDATA_DIR)):
+        path = os.path.join(TESTDATA_DIR, name)
+        if ('.compressed' not in name and os.path.isfile(path) and
+                os.path.getsize(path)):
+            paths.append(path)
+    return paths
+
+
+class _PeakMemory(object):
+    """Measures the peak resident memory of a block of code, on top of the
+    memory in use when it starts. Relies on Linux to reset the "VmHWM" high
+    water mark; "peak" is None elsewhere.
+
+    Memory freed by earlier runs is returned to the system first (glibc
+    only); otherwise the block would reuse it without growing the RSS.
+    """
+
+    _CLEAR_REFS = '/proc/self/clear_refs'
+    _STATUS = '/proc/self/status'
+
+    def _read_status(self, key):
+        with open(self._STATUS) as status:
+            match = re.search(r'^%s:\s+(\d+) kB' % key, status.read(), re.M)
+        return int(match.group(1)) * 1024
+
+    def __enter__(self):
+        self.peak = None
+        try:
+            ctypes.CDLL(None).malloc_trim(0)
+        except (AttributeError, EnvironmentError, TypeError):
+            pass
+        try:
+            with open(self._CLEAR_REFS, 'w') as clear_refs:
+                clear_refs.write('5')
+            self._base = self._read_status('VmRSS')
+        except (EnvironmentError, AttributeError):
+            self._base = None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._base is not None:
+            self.peak = max(0, self._read_status('VmHWM') - self._base)
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def _mean_and_variance(values):
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, 0.0
+    return mean, sum((v - mean)**2 for v in values) / (len(values) - 1)
+
+
+def _measure(function, warmup, repeat, min_time):
+    """Returns "repeat" timings of one call of "function", in seconds."""
+    number = 1
+    for _ in range(warmup):
+        start = _clock()
+        function()
+        elapsed = _clock() - start
+        if elapsed < min_time:
+            number = max(number, int(math.ceil(min_time / max(elapsed, 1e-9))))
+    times = []
+    for _ in range(repeat):
+        start = _clock()
+        for _ in range(number):
+            function()
+        times.append((_clock() - start) / number)
+    return times
+
+
+def bench_file(path, quality, lgwin, mode, warmup=1, repeat=5,
+               min_time=MIN_TIME):
+    """Benchmarks one file with one set of encoder parameters.
+
+    Args:
+      path (str): The file to compress.
+      quality, lgwin, mode (int): Same as for "brotli.compress".
+      warmup (int, optional): Untimed runs before the timed ones.
+      repeat (int, optional): Number of timed samples.
+      min_time (float, optional): Minimum duration of a sample, in seconds.
+
+    Returns:
+      A dict with the sizes, the timings ("compress_times" and
+      "decompress_times", in seconds), the median speeds in MB/s and the
+      peak memory of compression and decompression in bytes (None if it
+      can not be measured).
+    """
+    with open(path, 'rb') as in_file:
+        data = in_file.read()
+    params = dict(quality=quality, lgwin=lgwin, mode=mode)
+    compressed = brotli.compress(data, **params)
+    if brotli.decompress(compressed) != data:
+        raise brotli.error('Roundtrip failed for %s' % path)
+
+    result = {
+        'file': os.path.basename(path),
+        'size': len(data),
+        'compressed_size': len(compressed),
+        'ratio': len(data) / max(len(compressed), 1),
+    }
+    result.update(params)
+    result['compress_times'] = _measure(
+        lambda: brotli.compress(data, **params), warmup, repeat, min_time)
+    result['decompress_times'] = _measure(
+        lambda: brotli.decompress(compressed), warmup, repeat, min_time)
+    for metric in _METRICS:
+        result[metric + '_mb_per_s'] = (
+            len(data) / 1e6 / _median(result[metric + '_times']))
+
+    # Measure a cold encoder, not one kept warm by the timed runs.
+    brotli.clear_encoder_pool()
+    with _PeakMemory() as memory:
+        brotli.compress(data, **params)
+    result['compress_peak_memory'] = memory.peak
+    with _PeakMemory() as memory:
+        brotli.decompress(compressed)
+    result['decompress_peak_memory'] = memory.peak
+    return result
+
+
+def run(paths, qualities=QUALITIES, lgwins=LGWINS, modes=MODES, warmup=1,
+        repeat=5, min_time=MIN_TIME, log=None):
+    """Benchmarks every file with every combination of parameters.
+
+    Args:
+      paths (list of str): The files to compress.
+      qualities, lgwins, modes (list of int): The parameter values.
+      warmup, repeat, min_time: Same as for "bench_file".
+      log (file, optional): Where to print a line per result.
+
+    Returns:
+      The results as a JSON-serializable dict.
+    """
+    results = []
+    for path in paths:
+        for quality in qualities:
+            for lgwin in lgwins:
+                for mode in modes:
+                    result = bench_file(path, quality, lgwin, mode,
+                                        warmup=warmup, repeat=repeat,
+                                        min_time=min_time)
+                    results.append(result)
+                    if log is not None:
+                        print('%s q=%d lgwin=%d mode=%d: ratio %.3f, '
+                              'compress %.2f MB/s, decompress %.2f MB/s' %
+                              (result['file'], quality, lgwin, mode,
+                               result['ratio'], result['compress_mb_per_s'],
+                               result['decompress_mb_per_s']), file=log)
+    return {
+        'version': VERSION,
+        'brotli_version': brotli.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'warmup': warmup,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def _key(result):
+    return (result['file'], result['size'], result['quality'],
+            result['lgwin'], result['mode'])
+
+
+def compare(old, new, threshold=0.05, sigma=2.0):
+    """Compares two sets of results of "run".
+
+    A speed change is significant if the medians differ by more than
+    "threshold" (relative) and the means by more than "sigma" standard errors.
+    Changes of the compressed size and of the peak memory are significant if
+    they exceed "threshold".
+
+    Returns:
+      A list of dicts with "file", "size", "quality", "lgwin", "mode",
+      "metric", "old", "new", "change" (relative) and "regression" (bool).
+    """
+    old_results = dict((_key(r), r) for r in old['results'])
+    changes = []
+
+    def add(result, metric, old_value, new_value, regression):
+        change = dict(zip(('file', 'size', 'quality', 'lgwin', 'mode'),
+                          _key(result)))
+        change.update(metric=metric, old=old_value, new=new_value,
+                      change=new_value / old_value - 1, regression=regression)
+        changes.append(change)
+
+    for result in new['results']:
+        old_result = old_results.get(_key(result))
+        if old_result is None:
+            continue
+        for metric in _METRICS:
+            old_speeds = [result['size'] / t for t in
+                          old_result[metric + '_times'] if t > 0]
+            new_speeds = [result['size'] / t for t in
+                          result[metric + '_times'] if t > 0]
+            if not old_speeds or not new_speeds:
+                continue
+            old_median, new_median = _median(old_speeds), _median(new_speeds)
+            old_mean, old_variance = _mean_and_variance(old_speeds)
+            new_mean, new_variance = _mean_and_variance(new_speeds)
+            error = math.sqrt(old_variance / len(old_speeds) +
+                              new_variance / len(new_speeds))
+            if (abs(new_median / old_median - 1) > threshold and
+                    abs(new_mean - old_mean) > sigma * error):
+                add(result, metric + '_mb_per_s', old_median / 1e6,
+                    new_median / 1e6, new_median < old_median)
+        for metric in ('compressed_size', 'compress_peak_memory',
+                       'decompress_peak_memory'):
+            old_value, new_value = old_result[metric], result[metric]
+            if not old_value or new_value is None:
+                continue
+            if abs(new_value / old_value - 1) > threshold:
+                add(result, metric, old_value, new_value,
+                    new_value > old_value)
+    return changes
+
+
+def _parse_values(text):
+    """Parses a list like "1,5,9-11"."""
+    values = []
+    try:
+        for part in text.split(','):
+            first, _, last = part.partition('-')
+            values.extend(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid list "%s"' % text)
+    return values
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m brotli.bench',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        'files',
+        metavar='FILE',
+        nargs='*',
+        help='Files to compress. Defaults to the tests/testdata corpus of '
+        'the source tree, if present.')
+    parser.add_argument(
+        '-q',
+        '--quality',
+        metavar='LIST',
+        type=_parse_values,
+        default=QUALITIES,
+        help='Qualities, e.g. "1,5,9-11". Defaults to 0-11.')
+    parser.add_argument(
+        '--lgwin',
+        metavar='LIST',
+        type=_parse_values,
+        default=LGWINS,
+        help='Window sizes. Defaults to 10-24.')
+    parser.add_argument(
+        '-m',
+        '--mode',
+        metavar='LIST',
+        type=_parse_values,
+        default=MODES,
+        help='Modes. Defaults to 0-2.')
+    parser.add_argument(
+        '--warmup',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Untimed runs before the timed ones. Defaults to 1.')
+    parser.add_argument(
+        '--repeat',
+        metavar='N',
+        type=int,
+        default=5,
+        help='Number of timed runs. Defaults to 5.')
+    parser.add_argument(
+        '-o',
+        '--output',
+        metavar='FILE',
+        help='Output file for the JSON results. Defaults to stdout.')
+    parser.add_argument(
+        '--compare',
+        metavar='FILE',
+        nargs=2,
+        help='Compare two result files instead of running the benchmark.')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.05,
+        help='Smallest relative change reported by --compare. '
+        'Defaults to 0.05.')
+    parser.add_argument(
+        '--sigma',
+        type=float,
+        default=2.0,
+        help='Smallest speed change reported by --compare, in standard '
+        'errors. Defaults to 2.')
+    options = parser.parse_args(args=args)
+
+    if options.compare:
+        results = []
+        for path in options.compare:
+            with open(path) as result_file:
+                results.append(json.load(result_file))
+        changes = compare(results[0], results[1], threshold=options.threshold,
+                          sigma=options.sigma)
+        for change in changes:
+            print('%s %s q=%d lgwin=%d mode=%d %s: %.6g -> %.6g (%+.1f%%)' %
+                  ('REGRESSION' if change['regression'] else 'improvement',
+                   change['file'], change['quality'], change['lgwin'],
+                   change['mode'], change['metric'], change['old'],
+                   change['new'], change['change'] * 100))
+        if not changes:
+            print('No significant changes.')
+        if any(change['regression'] for change in changes):
+            parser.exit(1)
+        return
+
+    if options.warmup < 1 or options.repeat < 1:
+        parser.error('--warmup and --repeat must be at least 1')
+    if options.files:
+        paths = options.files
+    elif os.path.isdir(TESTDATA_DIR):
+        paths = testdata_paths()
+    else:
+        parser.error('no files given, and the default corpus %s does not '
+                     'exist (it is only part of the source tree)' %
+                     os.path.normpath(TESTDATA_DIR))
+    if not paths:
+        parser.error('no files to compress')
+    try:
+        results = run(paths, qualities=options.quality, lgwins=options.lgwin,
+                      modes=options.mode, warmup=options.warmup,
+                      repeat=options.repeat, log=sys.stderr)
+    except brotli.error as e:
+        parser.exit(1, 'bench: error: %s\n' % e)
+    output = json.dumps(results, indent=1, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
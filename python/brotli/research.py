@@ -0,0 +1,436 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+"""Backward reference analysis, as done by the tools in "research/".
+
+Results are returned as NumPy arrays if NumPy is installed, and as
+"array.array" objects otherwise; both share the same memory layout, so
+"numpy.asarray" converts the latter without a copy.
+
+The "*.dist" file functions and the images drawn from them need NumPy.
+Files are memory-mapped and histograms are built a chunk at a time, so the
+input size is only limited by the disk. From the command line:
+
+  python -m brotli.research histogram input.dist SIZE output.pgm
+  python -m brotli.research diff image1.pgm image2.pgm diff.ppm
+"""
+
+from __future__ import division
+import argparse
+import os
+import re
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import _brotli
+
+# Number of "*.dist" records binned at a time.
+CHUNK_SIZE = 1 << 22
+
+# Record layouts of "*.dist" files, see "research/README.md": position and
+# distance pairs, each one optionally preceded by its copy length.
+_DIST_LAYOUT = {
+    'names': ['flag', 'position', 'distance'],
+    'formats': ['u1', 'i4', 'i4'],
+    'offsets': [0, 1, 5],
+    'itemsize': 9,
+}
+_DIST_LAYOUT_WITH_COPIES = {
+    'names': ['flag', 'length', 'position', 'distance'],
+    'formats': ['u1', 'i4', 'i4', 'i4'],
+    'offsets': [5, 1, 6, 10],
+    'itemsize': 14,
+}
+# Offsets and values of the flag bytes that identify each layout.
+_DIST_FLAGS = (
+    (_DIST_LAYOUT, ((0, 1),)),
+    (_DIST_LAYOUT_WITH_COPIES, ((0, 0), (5, 1))),
+)
+_COPY_RECORD = struct.Struct('=Bi')
+_REFERENCE_RECORD = struct.Struct('=Bii')
+
+_PGM_HEADER = re.compile(br'P([56])\s+(\d+)\s+(\d+)\s+(\d+)\s')
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('NumPy is required for "*.dist" files and images')
+
+
+def find_opt_references(data, min_length=1, skip=1):
+    """Finds the longest backward reference for each position of "data".
+
+    This is the simple mode of "research/find_opt_references". When two
+    earlier positions give a match of the same length, the one whose suffix
+    sorts first is used, as the tool does.
+
+    The suffix array is built on a single thread; a single call does not use
+    more than one CPU. The GIL is released while it is built, so several
+    inputs can be analyzed at the same time from different threads.
+
+    Args:
+      data (bytes): The input data.
+      min_length (int, optional): Shorter references are left out. Defaults
+        to 1.
+      skip (int, optional): References at positions below this are left
+        out. Defaults to 1.
+
+    Returns:
+      A (positions, distances, lengths) tuple of int32 arrays with one entry
+      per reference, ordered by position.
+
+    Raises:
+      brotli.error: If arguments are invalid.
+    """
+    references = _brotli.find_opt_references(data, min_length=min_length,
+                                             skip=skip)
+    if numpy is None:
+        return references
+    return tuple(numpy.frombuffer(values, dtype=numpy.int32)
+                 for values in references)
+
+
+def _has_flags(raw, itemsize, flags):
+    """Checks the flag bytes of every record, a chunk at a time."""
+    if len(raw) % itemsize:
+        return False
+    step = CHUNK_SIZE * itemsize
+    for start in range(0, len(raw), step):
+        chunk = raw[start:start + step]
+        for offset, value in flags:
+            if not numpy.all(chunk[offset::itemsize] == value):
+                return False
+    return True
+
+
+def _parse_dist(raw):
+    """Reads records one at a time, for files that mix both layouts."""
+    data = raw.tobytes()
+    records = []
+    offset = 0
+    length = -1
+    while offset < len(data):
+        flag = data[offset:offset + 1]
+        if flag == b'\x00' and offset + _COPY_RECORD.size <= len(data):
+            _, length = _COPY_RECORD.unpack_from(data, offset)
+            offset += _COPY_RECORD.size
+        elif flag == b'\x01' and offset + _REFERENCE_RECORD.size <= len(data):
+            _, position, distance = _REFERENCE_RECORD.unpack_from(data, offset)
+            offset += _REFERENCE_RECORD.size
+            records.append((1, length, position, distance))
+            length = -1
+        else:
+            raise ValueError('Corrupt "*.dist" file at offset %d' % offset)
+    return numpy.array(records, dtype=numpy.dtype(
+        list(zip(_DIST_LAYOUT_WITH_COPIES['names'],
+                 _DIST_LAYOUT_WITH_COPIES['formats']))))
+
+
+def read_dist(path):
+    """Reads the backward references of a "*.dist" file.
+
+    Files with a single layout, i.e. all references with or all without copy
+    lengths, are memory-mapped, and the result is a view of the file. Files
+    that mix both are parsed record by record, which is much slower.
+
+    Args:
+      path (str): The "*.dist" file.
+
+    Returns:
+      A structured array with "flag", "position" and "distance" fields, and
+      a "length" field if the file has copy lengths; missing lengths are -1.
+      Standalone copy lengths are left out.
+
+    Raises:
+      ImportError: If NumPy is not installed.
+      ValueError: If the file is corrupt.
+    """
+    _require_numpy()
+    if not os.path.getsize(path):
+        return numpy.zeros(0, dtype=numpy.dtype(_DIST_LAYOUT))
+    raw = numpy.memmap(path, dtype=numpy.uint8, mode='r')
+    for layout, flags in _DIST_FLAGS:
+        if _has_flags(raw, layout['itemsize'], flags):
+            return numpy.ndarray(shape=(len(raw) // layout['itemsize'],),
+                                 dtype=numpy.dtype(layout), buffer=raw)
+    return _parse_dist(raw)
+
+
+def _distance_transform(distance, linear):
+    if linear:
+        return distance
+    # Using log^2 scale because log scale produces big white gap at the
+    # bottom of the image.
+    with numpy.errstate(divide='ignore'):
+        return numpy.log(distance) ** 2
+
+
+def _add(histogram, width, rows, columns, counts):
+    histogram += numpy.bincount(
+        rows * width + columns, weights=counts,
+        minlength=histogram.size).astype(numpy.int64)
+
+
+def dist_histogram(records, size, height=1000, width=8000, min_distance=0,
+                   max_distance=1 << 30, brotli_window=None, linear=False,
+                   skip=0, with_copies=False):
+    """Counts backward references by position and distance.
+
+    This is "research/draw_histogram" without the drawing. Records are binned
+    CHUNK_SIZE at a time.
+
+    Args:
+      records (numpy.ndarray): References, as returned by "read_dist".
+      size (int): The size of the original file.
+      height (int, optional): The number of distance bins. Defaults to 1000.
+      width (int, optional): The number of position bins. Defaults to 8000.
+      min_distance, max_distance (int, optional): The range of distances
+        counted. Defaults to all distances below 2**30.
+      brotli_window (int, optional): If set, positions are relative to a
+        Brotli window with this many bits, and wrap around.
+      linear (bool, optional): Map distances linearly instead of on a
+        squared log scale. Defaults to False.
+      skip (int, optional): The number of bytes to skip at the start.
+      with_copies (bool, optional): Count every byte of a copy instead of
+        one per reference. Needs copy lengths. Defaults to False.
+
+    Returns:
+      An int64 array of shape (height, width); row 0 holds the shortest
+      distances.
+
+    Raises:
+      ImportError: If NumPy is not installed.
+      ValueError: If "with_copies" is set but there are no copy lengths.
+    """
+    _require_numpy()
+    if with_copies and 'length' not in records.dtype.names:
+        raise ValueError('The references have no copy lengths')
+    histogram = numpy.zeros(height * width, dtype=numpy.int64)
+    # Copies spanning whole columns are added as differences along rows.
+    spans = numpy.zeros((height, width + 1), dtype=numpy.int64)
+    max_pos = size - skip
+    min_dist = _distance_transform(min_distance, linear) if min_distance else 0
+    max_dist = _distance_transform(max_distance, linear) - min_dist
+    offset = 0
+    last = 0
+
+    for start in range(0, len(records), CHUNK_SIZE):
+        chunk = records[start:start + CHUNK_SIZE]
+        pos = chunk['position'].astype(numpy.int64)
+        distance = chunk['distance'].astype(numpy.int64)
+        keep = ((pos != -1) & (distance >= min_distance) &
+                (distance < max_distance))
+        pos = pos[keep]
+        distance = distance[keep]
+        if with_copies:
+            copy = chunk['length'][keep].astype(numpy.int64)
+        if brotli_window is not None and len(pos):
+            wraps = numpy.cumsum(numpy.diff(pos, prepend=last) < 0)
+            last = pos[-1]
+            pos = pos + (offset + wraps) * (1 << brotli_window)
+            offset += wraps[-1]
+
+        valid = (pos >= skip) & (distance <= pos)
+        pos = pos[valid] - skip
+        distance = distance[valid]
+        if with_copies:
+            copy = copy[valid]
+        # References beyond the end of the image end the scan.
+        beyond = numpy.flatnonzero(pos >= max_pos)
+        end = beyond[0] if len(beyond) else len(pos)
+        pos = pos[:end]
+        distance = distance[:end]
+
+        dist = _distance_transform(distance.astype(numpy.float64), linear)
+        x = numpy.floor((dist - min_dist) / max_dist * height + 0.5)
+        x = numpy.clip(x, 0, height - 1).astype(numpy.int64)
+        y = pos * width // max_pos
+        if not with_copies:
+            _add(histogram, width, x, y, None)
+        else:
+            copy = copy[:end]
+            right = (pos + copy - 1) * width // max_pos
+            same = y == right
+            _add(histogram, width, x[same], y[same], copy[same])
+            x, y, pos, copy, right = (
+                v[~same] for v in (x, y, pos, copy, right))
+            first = numpy.ceil((y + 1) * max_pos / width).astype(numpy.int64)
+            _add(histogram, width, x, y, first - pos)
+            inner = y + 1 < numpy.minimum(right, width)
+            numpy.add.at(spans, (x[inner], y[inner] + 1), max_pos // width)
+            numpy.add.at(spans, (x[inner], numpy.minimum(right, width)[inner]),
+                         -(max_pos // width))
+            last_column = right < width
+            x, pos, copy, right = (
+                v[last_column] for v in (x, pos, copy, right))
+            begin = numpy.ceil(right * max_pos / width).astype(numpy.int64)
+            _add(histogram, width, x, right, pos + copy - begin)
+        if len(beyond):
+            break
+
+    histogram = histogram.reshape(height, width)
+    histogram += numpy.cumsum(spans, axis=1)[:, :width]
+    return histogram
+
+
+def histogram_image(histogram, simple=False):
+    """Converts a histogram to a grayscale image, darker for more references.
+
+    Args:
+      histogram (numpy.ndarray): As returned by "dist_histogram".
+      simple (bool, optional): Use only black and white pixels. Defaults to
+        False.
+
+    Returns:
+      A uint8 array with the shortest distances in the bottom row, as
+      drawn by "write_pgm".
+    """
+    _require_numpy()
+    if simple:
+        pixels = numpy.where(histogram > 0, 0, 255)
+    else:
+        maximum = histogram.max() if histogram.size else 0
+        density = histogram / maximum * 255 if maximum else histogram * 0.0
+        # Mapping pixel density on arc function to increase contrast.
+        pixels = 255 - numpy.sqrt(255 * 255 - (255 - density) ** 2)
+    return pixels[::-1].astype(numpy.uint8)
+
+
+def diff_image(image1, image2):
+    """Draws the difference of two grayscale images, as "research/draw_diff".
+
+    Pixels darker in "image2" are red, pixels darker in "image1" are green.
+
+    Args:
+      image1, image2 (numpy.ndarray): uint8 images of the same shape.
+
+    Returns:
+      A (pixels, maxval) tuple, where "pixels" is a uint8 RGB array and
+      "maxval" the maximum color value, as needed by "write_ppm".
+
+    Raises:
+      ValueError: If the images have different shapes.
+    """
+    _require_numpy()
+    if image1.shape != image2.shape:
+        raise ValueError('Images must have the same size')
+    image1 = image1.astype(numpy.int32)
+    image2 = image2.astype(numpy.int32)
+    diff = image1 - image2
+    min_val = numpy.minimum(255 - image1, 255 - image2)
+    maximum = max(-1234, diff.max(), min_val.max())
+    minimum = min(1234, diff.min())
+    maxval = max(-minimum, maximum)
+    base = maxval - numpy.maximum(min_val, numpy.abs(diff))
+    red = diff > 0
+    pixels = numpy.empty(diff.shape + (3,), dtype=numpy.int32)
+    pixels[..., 0] = numpy.where(red, base + diff, base)
+    pixels[..., 1] = numpy.where(red, base, base - diff)
+    pixels[..., 2] = base + min_val
+    return pixels.astype(numpy.uint8), maxval
+
+
+def read_pgm(path):
+    """Reads a binary PGM image with 8-bit pixels.
+
+    Raises:
+      ImportError: If NumPy is not installed.
+      ValueError: If the file is not such an image.
+    """
+    _require_numpy()
+    with open(path, 'rb') as image_file:
+        data = image_file.read()
+    match = _PGM_HEADER.match(data)
+    if not match or match.group(1) != b'5' or match.group(4) != b'255':
+        raise ValueError('Not an 8-bit binary PGM image: %s' % path)
+    width, height = int(match.group(2)), int(match.group(3))
+    if len(data) - match.end() < width * height:
+        raise ValueError('Truncated PGM image: %s' % path)
+    return numpy.frombuffer(data, dtype=numpy.uint8, count=width * height,
+                            offset=match.end()).reshape(height, width)
+
+
+def write_pgm(path, pixels):
+    """Writes a uint8 array as a binary PGM image."""
+    height, width = pixels.shape
+    with open(path, 'wb') as image_file:
+        image_file.write(b'P5\n%d %d\n255\n' % (width, height))
+        image_file.write(numpy.ascontiguousarray(pixels).tobytes())
+
+
+def write_ppm(path, pixels, maxval=255):
+    """Writes a uint8 RGB array as a binary PPM image."""
+    height, width, _ = pixels.shape
+    with open(path, 'wb') as image_file:
+        image_file.write(b'P6\n%d %d\n%d\n' % (width, height, max(maxval, 1)))
+        image_file.write(numpy.ascontiguousarray(pixels).tobytes())
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m brotli.research',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    histogram = commands.add_parser(
+        'histogram', help='Draw the histogram of a "*.dist" file.')
+    histogram.add_argument('input', metavar='DIST')
+    histogram.add_argument('size', metavar='SIZE', type=int,
+                           help='Size of the original file.')
+    histogram.add_argument('output', metavar='PGM')
+    histogram.add_argument('--height', type=int, default=1000)
+    histogram.add_argument('--width', type=int, default=8000)
+    histogram.add_argument('--brotli-window', type=int, default=None,
+                           help='Size of the Brotli window in bits.')
+    histogram.add_argument('--min-distance', type=int, default=0)
+    histogram.add_argument('--max-distance', type=int, default=1 << 30)
+    histogram.add_argument('--with-copies', action='store_true',
+                           help='The input contains copy lengths.')
+    histogram.add_argument('--simple', action='store_true',
+                           help='Use only black and white pixels.')
+    histogram.add_argument('--linear', action='store_true',
+                           help='Map distances linearly.')
+    histogram.add_argument('--skip', type=int, default=0,
+                           help='Number of bytes to skip.')
+    diff = commands.add_parser(
+        'diff', help='Draw the difference of two PGM images.')
+    diff.add_argument('image1', metavar='PGM1')
+    diff.add_argument('image2', metavar='PGM2')
+    diff.add_argument('output', metavar='PPM')
+    options = parser.parse_args(args=args)
+
+    if numpy is None:
+        parser.exit(1, 'research: error: NumPy is not installed\n')
+    try:
+        if options.command == 'histogram':
+            if options.height < 1 or options.width < 1:
+                parser.error('--height and --width must be at least 1')
+            if options.size <= options.skip:
+                parser.error('SIZE must be larger than --skip')
+            counts = dist_histogram(
+                read_dist(options.input), options.size,
+                height=options.height, width=options.width,
+                min_distance=options.min_distance,
+                max_distance=options.max_distance,
+                brotli_window=options.brotli_window, linear=options.linear,
+                skip=options.skip, with_copies=options.with_copies)
+            write_pgm(options.output,
+                      histogram_image(counts, simple=options.simple))
+        elif options.command == 'diff':
+            pixels, maxval = diff_image(read_pgm(options.image1),
+                                        read_pgm(options.image2))
+            write_ppm(options.output, pixels, maxval)
+        else:
+            parser.error('no command')
+    except (IOError, ValueError) as e:
+        parser.exit(1, 'research: error: %s\n' % e)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import asyncio
+import concurrent.futures
+import unittest
+
+from . import _test_utils
+import brotli
+from brotli import aio
+
+
+class _BytesWriter(object):
+    """Collects the data written to a minimal "asyncio.StreamWriter"."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.drains = 0
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        self.drains += 1
+
+
+class _CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+    """Counts the jobs submitted to it."""
+
+    def __init__(self):
+        super(_CountingExecutor, self).__init__(max_workers=1)
+        self.jobs = 0
+
+    def submit(self, *args, **kwargs):
+        self.jobs += 1
+        return super(_CountingExecutor, self).submit(*args, **kwargs)
+
+
+class TestAio(_test_utils.TestCase):
+
+    CHUNK_SIZE = 4096
+    # Send some of the chunks to the executor.
+    INLINE_THRESHOLD = 4000
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        super(TestAio, self).tearDown()
+
+    def _read(self, test_data):
+        with open(test_data, 'rb') as in_file:
+            return in_file.read()
+
+    def _test_compressor(self, test_data):
+        data = self._read(test_data)
+
+        step = self.CHUNK_SIZE
+        chunks = [data[i:i + step] for i in range(0, len(data), step)]
+
+        async def compress_chunks():
+            compressor = aio.Compressor(
+                inline_threshold=self.INLINE_THRESHOLD, quality=5)
+            output = [await compressor.process(chunk) for chunk in chunks]
+            output.append(await compressor.finish())
+            return b''.join(output)
+
+        compressed = self.loop.run_until_complete(compress_chunks())
+        self.assertEqual(brotli.decompress(compressed), data)
+
+    def _test_decompressor(self, test_data):
+        data = self._read(test_data)
+        compressed = brotli.compress(data, quality=5)
+
+        async def decompress():
+            decompressor = aio.Decompressor(
+                inline_threshold=self.INLINE_THRESHOLD)
+            output = []
+            for i in range(0, len(compressed), self.CHUNK_SIZE):
+                output.append(await decompressor.process(
+                    compressed[i:i + self.CHUNK_SIZE]))
+            self.assertTrue(decompressor.is_finished())
+            return b''.join(output)
+
+        self.assertEqual(self.loop.run_until_complete(decompress()), data)
+
+    def _test_streams(self, test_data):
+        data = self._read(test_data)
+
+        async def roundtrip():
+            writer = _BytesWriter()
+            stream_writer = aio.StreamWriter(
+                writer, inline_threshold=self.INLINE_THRESHOLD, quality=5)
+            for i in range(0, len(data), self.CHUNK_SIZE):
+                await stream_writer.write(data[i:i + self.CHUNK_SIZE])
+            await stream_writer.close()
+            self.assertGreater(writer.drains, 0)
+            self.assertEqual(brotli.decompress(bytes(writer.data)), data)
+
+            reader = asyncio.StreamReader()
+            reader.feed_data(bytes(writer.data))
+            reader.feed_eof()
+            stream_reader = aio.StreamReader(
+                reader, read_size=self.CHUNK_SIZE,
+                inline_threshold=self.INLINE_THRESHOLD)
+            lines = [line async for line in stream_reader]
+            self.assertTrue(stream_reader.at_eof())
+            return b''.join(lines)
+
+        self.assertEqual(self.loop.run_until_complete(roundtrip()), data)
+
+    def test_stream_reader_read(self):
+        compressed = brotli.compress(b'abc' * 1000)
+
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(compressed)
+            reader.feed_eof()
+            stream_reader = aio.StreamReader(reader)
+            self.assertEqual(await stream_reader.read(10), b'abcabcabca')
+            self.assertEqual(await stream_reader.read(), b'bc' + b'abc' * 996)
+            self.assertEqual(await stream_reader.read(), b'')
+
+        self.loop.run_until_complete(read())
+
+    def test_stream_reader_truncated(self):
+        compressed = brotli.compress(b'abc' * 1000)
+
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(compressed[:-1])
+            reader.feed_eof()
+            with self.assertRaises(brotli.error):
+                await aio.StreamReader(reader).read()
+
+        self.loop.run_until_complete(read())
+
+    def test_compressor_offload(self):
+        executor = _CountingExecutor()
+
+        async def compress(quality):
+            executor.jobs = 0
+            compressor = aio.Compressor(executor=executor,
+                                        inline_threshold=1000,
+                                        quality=quality)
+            jobs = []
+            for _ in range(4):
+                await compressor.process(b'a' * 300)
+                jobs.append(executor.jobs)
+            await compressor.finish()
+            jobs.append(executor.jobs)
+            return jobs
+
+        try:
+            # The unflushed input counts, not the size of the chunk.
+            self.assertEqual(self.loop.run_until_complete(compress(5)),
+                             [0, 0, 0, 1, 2])
+            self.assertEqual(self.loop.run_until_complete(compress(11)),
+                             [1, 2, 3, 4, 5])
+        finally:
+            executor.shutdown()
+
+    def test_decompressor_offload(self):
+        executor = _CountingExecutor()
+        compressed = brotli.compress(b'abc' * 10000)
+
+        async def decompress():
+            decompressor = aio.Decompressor(executor=executor,
+                                            inline_threshold=1000)
+            # Unbounded output always goes to the executor.
+            await decompressor.process(compressed[:10])
+            self.assertEqual(executor.jobs, 1)
+            output = await decompressor.process(compressed[10:20],
+                                                max_length=100)
+            self.assertEqual(len(output), 100)
+            self.assertEqual(executor.jobs, 2)
+            # Draining bounded output is cheap.
+            await decompressor.process(b'', max_length=100)
+            self.assertEqual(executor.jobs, 2)
+            await decompressor.process(compressed[20:])
+            self.assertEqual(executor.jobs, 3)
+
+        try:
+            self.loop.run_until_complete(decompress())
+        finally:
+            executor.shutdown()
+
+    def test_stream_reader_max_output_size(self):
+        compressed = brotli.compress(b'\0' * (1 << 20))
+
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(compressed)
+            reader.feed_eof()
+            stream_reader = aio.StreamReader(reader, max_output_size=1000)
+            with self.assertRaises(brotli.OutputTooLargeError):
+                await stream_reader.read()
+
+        self.loop.run_until_complete(read())
+
+
+_test_utils.generate_test_methods(TestAio)
+
+if __name__ == '__main__':
+    unittest.main()
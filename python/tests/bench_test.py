@@ -0,0 +1,94 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from . import _test_utils
+from brotli import bench
+
+PYTHON = _test_utils.PYTHON
+TEST_ENV = _test_utils.TEST_ENV
+
+
+class TestBench(_test_utils.TestCase):
+
+    def _test_bench_file(self, test_data):
+        if not os.path.getsize(test_data):
+            return
+        result = bench.bench_file(test_data, 5, 18, 1, repeat=2,
+                                  min_time=0.001)
+        self.assertEqual(result['size'], os.path.getsize(test_data))
+        self.assertEqual(len(result['compress_times']), 2)
+        self.assertEqual(len(result['decompress_times']), 2)
+        self.assertGreater(result['compress_mb_per_s'], 0)
+        self.assertGreater(result['decompress_mb_per_s'], 0)
+        self.assertEqual((result['quality'], result['lgwin'], result['mode']),
+                         (5, 18, 1))
+
+    def _result(self, times, compressed_size=100):
+        return {
+            'results': [{
+                'file': 'f', 'size': 10**6, 'quality': 1, 'lgwin': 22,
+                'mode': 0, 'compressed_size': compressed_size,
+                'compress_times': times, 'decompress_times': [1.0, 1.0, 1.0],
+                'compress_peak_memory': 1000, 'decompress_peak_memory': None,
+            }]
+        }
+
+    def test_compare(self):
+        old = self._result([1.0, 1.01, 0.99])
+        self.assertEqual(bench.compare(old, old), [])
+        # Within the noise.
+        self.assertEqual(bench.compare(old, self._result([1.0, 1.5, 0.7])), [])
+        changes = bench.compare(old, self._result([2.0, 2.02, 1.98], 90))
+        self.assertEqual(
+            sorted((c['metric'], c['regression']) for c in changes),
+            [('compress_mb_per_s', True), ('compressed_size', False)])
+
+    def test_main(self):
+        fd, output = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            args = ['-q', '1,3-4', '--lgwin', '16', '-m', '0', '--repeat',
+                    '2', '-o', output, _test_utils.TESTDATA_PATHS[1]]
+            bench.main(args)
+            with open(output) as output_file:
+                results = json.load(output_file)
+            self.assertEqual([r['quality'] for r in results['results']],
+                             [1, 3, 4])
+            with open(os.devnull, 'wb') as devnull:
+                self.assertEqual(subprocess.call(
+                    [PYTHON, '-m', 'brotli.bench', '--compare', output,
+                     output], stdout=devnull, env=TEST_ENV), 0)
+        finally:
+            os.unlink(output)
+
+    def test_main_without_corpus(self):
+        # Installed packages have no tests/testdata; files must be given.
+        testdata_dir = bench.TESTDATA_DIR
+        bench.TESTDATA_DIR = os.path.join(tempfile.gettempdir(), 'missing')
+        stderr = sys.stderr
+        sys.stderr = io.StringIO() if bytes is not str else io.BytesIO()
+        try:
+            with self.assertRaises(SystemExit) as context:
+                bench.main(['-q', '1'])
+            message = sys.stderr.getvalue()
+        finally:
+            bench.TESTDATA_DIR = testdata_dir
+            sys.stderr = stderr
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn('no files given', message)
+
+
+_test_utils.generate_test_methods(TestBench)
+
+if __name__ == '__main__':
+    unittest.main()
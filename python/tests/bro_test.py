@@ -3,12 +3,20 @@
 # Distributed under MIT license.
 # See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
 
+import os
+import shutil
 import subprocess
+import tempfile
 import unittest
 
 from . import _test_utils
 import brotli
 
+try:
+    import pty
+except ImportError:
+    pty = None
+
 PYTHON = _test_utils.PYTHON
 BRO = _test_utils.BRO
 TEST_ENV = _test_utils.TEST_ENV
@@ -48,6 +56,15 @@ class TestBroDecompress(_test_utils.TestCase):
         self._decompress_pipe(test_data)
         self._check_decompression(test_data)
 
+    def test_decompress_truncated(self):
+        # Streaming decompression has to notice a missing end of stream.
+        compressed = brotli.compress(b'a' * 100000 + b'b' * 100000)
+        process = subprocess.Popen(
+            [PYTHON, BRO, '-d'], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=TEST_ENV)
+        process.communicate(compressed[:-4])
+        self.assertEqual(process.returncode, 1)
+
 
 _test_utils.generate_test_methods(TestBroDecompress, for_decompression=True)
 
@@ -116,5 +133,118 @@ class TestBroCompress(_test_utils.TestCase):
 _test_utils.generate_test_methods(
     TestBroCompress, variants=TestBroCompress.VARIANTS)
 
+
+class TestBroRecursive(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'sub'))
+        for i, test_data in enumerate(_test_utils.TESTDATA_PATHS):
+            directory = self.root if i % 2 else os.path.join(self.root, 'sub')
+            shutil.copy(test_data, directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _originals(self):
+        for directory, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith('.br') and not name.startswith('.'):
+                    yield os.path.join(directory, name)
+
+    def _compress_tree(self, *args):
+        subprocess.check_call(
+            [PYTHON, BRO, '-q', '5', '-r', self.root] + list(args),
+            env=TEST_ENV)
+
+    def test_compress_tree(self):
+        self._compress_tree('-j', '2')
+        originals = list(self._originals())
+        self.assertEqual(len(originals),
+                         len(_test_utils.TESTDATA_PATHS))
+        for path in originals:
+            with open(path, 'rb') as original:
+                with open(path + '.br', 'rb') as compressed:
+                    self.assertEqual(brotli.decompress(compressed.read()),
+                                     original.read())
+        # No temporary files are left behind.
+        names = [n for _, _, filenames in os.walk(self.root) for n in filenames]
+        self.assertEqual(sorted(n for n in names if n.startswith('.')),
+                         ['.bro-manifest.json'])
+
+    @unittest.skipIf(pty is None, 'pty is not available')
+    def test_compress_tree_interactive(self):
+        # Recursive mode does not read stdin, so a terminal there is fine.
+        master, slave = pty.openpty()
+        try:
+            subprocess.check_call(
+                [PYTHON, BRO, '-q', '5', '-r', self.root], stdin=slave,
+                env=TEST_ENV)
+        finally:
+            os.close(slave)
+            os.close(master)
+        for path in self._originals():
+            self.assertTrue(os.path.isfile(path + '.br'))
+
+    def test_skip_unchanged(self):
+        self._compress_tree('-j', '1')
+        originals = sorted(self._originals())
+        # Date the outputs back, to tell the rewritten ones apart.
+        for path in originals:
+            os.utime(path + '.br', (0, 0))
+        changed, touched = originals[:2]
+        with open(changed, 'ab') as original:
+            original.write(b'more data')
+        # A new mtime alone does not trigger compression.
+        stat = os.stat(touched)
+        os.utime(touched, (stat.st_atime, stat.st_mtime + 10))
+
+        self._compress_tree('-j', '1')
+        for path in originals:
+            self.assertEqual(os.stat(path + '.br').st_mtime != 0,
+                             path == changed)
+        with open(changed + '.br', 'rb') as compressed:
+            self.assertTrue(brotli.decompress(compressed.read()).endswith(
+                b'more data'))
+
+        # Other parameters invalidate all the files.
+        subprocess.check_call(
+            [PYTHON, BRO, '-q', '6', '-r', self.root, '-j', '1'], env=TEST_ENV)
+        for path in originals:
+            self.assertNotEqual(os.stat(path + '.br').st_mtime, 0)
+
+    def test_train(self):
+        samples = os.path.join(self.root, 'samples')
+        os.mkdir(samples)
+        for i in range(10):
+            with open(os.path.join(samples, str(i)), 'wb') as sample:
+                sample.write(b'<html><head><title>Page %d</title></head>' % i)
+        dictionary = os.path.join(self.root, 'dictionary')
+        subprocess.check_call(
+            [PYTHON, BRO, '--train', samples, '--dictionary-size', '1000',
+             '-o', dictionary], env=TEST_ENV)
+        with open(dictionary, 'rb') as dictfile:
+            self.assertTrue(0 < len(dictfile.read()) <= 1000)
+        # The dictionary is usable for compression.
+        original = _test_utils.TESTDATA_PATHS[-1]
+        compressed = os.path.join(self.root, 'compressed.br')
+        subprocess.check_call(
+            [PYTHON, BRO, '-i', original, '-o', compressed,
+             '--custom-dictionary', dictionary], env=TEST_ENV)
+        uncompressed = os.path.join(self.root, 'uncompressed')
+        subprocess.check_call(
+            [PYTHON, BRO, '-d', '-i', compressed, '-o', uncompressed,
+             '--custom-dictionary', dictionary], env=TEST_ENV)
+        with open(uncompressed, 'rb') as first, open(original, 'rb') as second:
+            self.assertEqual(first.read(), second.read())
+
+    def test_invalid_arguments(self):
+        with open(os.devnull, 'wb') as devnull:
+            for args in (['-d'], ['-j', '0'], ['--train', self.root]):
+                self.assertEqual(subprocess.call(
+                    [PYTHON, BRO, '-r', self.root] + args, stderr=devnull,
+                    env=TEST_ENV), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,111 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import functools
+import io
+import unittest
+
+from . import _test_utils
+import brotli
+
+
+class TestBrotliFile(_test_utils.TestCase):
+
+    BUFFER_SIZE = 1000
+    CHUNK_SIZE = 333
+
+    def _check_decompression(self, test_data):
+        temp_compressed = _test_utils.get_temp_compressed_name(test_data)
+        with open(temp_compressed, 'rb') as in_file:
+            with open(test_data, 'rb') as original:
+                self.assertEqual(brotli.decompress(in_file.read()),
+                                 original.read())
+
+    def _compress(self, test_data):
+        temp_compressed = _test_utils.get_temp_compressed_name(test_data)
+        with brotli.open(temp_compressed, 'wb', quality=5,
+                         buffer_size=self.BUFFER_SIZE) as out_file:
+            with open(test_data, 'rb') as in_file:
+                read_chunk = functools.partial(in_file.read, self.CHUNK_SIZE)
+                for data in iter(read_chunk, b''):
+                    self.assertEqual(out_file.write(data), len(data))
+
+    def _test_write(self, test_data):
+        self._compress(test_data)
+        self._check_decompression(test_data)
+
+    def _test_read(self, test_data):
+        self._compress(test_data)
+        temp_compressed = _test_utils.get_temp_compressed_name(test_data)
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        with brotli.open(temp_compressed,
+                         buffer_size=self.BUFFER_SIZE) as in_file:
+            self.assertEqual(in_file.read(), data)
+        with brotli.open(temp_compressed,
+                         buffer_size=self.BUFFER_SIZE) as in_file:
+            self.assertEqual(b''.join(in_file), data)
+        with brotli.open(temp_compressed,
+                         buffer_size=self.BUFFER_SIZE) as in_file:
+            output = bytearray(self.CHUNK_SIZE)
+            chunks = []
+            for size in iter(functools.partial(in_file.readinto, output), 0):
+                chunks.append(bytes(output[:size]))
+            self.assertEqual(b''.join(chunks), data)
+
+    def test_file_object(self):
+        out_file = io.BytesIO()
+        with brotli.BrotliFile(out_file, 'wb') as compressed:
+            compressed.write(b'abc')
+            compressed.flush()
+            # Flushed data can be decompressed before the end of the stream.
+            self.assertEqual(
+                brotli.Decompressor().process(out_file.getvalue()), b'abc')
+            compressed.write(b'def')
+        self.assertFalse(out_file.closed)
+        self.assertEqual(brotli.decompress(out_file.getvalue()), b'abcdef')
+
+    def test_text_mode(self):
+        out_file = io.BytesIO()
+        with brotli.open(out_file, 'wt', encoding='utf-8') as text_file:
+            text_file.write(u'first\nsecond\n')
+        in_file = io.BytesIO(out_file.getvalue())
+        with brotli.open(in_file, 'rt', encoding='utf-8') as text_file:
+            self.assertEqual(list(text_file), [u'first\n', u'second\n'])
+
+    def test_truncated(self):
+        compressed = brotli.compress(b'a' * 1000)
+        with brotli.BrotliFile(io.BytesIO(compressed[:-1])) as in_file:
+            with self.assertRaises(brotli.error):
+                in_file.read()
+
+    def test_garbage_appended(self):
+        compressed = brotli.compress(b'a' * 1000)
+        with brotli.BrotliFile(io.BytesIO(compressed + b'a')) as in_file:
+            with self.assertRaises(brotli.error):
+                in_file.read()
+
+    def test_append_mode(self):
+        # Appending would write a second stream, which reading rejects.
+        temp_compressed = _test_utils.get_temp_compressed_name('append')
+        with brotli.open(temp_compressed, 'wb') as out_file:
+            out_file.write(b'abc')
+        for mode in ('a', 'ab', 'at'):
+            with self.assertRaises(ValueError):
+                brotli.open(temp_compressed, mode)
+        with brotli.open(temp_compressed) as in_file:
+            self.assertEqual(in_file.read(), b'abc')
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            brotli.BrotliFile(io.BytesIO(), 'rw')
+        with self.assertRaises(brotli.error):
+            brotli.BrotliFile(io.BytesIO(), 'rb', quality=5)
+
+
+_test_utils.generate_test_methods(TestBrotliFile)
+
+if __name__ == '__main__':
+    unittest.main()
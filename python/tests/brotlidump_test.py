@@ -0,0 +1,130 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import contextlib
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+from . import _test_utils
+import brotli
+
+# research/brotlidump.py is a Python 3 script, not part of the package.
+if sys.version_info >= (3,):
+    sys.path.insert(0, os.path.join(_test_utils.project_dir, 'research'))
+    import brotlidump
+else:
+    brotlidump = None
+
+# Streams with a complex prefix code that uses a single code length code,
+# which brotlidump does not read.
+UNSUPPORTED = ('compressed_repeated', 'mapsdatazrh')
+
+# The text dump is slow; larger streams are only decoded without it.
+MAX_DUMP_SIZE = 65536
+
+
+def _reference_peek(self, n):
+    # BitStream.peek before the buffered window.
+    return int.from_bytes(
+        self.data[self.pos >> 3:self.pos + n + 7 >> 3],
+        'little') >> (self.pos & 7) & (1 << n) - 1
+
+
+@unittest.skipIf(brotlidump is None, 'brotlidump requires Python 3')
+class TestBrotlidump(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # brotlidump reads the static dictionary from "dict" in the current
+        # directory.
+        with open(os.path.join(_test_utils.project_dir, 'common',
+                               'dictionary.c')) as source:
+            text = source.read()
+        start = text.index('kBrotliDictionary[')
+        body = text[text.index('{', start):text.index('};', start)]
+        dictionary = bytes(int(x, 16) for x in re.findall(r'0x[0-9a-f]{2}',
+                                                          body))
+        cls.cwd = os.getcwd()
+        cls.temp_dir = tempfile.mkdtemp()
+        with open(os.path.join(cls.temp_dir, 'dict'), 'wb') as out_file:
+            out_file.write(dictionary)
+        os.chdir(cls.temp_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.temp_dir)
+
+    def _read(self, test_data):
+        name = os.path.splitext(os.path.basename(test_data))[0]
+        if name in UNSUPPORTED:
+            self.skipTest('stream is not supported by brotlidump')
+        with open(test_data, 'rb') as in_file:
+            return in_file.read()
+
+    def _dump(self, data):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            brotlidump.Layout(brotlidump.BitStream(data)).processStream()
+        return output.getvalue()
+
+    def _test_table_decoder(self, test_data):
+        # The lookup tables, the bit window and the bit data cache must not
+        # change the dump.
+        data = self._read(test_data)
+        if len(data) > MAX_DUMP_SIZE:
+            self.skipTest('stream is too large for the text dump')
+        dump = self._dump(data)
+        originals = (brotlidump.PrefixDecoder.decodePeek,
+                     brotlidump.BitStream.peek,
+                     brotlidump.Layout.CACHED_BIT_DATA)
+        brotlidump.PrefixDecoder.decodePeek = (
+            brotlidump.PrefixDecoder.searchPeek)
+        brotlidump.BitStream.peek = _reference_peek
+        brotlidump.Layout.CACHED_BIT_DATA = -1
+        try:
+            self.assertEqual(self._dump(data), dump)
+        finally:
+            (brotlidump.PrefixDecoder.decodePeek,
+             brotlidump.BitStream.peek,
+             brotlidump.Layout.CACHED_BIT_DATA) = originals
+
+    def _test_events_cover_stream(self, test_data):
+        data = self._read(test_data)
+        stream = brotlidump.BitStream(data)
+        events = list(brotlidump.Layout(stream, verbose=False).events())
+        # Nested prefix codes are not counted twice, and only the padding
+        # of the last byte is left out.
+        bits = sum(event['bits'] for event in events)
+        self.assertEqual(bits, stream.pos)
+        self.assertLess(len(data) * 8 - bits, 8)
+
+    def _test_cost_totals(self, test_data):
+        data = self._read(test_data)
+        events = list(brotlidump.Layout(brotlidump.BitStream(data),
+                                        verbose=False).events())
+        rows = brotlidump.metablockCosts(events)
+        self.assertEqual(sum(sum(costs.values()) for _, costs in rows),
+                         sum(event['bits'] for event in events))
+        self.assertEqual(sum(length for length, _ in rows),
+                         len(brotli.decompress(data)))
+        output = io.StringIO()
+        brotlidump.writeCost(events, output)
+        total = output.getvalue().splitlines()[-2].split()
+        self.assertEqual(total[0], 'total')
+        self.assertEqual(int(total[1]), sum(length for length, _ in rows))
+        self.assertEqual(int(total[-1]),
+                         sum(event['bits'] for event in events))
+
+
+_test_utils.generate_test_methods(TestBrotlidump, for_decompression=True)
+
+if __name__ == '__main__':
+    unittest.main()
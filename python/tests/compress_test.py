@@ -9,10 +9,25 @@ from . import _test_utils
 import brotli
 
 
+def _window_bits(compressed):
+    """Decodes the WBITS field of a stream header."""
+    header = bytearray(compressed[:2] + b'\0')
+    bits = header[0] | header[1] << 8
+    if not bits & 1:
+        return 16
+    if bits >> 1 & 7:
+        return 17 + (bits >> 1 & 7)
+    if bits >> 4 & 7:
+        return 8 + (bits >> 4 & 7)
+    return 17
+
+
 class TestCompress(_test_utils.TestCase):
 
     VARIANTS = {'quality': (1, 6, 9, 11), 'lgwin': (10, 15, 20, 24)}
 
+    FRAME_SIZE = 65536
+
     def _check_decompression(self, test_data, **kwargs):
         # Only dictionary is supported as a kwarg to brotli.decompress.
         if 'dictionary' in kwargs:
@@ -38,6 +53,27 @@ class TestCompress(_test_utils.TestCase):
         self._compress(test_data, **kwargs)
         self._check_decompression(test_data, **kwargs)
 
+    def _test_compress_reused_encoder(self, test_data, **kwargs):
+        # Encoders are reused across calls; the output must not depend on
+        # the data compressed before.
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        brotli.compress(data[::-1] * 2, **kwargs)
+        compressor = brotli.Compressor(**kwargs)
+        expected = compressor.process(data) + compressor.finish()
+        self.assertEqual(brotli.compress(data, **kwargs), expected)
+
+    def _test_compress_clear_encoder_pool(self, test_data, **kwargs):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        expected = brotli.compress(data, **kwargs)
+        brotli.clear_encoder_pool()
+        self.assertEqual(brotli.compress(data, **kwargs), expected)
+        # Copies of a prepared dictionary's encoder are not pooled.
+        dictionary = brotli.Dictionary(data[::-1], **kwargs)
+        brotli.compress(data, dictionary=dictionary)
+        self.assertEqual(brotli.compress(data, **kwargs), expected)
+
     def _test_compress_custom_dictionary(self, test_data, **kwargs):
         with open(test_data, 'rb') as in_file:
             dictionary = in_file.read()
@@ -45,6 +81,57 @@ class TestCompress(_test_utils.TestCase):
         self._compress(test_data, **kwargs)
         self._check_decompression(test_data, **kwargs)
 
+    def _test_compress_prepared_dictionary(self, test_data, **kwargs):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        dictionary = brotli.Dictionary(data[::-1], **kwargs)
+        compressed = brotli.compress(data, dictionary=dictionary)
+        # Attaching the prepared dictionary must be equivalent to hashing
+        # the raw dictionary data.
+        compressor = brotli.Compressor(dictionary=data[::-1], **kwargs)
+        self.assertEqual(compressed,
+                         compressor.process(data) + compressor.finish())
+        self.assertEqual(
+            brotli.decompress(compressed, dictionary=dictionary), data)
+
+    def _test_compress_many(self, test_data, **kwargs):
+        # Items are independent streams, each equal to a "compress" call.
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        items = [data, data[::-1], b'', data[:len(data) // 3]]
+        outputs = brotli.compress_many(items, threads=3, **kwargs)
+        self.assertEqual(outputs,
+                         [brotli.compress(item, **kwargs) for item in items])
+
+    def _test_compress_framed(self, test_data, **kwargs):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        compressed = brotli.compress_framed(
+            data, frame_size=self.FRAME_SIZE, threads=2, **kwargs)
+        self.assertEqual(brotli.decompress_framed(compressed), data)
+
+    def test_quality_10_small_window(self):
+        # The window size asked for is the one in the stream header.
+        with open(_test_utils.TESTDATA_PATHS[2], 'rb') as in_file:
+            data = in_file.read()
+        for lgwin in range(10, 25):
+            compressed = brotli.compress(data, quality=10, lgwin=lgwin)
+            self.assertEqual(_window_bits(compressed), lgwin)
+            self.assertEqual(brotli.decompress(compressed), data)
+
+    def test_prepared_dictionary_parameters_mismatch(self):
+        dictionary = brotli.Dictionary(b'abc', quality=5)
+        with self.assertRaises(brotli.error):
+            brotli.compress(b'abc', quality=6, dictionary=dictionary)
+
+    def test_compress_framed_invalid_frame_size(self):
+        with self.assertRaises(brotli.error):
+            brotli.compress_framed(b'abc', frame_size=0)
+
+    def test_compress_many_invalid_threads(self):
+        with self.assertRaises(brotli.error):
+            brotli.compress_many([b'abc'], threads=-1)
+
 
 _test_utils.generate_test_methods(TestCompress, variants=TestCompress.VARIANTS)
 
@@ -36,6 +36,39 @@ class _TestCompressor(object):
             out_file.write(self.compressor.finish())
         self._check_decompression(test_data)
 
+    def _test_single_process_into(self, test_data):
+        # Write single-shot compression through a caller-provided buffer.
+        temp_compressed = _test_utils.get_temp_compressed_name(test_data)
+        with open(temp_compressed, 'wb') as out_file:
+            with open(test_data, 'rb') as in_file:
+                data = in_file.read()
+            output = bytearray(len(data) + 1024)
+            consumed, written = self.compressor.process_into(data, output)
+            self.assertEqual(consumed, len(data))
+            out_file.write(memoryview(output)[:written])
+            out_file.write(self.compressor.finish())
+        self._check_decompression(test_data)
+
+    def _test_process_into_short_buffer(self, test_data):
+        # A full buffer stops processing; the rest of the input goes to the
+        # next call, with a new buffer.
+        # A small window and block size make the compressor emit output
+        # before the end of the input.
+        compressor = brotli.Compressor(quality=self.QUALITY, lgwin=10,
+                                       lgblock=16)
+        temp_compressed = _test_utils.get_temp_compressed_name(test_data)
+        with open(temp_compressed, 'wb') as out_file:
+            with open(test_data, 'rb') as in_file:
+                data = memoryview(in_file.read())
+            output = bytearray(64)
+            while data:
+                consumed, written = compressor.process_into(data, output)
+                self.assertLessEqual(written, len(output))
+                out_file.write(output[:written])
+                data = data[consumed:]
+            out_file.write(compressor.finish())
+        self._check_decompression(test_data)
+
     def _test_multiple_process(self, test_data):
         # Write chunked compression to temp file.
         temp_compressed = _test_utils.get_temp_compressed_name(test_data)
@@ -59,32 +92,107 @@ class _TestCompressor(object):
             out_file.write(self.compressor.finish())
         self._check_decompression(test_data)
 
+    def _test_reset(self, test_data):
+        # Compress the data twice, resetting the compressor in between.
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        first = self.compressor.process(data) + self.compressor.finish()
+        self.compressor.reset()
+        second = self.compressor.process(data) + self.compressor.finish()
+        self.assertEqual(first, second)
+
+    def _test_copy(self, test_data):
+        # Compress two inputs sharing a prefix; the prefix is processed once.
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        middle = len(data) // 2
+        prefix = self.compressor.process(data[:middle])
+        copy = self.compressor.copy()
+        suffixes = [data[middle:], data[middle:][::-1]]
+        outputs = [
+            prefix + compressor.process(suffix) + compressor.finish()
+            for compressor, suffix in zip([self.compressor, copy], suffixes)
+        ]
+        for output, suffix in zip(outputs, suffixes):
+            self.assertEqual(brotli.decompress(output), data[:middle] + suffix)
+
+    def _test_prepared_dictionary(self, test_data):
+        # Compress with a prepared dictionary shared by two compressors.
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        dictionary = brotli.Dictionary(data[::-1], quality=self.QUALITY)
+        outputs = []
+        for _ in range(2):
+            compressor = brotli.Compressor(dictionary=dictionary)
+            outputs.append(compressor.process(data) + compressor.finish())
+        self.assertEqual(outputs[0], outputs[1])
+        decompressor = brotli.Decompressor(dictionary=dictionary)
+        self.assertEqual(decompressor.process(outputs[0]), data)
+
+    def _test_reinit_drops_dictionary(self, test_data):
+        # Calling "__init__" again replaces the dictionary of the previous
+        # call, also for "reset()".
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        expected = brotli.compress(data, quality=self.QUALITY)
+        compressor = brotli.Compressor(
+            dictionary=brotli.Dictionary(data[::-1], quality=self.QUALITY))
+        compressor.__init__(quality=self.QUALITY, dictionary=data[::-1])
+        compressor.__init__(quality=self.QUALITY)
+        compressor.reset()
+        self.assertEqual(compressor.process(data) + compressor.finish(),
+                         expected)
+
+    def _test_stats(self, test_data):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        compressor = brotli.Compressor(quality=self.QUALITY, stats=True)
+        output = compressor.process(data) + compressor.finish()
+        stats = compressor.stats()
+        self.assertEqual(stats['bytes_in'], len(data))
+        self.assertEqual(stats['bytes_out'], len(output))
+        if data:
+            self.assertGreater(stats['metablocks'], 0)
+        self.assertTrue(all(value >= 0 for value in stats.values()))
+        compressor.reset()
+        self.assertEqual(compressor.stats()['bytes_in'], 0)
+        with self.assertRaises(brotli.error):
+            self.compressor.stats()
+
 
 _test_utils.generate_test_methods(_TestCompressor)
 
 
 class TestCompressorQuality1(_TestCompressor, _test_utils.TestCase):
 
+    QUALITY = 1
+
     def setUp(self):
-        self.compressor = brotli.Compressor(quality=1)
+        self.compressor = brotli.Compressor(quality=self.QUALITY)
 
 
 class TestCompressorQuality6(_TestCompressor, _test_utils.TestCase):
 
+    QUALITY = 6
+
     def setUp(self):
-        self.compressor = brotli.Compressor(quality=6)
+        self.compressor = brotli.Compressor(quality=self.QUALITY)
 
 
 class TestCompressorQuality9(_TestCompressor, _test_utils.TestCase):
 
+    QUALITY = 9
+
     def setUp(self):
-        self.compressor = brotli.Compressor(quality=9)
+        self.compressor = brotli.Compressor(quality=self.QUALITY)
 
 
 class TestCompressorQuality11(_TestCompressor, _test_utils.TestCase):
 
+    QUALITY = 11
+
     def setUp(self):
-        self.compressor = brotli.Compressor(quality=11)
+        self.compressor = brotli.Compressor(quality=self.QUALITY)
 
 
 if __name__ == '__main__':
@@ -3,7 +3,10 @@
 # Distributed under MIT license.
 # See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
 
+import io
+import os
 import unittest
+import zlib
 
 from . import _test_utils
 import brotli
@@ -27,10 +30,136 @@ class TestDecompress(_test_utils.TestCase):
             with open(test_data, 'rb') as in_file:
                 out_file.write(brotli.decompress(in_file.read()))
 
+    def _decompress_into(self, test_data):
+        temp_uncompressed = _test_utils.get_temp_uncompressed_name(test_data)
+        output = bytearray(os.path.getsize(_get_original_name(test_data)))
+        with open(test_data, 'rb') as in_file:
+            written = brotli.decompress_into(in_file.read(), output)
+        self.assertEqual(written, len(output))
+        with open(temp_uncompressed, 'wb') as out_file:
+            out_file.write(output)
+
+    def _decompress_many(self, test_data):
+        temp_uncompressed = _test_utils.get_temp_uncompressed_name(test_data)
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        outputs = brotli.decompress_many([data] * 3, threads=2)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        with open(temp_uncompressed, 'wb') as out_file:
+            out_file.write(outputs[0])
+
+    def _test_decompressed_size(self, test_data):
+        with open(test_data, 'rb') as in_file:
+            size = brotli.decompressed_size(in_file.read())
+        self.assertEqual(size, os.path.getsize(_get_original_name(test_data)))
+
+    def _test_verify(self, test_data):
+        with open(_get_original_name(test_data), 'rb') as in_file:
+            original = in_file.read()
+        expected = (len(original), zlib.crc32(original) & 0xFFFFFFFF)
+        with open(test_data, 'rb') as in_file:
+            self.assertEqual(brotli.verify(in_file, checksum=True), expected)
+            in_file.seek(0)
+            self.assertEqual(brotli.verify(in_file.read()),
+                             (len(original), None))
+
     def _test_decompress(self, test_data):
         self._decompress(test_data)
         self._check_decompression(test_data)
 
+    def _test_decompress_into(self, test_data):
+        self._decompress_into(test_data)
+        self._check_decompression(test_data)
+
+    def _test_decompress_many(self, test_data):
+        self._decompress_many(test_data)
+        self._check_decompression(test_data)
+
+    def test_decompress_many_item_errors(self):
+        # A broken item does not abort the rest of the batch.
+        compressed = brotli.compress(b'a' * 10)
+        outputs = brotli.decompress_many(
+            [compressed, b'garbage', compressed + b'a', compressed])
+        self.assertEqual(outputs[0], b'a' * 10)
+        self.assertIsInstance(outputs[1], brotli.error)
+        self.assertIsInstance(outputs[2], brotli.error)
+        self.assertEqual(outputs[3], b'a' * 10)
+
+    def test_decompress_framed_invalid(self):
+        compressed = brotli.compress_framed(b'a' * 100, frame_size=10)
+        self.assertEqual(brotli.decompress_framed(compressed), b'a' * 100)
+        for invalid in (compressed[:-1], compressed + b'a', compressed[1:],
+                        brotli.compress(b'a' * 100)):
+            with self.assertRaises(brotli.error):
+                brotli.decompress_framed(invalid)
+
+    def test_decompressed_size(self):
+        data = b''.join(b'%d,' % i for i in range(100000))
+        compressor = brotli.Compressor(quality=5)
+        streamed = b''.join([compressor.process(data[:1000]), compressor.flush(),
+                             compressor.process(data[1000:]),
+                             compressor.finish()])
+        streams = [brotli.compress(data, quality=quality)
+                   for quality in (0, 1, 5, 11)]
+        streams.append(streamed)
+        # Incompressible data is stored in uncompressed metablocks.
+        streams.append(brotli.compress(os.urandom(100000) + data))
+        for compressed in streams:
+            self.assertEqual(brotli.decompressed_size(compressed),
+                             len(brotli.decompress(compressed)))
+        self.assertEqual(brotli.decompressed_size(brotli.compress(b'')), 0)
+        dictionary = data[:10000]
+        compressed = brotli.compress(data, quality=1, dictionary=dictionary)
+        self.assertEqual(
+            brotli.decompressed_size(compressed, dictionary=dictionary),
+            len(data))
+
+    def test_decompressed_size_invalid(self):
+        compressed = brotli.compress(b'abc' * 1000, quality=11)
+        for invalid in (b'', compressed[:1], b'\x11'):
+            with self.assertRaises(brotli.error):
+                brotli.decompressed_size(invalid)
+        with self.assertRaises(brotli.error):
+            brotli.decompressed_size(
+                brotli.compress(b'abc' * 1000, quality=0)[:-2])
+
+    def test_max_output_size(self):
+        data = b'abc' * 1000
+        compressed = brotli.compress(data)
+        self.assertEqual(
+            brotli.decompress(compressed, max_output_size=len(data)), data)
+        with self.assertRaises(brotli.OutputTooLargeError):
+            brotli.decompress(compressed, max_output_size=len(data) - 1)
+        bomb = brotli.compress(b'\0' * (1 << 26))
+        with self.assertRaises(brotli.OutputTooLargeError):
+            brotli.decompress(bomb, max_output_size=1 << 16)
+        # The specific exception is still a brotli.error.
+        with self.assertRaises(brotli.error):
+            brotli.decompress(bomb, max_output_size=1 << 16)
+        with self.assertRaises(brotli.error):
+            brotli.decompress(compressed, max_output_size=-1)
+
+    def test_verify_invalid(self):
+        data = b'abc' * 1000
+        compressed = brotli.compress(data)
+        self.assertEqual(brotli.verify(memoryview(compressed)),
+                         (len(data), None))
+        for invalid in (b'', compressed[:-1], compressed + b'a', b'\x11'):
+            for source in (invalid, io.BytesIO(invalid)):
+                with self.assertRaises(brotli.error):
+                    brotli.verify(source)
+        dictionary = data[:100]
+        compressed = brotli.compress(data, dictionary=dictionary)
+        self.assertEqual(
+            brotli.verify(compressed, dictionary=dictionary, checksum=True),
+            (len(data), zlib.crc32(data) & 0xFFFFFFFF))
+
+    def test_decompress_into_too_small(self):
+        output = bytearray(9)
+        with self.assertRaises(brotli.error):
+            brotli.decompress_into(brotli.compress(b'a' * 10), output)
+
 
 _test_utils.generate_test_methods(TestDecompress, for_decompression=True)
 
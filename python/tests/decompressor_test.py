@@ -0,0 +1,142 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import functools
+import unittest
+
+from . import _test_utils
+import brotli
+
+
+def _get_original_name(test_data):
+    return test_data.split('.compressed')[0]
+
+
+class TestDecompressor(_test_utils.TestCase):
+
+    CHUNK_SIZE = 1
+    MAX_LENGTH = 1024
+    COPY_CHUNK_SIZE = 997
+    STATS_CHUNK_SIZE = 7
+
+    def setUp(self):
+        self.decompressor = brotli.Decompressor()
+
+    def _check_decompression(self, test_data):
+        # Verify decompression matches the original.
+        temp_uncompressed = _test_utils.get_temp_uncompressed_name(test_data)
+        original = _get_original_name(test_data)
+        self.assertFilesMatch(temp_uncompressed, original)
+
+    def _decompress(self, test_data):
+        temp_uncompressed = _test_utils.get_temp_uncompressed_name(test_data)
+        with open(temp_uncompressed, 'wb') as out_file:
+            with open(test_data, 'rb') as in_file:
+                read_chunk = functools.partial(in_file.read, self.CHUNK_SIZE)
+                for data in iter(read_chunk, b''):
+                    out_file.write(self.decompressor.process(data))
+        self.assertTrue(self.decompressor.is_finished())
+
+    def _decompress_bounded(self, test_data):
+        temp_uncompressed = _test_utils.get_temp_uncompressed_name(test_data)
+        with open(temp_uncompressed, 'wb') as out_file:
+            with open(test_data, 'rb') as in_file:
+                data = in_file.read()
+            while not self.decompressor.is_finished():
+                output = self.decompressor.process(
+                    data, max_length=self.MAX_LENGTH)
+                self.assertLessEqual(len(output), self.MAX_LENGTH)
+                out_file.write(output)
+                data = self.decompressor.unconsumed_tail
+        self.assertEqual(self.decompressor.unconsumed_tail, b'')
+
+    def _decompress_copy(self, test_data):
+        # Continue with a fresh copy after every chunk; the copy and the
+        # original have to produce the same output for the same input.
+        temp_uncompressed = _test_utils.get_temp_uncompressed_name(test_data)
+        with open(temp_uncompressed, 'wb') as out_file:
+            with open(test_data, 'rb') as in_file:
+                read_chunk = functools.partial(
+                    in_file.read, self.COPY_CHUNK_SIZE)
+                for data in iter(read_chunk, b''):
+                    copy = self.decompressor.copy()
+                    output = self.decompressor.process(data)
+                    self.assertEqual(copy.process(data), output)
+                    out_file.write(output)
+                    self.decompressor = copy
+        self.assertTrue(self.decompressor.is_finished())
+
+    def _test_decompress(self, test_data):
+        self._decompress(test_data)
+        self._check_decompression(test_data)
+
+    def _test_decompress_bounded(self, test_data):
+        self._decompress_bounded(test_data)
+        self._check_decompression(test_data)
+
+    def _test_decompress_copy(self, test_data):
+        self._decompress_copy(test_data)
+        self._check_decompression(test_data)
+
+    def _test_stats(self, test_data):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        output = self.decompressor.process(data)
+        stats = self.decompressor.stats()
+        self.assertEqual(
+            stats['literal_bytes'] + stats['copy_bytes'] +
+            stats['dictionary_bytes'] + stats['uncompressed_bytes'],
+            len(output))
+        # Resuming after running out of input must not count anything twice.
+        decompressor = brotli.Decompressor()
+        for i in range(0, len(data), self.STATS_CHUNK_SIZE):
+            decompressor.process(data[i:i + self.STATS_CHUNK_SIZE])
+        self.assertEqual(decompressor.stats(), stats)
+
+    def test_garbage_appended(self):
+        with self.assertRaises(brotli.error):
+            self.decompressor.process(brotli.compress(b'a') + b'a')
+
+    def test_invalid_max_length(self):
+        with self.assertRaises(brotli.error):
+            self.decompressor.process(b'', max_length=-1)
+
+    def test_max_output_size(self):
+        data = b'abc' * 1000
+        compressed = brotli.compress(data)
+        decompressor = brotli.Decompressor(max_output_size=len(data))
+        output = b''.join(decompressor.process(compressed[i:i + 10])
+                          for i in range(0, len(compressed), 10))
+        self.assertEqual(output, data)
+        self.assertTrue(decompressor.is_finished())
+
+        decompressor = brotli.Decompressor(max_output_size=len(data) - 1)
+        with self.assertRaises(brotli.OutputTooLargeError):
+            while True:
+                self.assertTrue(decompressor.process(
+                    compressed, max_length=100))
+                compressed = decompressor.unconsumed_tail
+        # The stream stays rejected.
+        with self.assertRaises(brotli.OutputTooLargeError):
+            decompressor.process(b'')
+
+    def test_max_output_size_bomb(self):
+        bomb = brotli.compress(b'\0' * (1 << 26))
+        decompressor = brotli.Decompressor(max_output_size=1 << 16)
+        with self.assertRaises(brotli.OutputTooLargeError):
+            decompressor.process(bomb)
+        copy = brotli.Decompressor(max_output_size=1 << 16).copy()
+        with self.assertRaises(brotli.OutputTooLargeError):
+            copy.process(bomb)
+
+    def test_invalid_max_output_size(self):
+        with self.assertRaises(brotli.error):
+            brotli.Decompressor(max_output_size=-1)
+
+
+_test_utils.generate_test_methods(TestDecompressor, for_decompression=True)
+
+if __name__ == '__main__':
+    unittest.main()
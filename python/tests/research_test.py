@@ -0,0 +1,300 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import array
+import math
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+from . import _test_utils
+import brotli
+from brotli import research
+
+
+def _longest_match(data, position):
+    """Returns the length of the longest match of "position" that starts
+    earlier in "data"."""
+    best = 0
+    for source in range(position):
+        length = 0
+        while (position + length < len(data) and
+               data[source + length] == data[position + length]):
+            length += 1
+        best = max(best, length)
+    return best
+
+
+class TestFindOptReferences(_test_utils.TestCase):
+
+    def _check_references(self, data, references, min_length, skip):
+        positions, distances, lengths = references
+        self.assertEqual(len(positions), len(distances))
+        self.assertEqual(len(positions), len(lengths))
+        for position, distance, length in zip(positions, distances, lengths):
+            position, distance, length = (
+                int(position), int(distance), int(length))
+            self.assertGreaterEqual(position, skip)
+            self.assertGreaterEqual(length, min_length)
+            self.assertTrue(0 < distance <= position)
+            source = position - distance
+            self.assertEqual(data[source:source + length],
+                             data[position:position + length])
+
+    def _test_references(self, test_data):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()[:100000]
+        references = research.find_opt_references(data, min_length=4)
+        self._check_references(data, references, 4, 1)
+
+    def test_longest(self):
+        rng = random.Random(0)
+        data = bytes(bytearray(rng.choice(b'abc') for _ in range(300)))
+        positions, _, lengths = research.find_opt_references(data, skip=0)
+        self.assertEqual(
+            dict(zip((int(p) for p in positions), (int(l) for l in lengths))),
+            dict((p, _longest_match(data, p)) for p in range(len(data))
+                 if _longest_match(data, p)))
+
+    def test_known_references(self):
+        positions, distances, lengths = research.find_opt_references(
+            b'abcabcabcx', min_length=3)
+        self.assertEqual(list(positions), [3, 4, 5, 6])
+        self.assertEqual(list(distances), [3, 3, 3, 3])
+        self.assertEqual(list(lengths), [6, 5, 4, 3])
+
+    def test_equal_length_tie(self):
+        # "abb" matches both "aba..." and "abc..." over 2 bytes. Like the
+        # tool, the match whose suffix sorts first wins.
+        positions, distances, lengths = research.find_opt_references(
+            b'abaxabcyabb', min_length=2)
+        self.assertEqual(list(positions), [4, 8])
+        self.assertEqual(list(distances), [4, 8])
+        self.assertEqual(list(lengths), [2, 2])
+
+    def test_result_types(self):
+        # Arrays come from the extension as is, and NumPy wraps them.
+        numpy = research.numpy
+        research.numpy = None
+        try:
+            references = research.find_opt_references(b'abcabc')
+        finally:
+            research.numpy = numpy
+        for values in references:
+            self.assertIsInstance(values, array.array)
+            self.assertEqual(values.typecode, 'i')
+        if numpy is not None:
+            for values in research.find_opt_references(b'abcabc'):
+                self.assertEqual(values.dtype, numpy.int32)
+
+    def test_empty(self):
+        for values in research.find_opt_references(b''):
+            self.assertEqual(len(values), 0)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(brotli.error):
+            research.find_opt_references(b'abc', min_length=0)
+        with self.assertRaises(brotli.error):
+            research.find_opt_references(b'abc', skip=-1)
+
+
+def _write_dist(path, references):
+    """Writes (length, position, distance) triples; a length of None means
+    no copy length, a position of None a standalone copy length."""
+    with open(path, 'wb') as dist_file:
+        for length, position, distance in references:
+            if length is not None:
+                dist_file.write(struct.pack('=Bi', 0, length))
+            if position is not None:
+                dist_file.write(struct.pack('=Bii', 1, position, distance))
+
+
+def _build_histogram(references, size, height, width, min_distance=0,
+                     max_distance=1 << 30, brotli_window=None, linear=False,
+                     skip=0, with_copies=False):
+    """A direct port of "BuildHistogram" in research/draw_histogram.cc."""
+    def transform(x):
+        return x if linear else math.log(x) ** 2
+
+    histo = [[0] * width for _ in range(height)]
+    max_pos = size - skip
+    min_dist = transform(min_distance) if min_distance > 0 else 0
+    max_dist = transform(max_distance) - min_dist
+    offset = last = 0
+    for copy, pos, distance in references:
+        if distance < min_distance or distance >= max_distance:
+            continue
+        if brotli_window is not None:
+            if pos < last:
+                offset += 1 << brotli_window
+            last = pos
+            pos += offset
+        if pos >= skip and distance <= pos:
+            pos -= skip
+            if pos >= max_pos:
+                break
+            dist = transform(float(distance)) - min_dist
+            x = min(int(math.floor(dist / max_dist * height + 0.5)),
+                    height - 1)
+            y = pos * width // max_pos
+            if with_copies:
+                right = (pos + copy - 1) * width // max_pos
+                if y == right:
+                    histo[x][y] += copy
+                else:
+                    pos2 = int(math.ceil(1.0 * (y + 1) * max_pos / width))
+                    histo[x][y] += pos2 - pos
+                    for i in range(y + 1, min(right, width)):
+                        histo[x][i] += max_pos // width
+                    if right < width:
+                        pos2 = int(math.ceil(1.0 * right * max_pos / width))
+                        histo[x][right] += pos + copy - 1 - pos2 + 1
+            else:
+                histo[x][y] += 1
+    return histo
+
+
+@unittest.skipIf(research.numpy is None, 'NumPy is not installed')
+class TestDist(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'input.dist')
+        self.chunk_size = research.CHUNK_SIZE
+        # Exercise the chunking.
+        research.CHUNK_SIZE = 7
+
+    def tearDown(self):
+        research.CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.directory)
+
+    def _random_references(self, rng, count, size):
+        references = []
+        for _ in range(count):
+            position = rng.randrange(1, size)
+            distance = rng.randrange(1, position + 1)
+            references.append((rng.randrange(1, 3 * size // 50), position,
+                               distance))
+        return sorted(references, key=lambda reference: reference[1])
+
+    def test_read_dist(self):
+        references = [(None, 1, 1), (None, 5, 3), (None, 9, 9)]
+        _write_dist(self.path, references)
+        records = research.read_dist(self.path)
+        self.assertNotIn('length', records.dtype.names)
+        self.assertEqual(list(records['position']), [1, 5, 9])
+        self.assertEqual(list(records['distance']), [1, 3, 9])
+
+        references = [(4, 1, 1), (3, 5, 3)]
+        _write_dist(self.path, references)
+        records = research.read_dist(self.path)
+        self.assertEqual(list(records['length']), [4, 3])
+        self.assertEqual(list(records['position']), [1, 5])
+
+        # Mixed layouts, and a standalone copy length.
+        references = [(4, 1, 1), (None, 5, 3), (7, None, None), (2, 8, 6)]
+        _write_dist(self.path, references)
+        records = research.read_dist(self.path)
+        self.assertEqual(list(records['length']), [4, -1, 2])
+        self.assertEqual(list(records['position']), [1, 5, 8])
+        self.assertEqual(list(records['distance']), [1, 3, 6])
+
+        open(self.path, 'wb').close()
+        self.assertEqual(len(research.read_dist(self.path)), 0)
+
+    def test_read_corrupt_dist(self):
+        with open(self.path, 'wb') as dist_file:
+            dist_file.write(struct.pack('=Bii', 1, 1, 1) + b'\x02')
+        with self.assertRaises(ValueError):
+            research.read_dist(self.path)
+
+    def test_histogram(self):
+        rng = random.Random(1)
+        size = 1000
+        references = self._random_references(rng, 200, size)
+        _write_dist(self.path, [(None, p, d) for _, p, d in references])
+        records = research.read_dist(self.path)
+        for kwargs in ({}, {'linear': True}, {'skip': 100},
+                       {'min_distance': 5, 'max_distance': 500}):
+            histogram = research.dist_histogram(records, size, height=10,
+                                                width=30, **kwargs)
+            self.assertEqual(histogram.tolist(), _build_histogram(
+                references, size, 10, 30, **kwargs))
+
+    def test_histogram_with_copies(self):
+        rng = random.Random(2)
+        size = 1000
+        references = self._random_references(rng, 200, size)
+        _write_dist(self.path, references)
+        records = research.read_dist(self.path)
+        histogram = research.dist_histogram(records, size, height=10,
+                                            width=30, with_copies=True)
+        self.assertEqual(histogram.tolist(), _build_histogram(
+            references, size, 10, 30, with_copies=True))
+
+    def test_histogram_brotli_window(self):
+        rng = random.Random(3)
+        references = []
+        for position in range(1, 3000, 7):
+            position %= 1 << 10
+            references.append((None, position, rng.randrange(1, 100)))
+        _write_dist(self.path, references)
+        histogram = research.dist_histogram(
+            research.read_dist(self.path), 3000, height=10, width=30,
+            brotli_window=10)
+        self.assertEqual(histogram.tolist(), _build_histogram(
+            references, 3000, 10, 30, brotli_window=10))
+
+    def test_diff_image(self):
+        rng = random.Random(4)
+        numpy = research.numpy
+        image1 = numpy.array([[rng.randrange(256) for _ in range(5)]
+                              for _ in range(4)], dtype=numpy.uint8)
+        image2 = numpy.array([[rng.randrange(256) for _ in range(5)]
+                              for _ in range(4)], dtype=numpy.uint8)
+        pixels, maxval = research.diff_image(image1, image2)
+        self.assertEqual(pixels.shape, (4, 5, 3))
+        diff = image1.astype(int) - image2.astype(int)
+        self.assertEqual(maxval, max(abs(diff).max(),
+                                     (255 - numpy.maximum(image1,
+                                                          image2)).max()))
+        for i in range(4):
+            for j in range(5):
+                a, b = int(image1[i, j]), int(image2[i, j])
+                min_val = min(255 - a, 255 - b)
+                base = maxval - max(min_val, abs(a - b))
+                if a > b:
+                    expected = [base + a - b, base, base + min_val]
+                else:
+                    expected = [base, base + b - a, base + min_val]
+                self.assertEqual(pixels[i, j].tolist(), expected)
+        with self.assertRaises(ValueError):
+            research.diff_image(image1, image2[:3])
+
+    def test_main(self):
+        with open(_test_utils.TESTDATA_PATHS[2], 'rb') as in_file:
+            data = in_file.read()[:20000]
+        positions, distances, lengths = research.find_opt_references(
+            data, min_length=4)
+        _write_dist(self.path, zip(lengths, positions, distances))
+        images = [os.path.join(self.directory, name)
+                  for name in ('1.pgm', '2.pgm', 'diff.ppm')]
+        research.main(['histogram', self.path, str(len(data)), images[0],
+                       '--height', '20', '--width', '40'])
+        research.main(['histogram', self.path, str(len(data)), images[1],
+                       '--height', '20', '--width', '40', '--with-copies'])
+        research.main(['diff', images[0], images[1], images[2]])
+        self.assertEqual(research.read_pgm(images[0]).shape, (20, 40))
+        with open(images[2], 'rb') as diff_file:
+            self.assertTrue(diff_file.read().startswith(b'P6\n40 20\n'))
+
+
+_test_utils.generate_test_methods(TestFindOptReferences)
+
+if __name__ == '__main__':
+    unittest.main()
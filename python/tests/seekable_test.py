@@ -0,0 +1,80 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import io
+import random
+import struct
+import unittest
+
+from . import _test_utils
+import brotli
+
+
+class TestSeekable(_test_utils.TestCase):
+
+    FRAME_SIZE = 10000
+    CHUNK_SIZE = 4096
+
+    def _compress(self, data):
+        out_file = io.BytesIO()
+        with brotli.SeekableWriter(out_file, frame_size=self.FRAME_SIZE,
+                                   quality=5) as writer:
+            for i in range(0, len(data), self.CHUNK_SIZE):
+                writer.write(data[i:i + self.CHUNK_SIZE])
+        return out_file.getvalue()
+
+    def _test_read(self, test_data):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        compressed = self._compress(data)
+        # A seekable stream is a valid framed stream as well.
+        self.assertEqual(brotli.decompress_framed(compressed), data)
+        reader = brotli.SeekableReader(io.BytesIO(compressed))
+        self.assertEqual(reader.read(), data)
+        self.assertEqual(reader.read(), b'')
+
+    def _test_seek(self, test_data):
+        with open(test_data, 'rb') as in_file:
+            data = in_file.read()
+        reader = brotli.SeekableReader(io.BytesIO(self._compress(data)))
+        rng = random.Random(len(data))
+        for _ in range(100):
+            position = rng.randrange(len(data) + 1)
+            size = rng.randrange(3 * self.FRAME_SIZE)
+            self.assertEqual(reader.seek(position), position)
+            self.assertEqual(reader.read(size), data[position:position + size])
+            self.assertEqual(reader.tell(), min(position + size, len(data)))
+        reader.seek(-len(data[-1:]), io.SEEK_END)
+        self.assertEqual(reader.read(), data[-1:])
+
+    def test_invalid_index(self):
+        compressed = self._compress(b'a' * 100)
+        with self.assertRaises(brotli.error):
+            brotli.SeekableReader(io.BytesIO(compressed[:-1]))
+        with self.assertRaises(brotli.error):
+            brotli.SeekableReader(
+                io.BytesIO(brotli.compress_framed(b'a' * 100)))
+
+    def test_frame_larger_than_index(self):
+        # A frame that decompresses to more than the index says is rejected.
+        data = brotli.compress(b'a' * 100000)
+        frame = struct.pack('<II', len(data), 100) + data
+        compressed = (b'\xceBRF' + frame + struct.pack('<II', 0, 0) +
+                      struct.pack('<QQ', 4, 0) +
+                      struct.pack('<QQ', 4 + len(frame), 100) +
+                      struct.pack('<I4s', 1, b'\xceBRI'))
+        reader = brotli.SeekableReader(io.BytesIO(compressed))
+        with self.assertRaises(brotli.error):
+            reader.read()
+
+    def test_invalid_frame_size(self):
+        with self.assertRaises(brotli.error):
+            brotli.SeekableWriter(io.BytesIO(), frame_size=0)
+
+
+_test_utils.generate_test_methods(TestSeekable)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# Copyright 2016 The Brotli Authors. All rights reserved.
+#
+# Distributed under MIT license.
+# See file LICENSE for detail or copy at https://opensource.org/licenses/MIT
+
+import random
+import unittest
+
+from . import _test_utils
+import brotli
+
+
+def _make_samples(count):
+    """Generates records that share their structure, but not their values."""
+    rng = random.Random(count)
+    samples = []
+    for i in range(count):
+        samples.append((
+            '{"id": %d, "name": "user%d", "email": "user%d@example.com", '
+            '"status": "%s", "created_at": "2016-%02d-%02dT12:00:00Z"}' % (
+                rng.randrange(10**6), i, i,
+                rng.choice(['active', 'inactive', 'pending']),
+                rng.randrange(1, 13), rng.randrange(1, 29))).encode('ascii'))
+    return samples
+
+
+class TestTrainDictionary(_test_utils.TestCase):
+
+    def test_improves_compression(self):
+        samples = _make_samples(300)
+        training, held_out = samples[:200], samples[200:]
+        dictionary = brotli.train_dictionary(training, size=4096)
+        self.assertTrue(0 < len(dictionary) <= 4096)
+        plain = sum(len(brotli.compress(s)) for s in held_out)
+        trained = sum(len(brotli.compress(s, dictionary=dictionary))
+                      for s in held_out)
+        self.assertLess(trained, plain // 2)
+        for sample in held_out:
+            compressed = brotli.compress(sample, dictionary=dictionary)
+            self.assertEqual(
+                brotli.decompress(compressed, dictionary=dictionary), sample)
+
+    def test_most_useful_last(self):
+        # The common prefix is in every sample, the suffix in half of them.
+        samples = [b'common prefix of all the samples %d ' % i +
+                   (b'and a suffix of half of them' if i % 2 else b'')
+                   for i in range(20)]
+        dictionary = brotli.train_dictionary(samples)
+        self.assertTrue(dictionary.endswith(b'common prefix of all the '
+                                            b'samples '))
+        self.assertIn(b'and a suffix of half of them', dictionary)
+
+    def test_size_limit(self):
+        samples = _make_samples(100)
+        for size in (10, 100, 1000):
+            self.assertLessEqual(
+                len(brotli.train_dictionary(samples, size=size)), size)
+
+    def test_no_repeats(self):
+        self.assertEqual(brotli.train_dictionary([]), b'')
+        self.assertEqual(brotli.train_dictionary([b'', b'']), b'')
+        # Repeats within one sample are found in the window anyway.
+        self.assertEqual(brotli.train_dictionary([b'abcdefghij' * 10]), b'')
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(brotli.error):
+            brotli.train_dictionary([b'abc'], size=0)
+        with self.assertRaises(TypeError):
+            brotli.train_dictionary([u'abc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ I found the following issues with the Brotli format:
   anyway, so why don't you just switch to "the other" type?
 """
 import struct
+import csv, json
 from operator import itemgetter, methodcaller
 from itertools import accumulate, repeat
 from collections import defaultdict, deque
@@ -29,14 +30,16 @@ def outputCharFormatter(c):
     elif c==32: return '" "'
     else: return '\\x{:02x}'.format(c)
 
+#outputCharFormatter of every byte; inside strings, a space is shown as is
+charTable = [outputCharFormatter(c) for c in range(256)]
+stringCharTable = charTable[:32]+[' ']+charTable[33:]
+
 def outputFormatter(s):
     """Show string or char.
     """
     result = ''
     def formatSubString(s):
-        for c in s:
-            if c==32: yield ' '
-            else: yield outputCharFormatter(c)
+        return map(stringCharTable.__getitem__, s)
     if len(result)<200: return ''.join(formatSubString(s))
     else:
         return ''.join(formatSubString(s[:100]))+'...'+ \
@@ -46,11 +49,20 @@ def outputFormatter(s):
 class BitStream:
     """Represent a bytes object. Can read bits and prefix codes the way
     Brotli does.
+    Bits are served from a buffered 64 bit window,
+    so that most peeks are a shift and a mask.
+    Peeks that do not fit the window refill it from the byte at pos;
+    a peek of more than 56 bits gets a window of its own size.
     """
+    WINDOW_BYTES = 8
     def __init__(self, byteString):
         self.data = byteString
         #position in bits: byte pos is pos>>3, bit pos is pos&7
         self.pos = 0
+        #the window holds the bits from windowPos on
+        self.windowPos = 0
+        self.windowBits = -1
+        self.window = 0
 
     def __repr__(self):
         """Representation
@@ -86,13 +98,17 @@ class BitStream:
         >>> hex(olleke.peek(32))
         '0x2e1b'
         """
-        #read bytes that contain the data: self.data[self.pos>>3:self.pos+n+7>>3]
-        #convert to int: int.from_bytes(..., 'little')
-        #shift out the bits from the first byte: >>(self.pos&7)
-        #mask unwanted bits: & (1<<n)-1
-        return int.from_bytes(
-            self.data[self.pos>>3:self.pos+n+7>>3],
-            'little')>>(self.pos&7) & (1<<n)-1
+        offset = self.pos-self.windowPos
+        if offset<0 or offset+n>self.windowBits:
+            #refill the window from the byte containing pos
+            #the window must hold at least n bits past pos
+            start = self.pos>>3
+            size = max(self.WINDOW_BYTES, (n+7>>3)+1)
+            self.window = int.from_bytes(self.data[start:start+size], 'little')
+            self.windowPos = start<<3
+            self.windowBits = size<<3
+            offset = self.pos&7
+        return self.window>>offset & (1<<n)-1
 
     def readBytes(self, n):
         """Read n bytes from the stream on a byte boundary.
@@ -243,11 +259,27 @@ class PrefixDecoder:
         """
         return self.lengthTable[index]
 
+    #number of bits looked up in the first level table
+    ROOT_BITS = 8
+
     def decodePeek(self, data):
         """Find which symbol index matches the given data (from peek, as a number)
         and return the number of bits decoded.
         Can also be used to figure out length of a symbol.
         """
+        lookup = self.lookup
+        if lookup is None: lookup = self.buildLookup()
+        entry = lookup[data&self.rootMask]
+        if entry is not None and entry[0]<0:
+            #longer code: look up the remaining bits in the overflow table
+            entry = entry[1][data>>self.rootBits&(1<<-entry[0])-1]
+        if entry is None: return self.searchPeek(data)
+        return entry
+
+    def searchPeek(self, data):
+        """Same as decodePeek, using a search of decodeTable.
+        Used for bit patterns that are not in the code.
+        """
         #do binary search for word length
         #invariant: lo<=length<=hi
         lo, hi = self.minLength, self.maxLength
@@ -270,6 +302,40 @@ class PrefixDecoder:
             lo = mid+1
         return lo, Symbol(self, index)
 
+    def buildLookup(self):
+        """Build the direct lookup tables for decodePeek.
+        The first level table is indexed by the first rootBits bits
+        and holds (length, symbol) for the codes that fit.
+        Longer codes share an overflow table per first level entry,
+        stored there as (-bits, table), indexed by the following bits.
+        Patterns that are not in the code map to None.
+        """
+        rootBits = min(self.maxLength, self.ROOT_BITS)
+        lookup = [None]*(1<<rootBits)
+        #size the overflow tables by their longest code
+        overflowBits = defaultdict(int)
+        for bits, index in self.decodeTable.items():
+            length = self.lengthTable[index]
+            if length>rootBits:
+                root = bits&(1<<rootBits)-1
+                overflowBits[root] = max(overflowBits[root], length-rootBits)
+        for root, bits in overflowBits.items():
+            lookup[root] = -bits, [None]*(1<<bits)
+        for bits, index in self.decodeTable.items():
+            length = self.lengthTable[index]
+            entry = length, Symbol(self, index)
+            if length<=rootBits:
+                table, first, step = lookup, bits, length
+            else:
+                table = lookup[bits&(1<<rootBits)-1][1]
+                first, step = bits>>rootBits, length-rootBits
+            for i in range(first, len(table), 1<<step):
+                table[i] = entry
+        self.rootBits = rootBits
+        self.rootMask = (1<<rootBits)-1
+        self.lookup = lookup
+        return lookup
+
     #routine to set up the tables
     def setDecode(self, decodeTable):
         """Store decodeTable,
@@ -327,8 +393,10 @@ class PrefixDecoder:
 
     def switchToPrefix(self):
         """This routine makes sure the prefix decoder is activated.
+        The lookup tables are built on first use.
         """
         self.mode = PrefixDecoder
+        self.lookup = None
 
 class Code(RangeDecoder, PrefixDecoder):
     """An alphabet of symbols, that can be read from a stream.
@@ -550,9 +618,19 @@ class Enumerator(WithExtra):
         """Give the range of possible values in a tuple
         Useful for mnemonic and explanation
         """
-        lower = self.value0+sum(1<<x for x in self.extraTable[:index])
-        upper = lower+(1<<self.extraTable[index])
-        return lower, upper-1
+        try: return self.spanTable[index]
+        except AttributeError:
+            #first use: compute them all
+            self.spanTable = self.computeSpans()
+            return self.spanTable[index]
+
+    def computeSpans(self):
+        """List the ranges of all symbols"""
+        spans, lower = [], self.value0
+        for x in self.extraTable:
+            spans.append((lower, lower+(1<<x)-1))
+            lower += 1<<x
+        return spans
 
 #======================Code subclasses======================================
 #Alphabets used in the metablock header----------------------------------
@@ -1003,13 +1081,13 @@ class LiteralAlphabet(Code):
         super().__init__('L'+str(number), alphabetSize=1<<8)
 
     def mnemonic(self, index):
-        return outputCharFormatter(index)
+        return charTable[index]
 
     def value(self, index, extra=None):
         return index
 
     def explanation(self, index, extra=None):
-        return self.mnemonic(index)
+        return charTable[index]
 
 class InsertLengthAlphabet(Enumerator):
     """Intern code for insert counts
@@ -1042,22 +1120,38 @@ class InsertAndCopyAlphabet(WithExtra):
     """
     insertLengthAlphabet = InsertLengthAlphabet(None)
     copyLengthAlphabet = CopyLengthAlphabet(None)
+    splitTable = None
 
     def __init__(self, number=''):
         super().__init__('IC'+str(number), bitLength=10)
+        #the split is the same for every instance; computed once
+        if InsertAndCopyAlphabet.splitTable is None:
+            InsertAndCopyAlphabet.splitTable = [
+                self.computeSplit(index) for index in range(704)]
+            #for value: insert lower, insert extra bits, copy lower, dist0
+            InsertAndCopyAlphabet.valueTable = [
+                (i.code.span(i.index)[0], i.extraBits(),
+                 c.code.span(c.index)[0], d0)
+                for i, c, d0 in InsertAndCopyAlphabet.splitTable]
+            InsertAndCopyAlphabet.extraTable = [
+                i.extraBits()+c.extraBits()
+                for i, c, d0 in InsertAndCopyAlphabet.splitTable]
 
     def __len__(self):
         return 704
 
     def extraBits(self, index):
-        insertSymbol, copySymbol, dist0 = self.splitSymbol(index)
-        return InsertLengthAlphabet.extraTable[insertSymbol.index] + \
-            CopyLengthAlphabet.extraTable[copySymbol.index]
+        return self.extraTable[index]
 
     def splitSymbol(self, index):
         """Give relevant values for computations:
         (insertSymbol, copySymbol, dist0flag)
         """
+        return self.splitTable[index]
+
+    def computeSplit(self, index):
+        """Compute splitSymbol(index); see splitTable.
+        """
         #determine insert and copy upper bits from table
         row = [0,0,1,1,2,2,1,3,2,3,3][index>>6]
         col = [0,1,0,1,0,1,2,0,2,1,2][index>>6]
@@ -1089,12 +1183,8 @@ class InsertAndCopyAlphabet(WithExtra):
             '&D=0' if d0 else '')
 
     def value(self, index, extra):
-        i,c,d0 = self.splitSymbol(index)
-        iExtra = i.extraBits()
-        ce, ie = extra>>iExtra, extra&(1<<iExtra)-1
-        insert = i.value(ie)
-        copy = c.value(ce)
-        return insert, copy, d0
+        iLower, iExtra, cLower, d0 = self.valueTable[index]
+        return iLower+(extra&(1<<iExtra)-1), cLower+(extra>>iExtra), d0
 
     def explanation(self, index, extra):
         insert, copy, d0 = self.value(index, extra)
@@ -1365,22 +1455,34 @@ class WordList:
 
 class Layout:
     """Class to layout the output.
+    With verbose=False nothing is printed and no text is built;
+    use events() to get the contents of the stream.
+    That is the fast path: building the text dump takes most of the time.
     """
     #display width of hexdata+bitdata
     width = 25
     #general
-    def __init__(self, stream):
+    def __init__(self, stream, verbose=True):
         self.stream = stream
+        self.verbose = verbose
         self.bitPtr = self.width
+        self.pending = []
+        #formatBitData results of short fields, by bit offset, widths and bits
+        self.bitDataCache = {}
+
+    def show(self, *args, **kwargs):
+        """print, if verbose"""
+        if self.verbose: print(*args, **kwargs)
 
-    def makeHexData(self, pos):
-        """Produce hex dump of all data containing the bits
-        from pos to stream.pos
+    def emit(self, event, pos, bits=None, **fields):
+        """Queue an event for the bits from pos;
+        bits defaults to everything read since pos.
         """
-        firstAddress = pos+7>>3
-        lastAddress = self.stream.pos+7>>3
-        return ''.join(map('{:02x} '.format,
-            self.stream.data[firstAddress:lastAddress]))
+        if bits is None: bits = self.stream.pos-pos
+        self.pending.append(dict(event=event, pos=pos, bits=bits, **fields))
+
+    def skipEvent(self, event, pos, bits=None, **fields):
+        """Replaces emit when the events are not used."""
 
     def formatBitData(self, pos, width1, width2=0):
         """Show formatted bit data:
@@ -1391,6 +1493,28 @@ class Layout:
         >>> Layout(olleke).formatBitData(4, 1, 0)
         '1'
         """
+        #common case: a single field inside one byte
+        if width2==0 and 0<width1<8-(pos&7):
+            return '{:0{}b}'.format(
+                self.stream.data[pos>>3] >> (pos&7) & (1<<width1)-1, width1)
+        #short fields are formatted once for every combination of bits
+        width = width1+width2
+        if width<=self.CACHED_BIT_DATA:
+            data = self.stream.data
+            bits = int.from_bytes(data[pos>>3:pos+width+7>>3], 'little')
+            key = pos&7, width1, width2, bits>>(pos&7) & (1<<width)-1
+            try: return self.bitDataCache[key]
+            except KeyError:
+                result = self.bitDataCache[key] = self.layoutBitData(
+                    pos, width1, width2)
+                return result
+        return self.layoutBitData(pos, width1, width2)
+
+    #longest field combination that formatBitData caches
+    CACHED_BIT_DATA = 16
+
+    def layoutBitData(self, pos, width1, width2):
+        """The general case of formatBitData."""
         result = []
         #make empty prefix code explicit
         if width1==0: result = ['()', ',']
@@ -1427,10 +1551,12 @@ class Layout:
         The alphabet in question must have a "logical" order,
         otherwise the assignment of symbols doesn't work.
         """
+        pos = self.stream.pos
         mode, numberOfSymbols = self.verboseRead(PrefixCodeHeader(alphabet.name))
         if mode=='Complex':
             #for a complex code, numberOfSymbols means hskip
-            self.readComplexCode(numberOfSymbols, alphabet)
+            lengths = self.readComplexCode(numberOfSymbols, alphabet)
+            self.emit('prefixcode', pos, name=alphabet.name, lengths=lengths)
             return alphabet
         else:
             table = []
@@ -1452,11 +1578,13 @@ class Layout:
                 #read tree shape to redefine lengths
                 lengths = self.verboseRead(TreeShapeAlhabet())
             #construct the alphabet prefix code
-            alphabet.setLength(dict(zip(table, lengths)))
+            lengths = dict(zip(table, lengths))
+            alphabet.setLength(lengths)
+            self.emit('prefixcode', pos, name=alphabet.name, lengths=lengths)
         return alphabet
 
     def readComplexCode(self, hskip, alphabet):
-        """Read complex code"""
+        """Read complex code; returns the symbol lengths"""
         stream = self.stream
         #read the lengths for the length code
         lengths = [1,2,3,4,0,5,17,6,16,7,8,9,10,11,12,13,14,15][hskip:]
@@ -1479,8 +1607,9 @@ class Layout:
         if total>32: raise ValueError("Stream format")
         #Now set the encoding of the lengthCode
         lengthCode.setLength(codeLengths)
-        print("***** Lengths for {} will be coded as:".format(alphabet.name))
-        lengthCode.showCode()
+        if self.verbose:
+            print("***** Lengths for {} will be coded as:".format(alphabet.name))
+            lengthCode.showCode()
         #Now determine the symbol lengths with the lengthCode
         symbolLengths = {}
         total = 0
@@ -1570,48 +1699,98 @@ class Layout:
                 lastLength = length
         assert total==32768
         alphabet.setLength(symbolLengths)
-        print('End of table. Prefix code '+alphabet.name+':')
-        alphabet.showCode()
+        if self.verbose:
+            print('End of table. Prefix code '+alphabet.name+':')
+            alphabet.showCode()
+        return symbolLengths
 
     #stream
     def processStream(self):
         """Process a brotli stream.
+        The events are not built; use events() to get them.
+        """
+        self.emit = self.skipEvent
+        try:
+            for _ in self.decode(): pass
+        finally:
+            del self.emit
+
+    def events(self):
+        """Generate the contents of the stream as dicts.
+        Every event has the keys event, pos and bits:
+        the kind of event, its first bit position and its number of bits.
+        Every bit read belongs to exactly one event, so the bits add up
+        to the stream length without the padding of the last byte.
+        The range of a blocktypes or contextmap event can contain
+        the prefixcode events of the codes it reads;
+        its bits exclude those of the nested prefix codes.
+        The literals of a command come before the command itself.
+        >>> olleke.pos = 0
+        >>> for e in Layout(olleke, verbose=False).events():
+        ...     if e['event']=='command':
+        ...         print(e['pos'], e['insert'], e['copy'], e['distance'])
+        262 9 5 8
+        290 6 7 12
+        315 4 11 27
+        331 5 0 None
         """
-        print('addr  hex{:{}s}binary context explanation'.format(
+        pending = self.pending
+        for _ in self.decode():
+            yield from pending
+            del pending[:]
+        yield from pending
+        del pending[:]
+
+    def decode(self):
+        """Decode the stream, queuing events;
+        yields whenever the queued events can be handed out.
+        """
+        self.show('addr  hex{:{}s}binary context explanation'.format(
             '', self.width-10))
-        print('Stream header'.center(60, '-'))
+        self.show('Stream header'.center(60, '-'))
         self.windowSize = self.verboseRead(WindowSizeAlphabet())
-        print('Metablock header'.center(60, '='))
+        self.emit('stream', 0, windowSize=self.windowSize)
+        self.show('Metablock header'.center(60, '='))
         self.ISLAST = False
         self.output = bytearray()
         while not self.ISLAST:
+            yield
+            pos = self.stream.pos
             self.ISLAST = self.verboseRead(
                 BoolCode('LAST', description="Last block"))
             if self.ISLAST:
                 if self.verboseRead(
-                    BoolCode('EMPTY', description="Empty block")): break
-            if self.metablockLength(): continue
-            if not self.ISLAST and self.uncompressed(): continue
-            print('Block type descriptors'.center(60, '-'))
+                    BoolCode('EMPTY', description="Empty block")):
+                    self.emit('metablock', pos,
+                        last=True, length=0, uncompressed=False)
+                    break
+            if self.metablockLength(pos): continue
+            if not self.ISLAST and self.uncompressed(pos): continue
+            self.emit('metablock', pos,
+                last=self.ISLAST, length=self.MLEN, uncompressed=False)
+            self.show('Block type descriptors'.center(60, '-'))
             self.numberOfBlockTypes = {}
             self.currentBlockCounts = {}
             self.blockTypeCodes = {}
             self.blockCountCodes = {}
             for blockType in (L,I,D): self.blockType(blockType)
-            print('Distance code parameters'.center(60, '-'))
+            self.show('Distance code parameters'.center(60, '-'))
+            pos = self.stream.pos
             self.NPOSTFIX, self.NDIRECT = self.verboseRead(DistanceParamAlphabet())
+            self.emit('distanceparams', pos,
+                postfixBits=self.NPOSTFIX, direct=self.NDIRECT)
             self.readLiteralContextModes()
-            print('Context maps'.center(60, '-'))
+            self.show('Context maps'.center(60, '-'))
             self.cmaps = {}
             #keep the number of each kind of prefix tree for the last loop
             numberOfTrees = {I: self.numberOfBlockTypes[I]}
             for blockType in (L,D):
                 numberOfTrees[blockType] = self.contextMap(blockType)
-            print('Prefix code lists'.center(60, '-'))
+            self.show('Prefix code lists'.center(60, '-'))
             self.prefixCodes = {}
             for blockType in (L,I,D):
                 self.readPrefixArray(blockType, numberOfTrees[blockType])
-            self.metablock()
+            yield from self.metablock()
 
     #metablock header
     def verboseRead(self, alphabet, context='', skipExtra=False):
@@ -1625,6 +1804,13 @@ class Layout:
         """
         #TODO 2: verbosity level, e.g. show only codes and maps in header
         stream = self.stream
+        if not self.verbose:
+            if skipExtra:
+                self.symbol = symbol = alphabet.readTuple(stream)[1]
+                return symbol
+            length, self.symbol, extraBits, extra = \
+                alphabet.readTupleAndExtra(stream)
+            return self.symbol.value(extra)
         pos = stream.pos
         if skipExtra:
             length, symbol = alphabet.readTuple(stream)
@@ -1632,13 +1818,20 @@ class Layout:
         else:
             length, symbol, extraBits, extra = alphabet.readTupleAndExtra(
                 stream)
+        #keep the symbol for the caller
+        self.symbol = symbol
         #fields: address, hex data, binary data, name of alphabet, explanation
-        hexdata = self.makeHexData(pos)
-        addressField = '{:04x}'.format(pos+7>>3) if hexdata else ''
+        #hex dump of all data containing the bits from pos to stream.pos
+        firstAddress = pos+7>>3
+        lastAddress = stream.pos+7>>3
+        if firstAddress<lastAddress:
+            hexdata = stream.data[firstAddress:lastAddress].hex(' ')+' '
+            addressField = '{:04x}'.format(firstAddress)
+        else: hexdata = addressField = ''
         bitdata = self.formatBitData(pos, length, extraBits)
         #bitPtr moves bitdata so that the bytes are easier to read
         #jump back to right if a new byte starts
-        if '|' in bitdata[1:]:
+        if bitdata.find('|', 1)>=0:
             #start over on the right side
             self.bitPtr = self.width
         fillWidth = self.bitPtr-(len(hexdata)+len(bitdata))
@@ -1655,9 +1848,10 @@ class Layout:
         else: self.bitPtr -= len(bitdata)
         return symbol if skipExtra else symbol.value(extra)
 
-    def metablockLength(self):
+    def metablockLength(self, pos):
         """Read MNIBBLES and meta block length;
         if empty block, skip block and return true.
+        pos is the start of the metablock.
         """
         self.MLEN = self.verboseRead(MetablockLengthAlphabet())
         if self.MLEN:
@@ -1667,37 +1861,50 @@ class Layout:
         MSKIP = self.verboseRead(SkipLengthAlphabet())
         self.verboseRead(FillerAlphabet(streamPos=self.stream.pos))
         self.stream.pos += 8*MSKIP
-        print("Skipping to {:x}".format(self.stream.pos>>3))
+        self.show("Skipping to {:x}".format(self.stream.pos>>3))
+        self.emit('metadata', pos, last=self.ISLAST, length=MSKIP)
         return True
 
-    def uncompressed(self):
+    def uncompressed(self, pos):
         """If true, handle uncompressed data
+        pos is the start of the metablock.
         """
         ISUNCOMPRESSED = self.verboseRead(
             BoolCode('UNCMPR', description='Is uncompressed?'))
         if ISUNCOMPRESSED:
+            self.emit('metablock', pos,
+                last=False, length=self.MLEN, uncompressed=True)
+            pos = self.stream.pos
             self.verboseRead(FillerAlphabet(streamPos=self.stream.pos))
-            print('Uncompressed data:')
+            self.show('Uncompressed data:')
             self.output += self.stream.readBytes(self.MLEN)
-            print(outputFormatter(self.output[-self.MLEN:]))
+            self.show(outputFormatter(self.output[-self.MLEN:]))
+            self.emit('uncompressed', pos, length=self.MLEN)
         return ISUNCOMPRESSED
 
     def blockType(self, kind):
         """Read block type switch descriptor for given kind of blockType."""
+        pos = self.stream.pos
         NBLTYPES = self.verboseRead(TypeCountAlphabet(
             'BT#'+kind[0].upper(),
             description='{} block types'.format(kind),
             ))
+        bits = self.stream.pos-pos
         self.numberOfBlockTypes[kind] = NBLTYPES
         if NBLTYPES>=2:
             self.blockTypeCodes[kind] = self.readPrefixCode(
                 BlockTypeAlphabet('BT'+kind[0].upper(), NBLTYPES))
             self.blockCountCodes[kind] = self.readPrefixCode(
                 BlockCountAlphabet('BC'+kind[0].upper()))
+            countPos = self.stream.pos
             blockCount = self.verboseRead(self.blockCountCodes[kind])
+            #the prefix codes have events of their own
+            bits += self.stream.pos-countPos
         else:
             blockCount = 1<<24
         self.currentBlockCounts[kind] = blockCount
+        self.emit('blocktypes', pos, bits,
+            kind=kind, types=NBLTYPES, count=blockCount)
 
     def readLiteralContextModes(self):
         """Read literal context modes.
@@ -1711,42 +1918,51 @@ class Layout:
                 space/punctuation/digit or upper/lowercase
         signed: hamming weight of last 2 chars
         """
-        print('Context modes'.center(60, '-'))
+        self.show('Context modes'.center(60, '-'))
+        pos = self.stream.pos
         self.literalContextModes = []
         for i in range(self.numberOfBlockTypes[L]):
             self.literalContextModes.append(
                 self.verboseRead(LiteralContextMode(number=i)))
+        self.emit('contextmodes', pos, modes=self.literalContextModes)
 
     def contextMap(self, kind):
         """Read context maps
         Returns the number of differnt values on the context map
         (In other words, the number of prefix trees)
         """
+        pos = self.stream.pos
         NTREES = self.verboseRead(TypeCountAlphabet(
             kind[0].upper()+'T#',
             description='{} prefix trees'.format(kind)))
         mapSize = {L:64, D:4}[kind]
         if NTREES<2:
             self.cmaps[kind] = [0]*mapSize
+            self.emit('contextmap', pos,
+                kind=kind, trees=NTREES, map=self.cmaps[kind])
         else:
             #read CMAPkind
             RLEMAX = self.verboseRead(RLEmaxAlphabet(
                 'RLE#'+kind[0].upper(),
                 description=kind+' context map'))
+            bits = self.stream.pos-pos
             alphabet = TreeAlphabet('CM'+kind[0].upper(), NTREES=NTREES, RLEMAX=RLEMAX)
             cmapCode = self.readPrefixCode(alphabet)
+            mapPos = self.stream.pos
             tableSize = mapSize*self.numberOfBlockTypes[kind]
             cmap = []
             while len(cmap)<tableSize:
-                cmapCode.description = 'map {}, entry {}'.format(
-                    *divmod(len(cmap), mapSize))
+                if self.verbose:
+                    cmapCode.description = 'map {}, entry {}'.format(
+                        *divmod(len(cmap), mapSize))
                 count, value = self.verboseRead(cmapCode)
                 cmap.extend([value]*count)
             assert len(cmap)==tableSize
             IMTF = self.verboseRead(BoolCode('IMTF', description='Apply inverse MTF'))
             if IMTF:
                 self.IMTF(cmap)
-            if kind==L:
+            if not self.verbose: pass
+            elif kind==L:
                 print('Context maps for literal data:')
                 for i in range(0, len(cmap), 64):
                     print(*(
@@ -1760,6 +1976,10 @@ class Layout:
                     for i in range(0, len(cmap), 4)
                     ))
             self.cmaps[kind] = cmap
+            #the prefix code has an event of its own
+            bits += self.stream.pos-mapPos
+            self.emit('contextmap', pos, bits,
+                kind=kind, trees=NTREES, map=cmap)
         return NTREES
 
     @staticmethod
@@ -1804,8 +2024,9 @@ class Layout:
         lastDistances: the last four distances
         lastChars: the last two chars
         output: the result
+        Yields after every command.
         """
-        print('Meta block contents'.center(60, '='))
+        self.show('Meta block contents'.center(60, '='))
         self.currentBlockTypes = {L:0, I:0, D:0, pL:1, pI:1, pD:1}
         self.lastDistances = deque([17,16,11,4], maxlen=4)
         #the current context mode is for block type 0
@@ -1830,49 +2051,72 @@ class Layout:
         for dpc in self.prefixCodes[D]: dpc.callback = distanceCallback
 
         blockLen = 0
+        verbose, stream, emit = self.verbose, self.stream, self.emit
+        context = ''
         #there we go
         while blockLen<self.MLEN:
+            yield
             #get insert&copy command
+            commandType = self.figureBlockType(I)
+            commandPos = stream.pos
             litLen, copyLen, dist0Flag = self.verboseRead(
-                self.prefixCodes[I][
-                    self.figureBlockType(I)])
+                self.prefixCodes[I][commandType])
+            code = self.symbol.index
+            commandBits = stream.pos-commandPos
+            outputPos = len(self.output)
             #literal data
             for i in range(litLen):
                 bt = self.figureBlockType(L)
                 cm = self.contextMode.getIndex()
                 ct = self.cmaps[L][bt<<6|cm]
+                if verbose: context = '{},{}='.format(bt,cm)
+                pos = stream.pos
                 char = self.verboseRead(
                     self.prefixCodes[L][ct],
-                    context='{},{}='.format(bt,cm))
+                    context=context)
+                emit('literal', pos,
+                    value=char, blockType=bt, context=cm, tree=ct)
                 self.contextMode.add(char)
                 self.output.append(char)
             blockLen += litLen
             #check if we're done
-            if blockLen>=self.MLEN: return
+            if blockLen>=self.MLEN:
+                emit('command', commandPos, commandBits,
+                    code=code, insert=litLen, copy=0, distance=None,
+                    dictionary=False, codeBits=commandBits, distanceBits=0,
+                    outputPos=outputPos)
+                return
             #distance
             #distances are computed relative to output length, at most window size
             maxDistance = min(len(self.output), self.windowSize)
+            distancePos = stream.pos
             if dist0Flag:
                 distance = self.lastDistances[-1]
             else:
                 bt = self.figureBlockType(D)
                 cm = {2:0, 3:1, 4:2}.get(copyLen, 3)
                 ct = self.cmaps[D][bt<<2|cm]
+                if verbose: context = '{},{}='.format(bt,cm)
+                distancePos = stream.pos
                 index, offset = self.verboseRead(
                     self.prefixCodes[D][ct],
-                    context='{},{}='.format(bt,cm))
+                    context=context)
                 distance = self.lastDistances[-index]+offset if index else offset
                 if index==1 and offset==0:
                     #to make sure distance is not put in last distance list
                     dist0Flag = True
+            distanceBits = stream.pos-distancePos
             if distance<=maxDistance:
-                #copy from output
-                for i in range(
-                        maxDistance-distance,
-                        maxDistance-distance+copyLen):
-                    self.output.append(self.output[i])
+                #copy from output; the copy may overlap itself
+                start = len(self.output)-distance
+                if copyLen<=distance:
+                    self.output += self.output[start:start+copyLen]
+                else:
+                    for i in range(start, start+copyLen):
+                        self.output.append(self.output[i])
                 if not dist0Flag: self.lastDistances.append(distance)
                 comment = 'Seen before'
+                dictionary = False
             else:
                 #fetch from wordlist
                 newWord = wordList.word(copyLen, distance-maxDistance-1)
@@ -1880,8 +2124,14 @@ class Layout:
                 #adjust copyLen to reflect actual new data
                 copyLen = len(newWord)
                 comment = 'From wordlist'
+                dictionary = True
             blockLen += copyLen
-            print(' '*40,
+            emit('command', commandPos, commandBits+distanceBits,
+                code=code, insert=litLen, copy=copyLen, distance=distance,
+                dictionary=dictionary,
+                codeBits=commandBits, distanceBits=distanceBits,
+                outputPos=outputPos)
+            if verbose: print(' '*40,
                 comment,
                 ': "',
                 outputFormatter(self.output[-copyLen:]),
@@ -1893,6 +2143,7 @@ class Layout:
     def figureBlockType(self, kind):
         counts, types = self.currentBlockCounts, self.currentBlockTypes
         if counts[kind]==0:
+            pos = self.stream.pos
             newType = self.verboseRead(self.blockTypeCodes[kind])
             if newType==-2: newType = types['P'+kind]
             elif newType==-1:
@@ -1900,9 +2151,104 @@ class Layout:
             types['P'+kind] = types[kind]
             types[kind] = newType
             counts[kind] = self.verboseRead(self.blockCountCodes[kind])
+            self.emit('blockswitch', pos,
+                kind=kind, type=newType, count=counts[kind])
         counts[kind] -=1
         return types[kind]
 
+#columns for writeCsv; fields that don't apply to an event are left empty
+EVENT_FIELDS = [
+    'event', 'pos', 'bits', 'windowSize', 'last', 'length', 'uncompressed',
+    'kind', 'types', 'count', 'type', 'postfixBits', 'direct', 'modes',
+    'trees', 'map', 'name', 'lengths',
+    'value', 'blockType', 'context', 'tree',
+    'code', 'insert', 'copy', 'distance', 'dictionary',
+    'codeBits', 'distanceBits', 'outputPos',
+    ]
+
+def writeJsonLines(events, file):
+    """Write events as JSON, one per line.
+    """
+    for event in events:
+        file.write(json.dumps(event))
+        file.write('\n')
+
+def writeCsv(events, file):
+    """Write events as CSV with the columns in EVENT_FIELDS.
+    Lists and prefix code lengths are written as JSON.
+    """
+    writer = csv.DictWriter(file, EVENT_FIELDS, lineterminator='\n')
+    writer.writeheader()
+    for event in events:
+        if event['event'] in ('prefixcode', 'contextmap', 'contextmodes'):
+            event = {
+                key:json.dumps(value) if isinstance(value, (list, dict))
+                else value
+                for key, value in event.items()}
+        writer.writerow(event)
+
+#cost categories, in the order of the columns of writeCost
+COSTS = [
+    'header', 'prefixcodes', 'contextmaps', 'switches',
+    'literals', 'commands', 'distances', 'raw',
+    ]
+#the cost category of the events, except commands
+COST_OF_EVENT = {
+    'stream': 'header', 'metablock': 'header', 'blocktypes': 'header',
+    'distanceparams': 'header', 'contextmodes': 'header',
+    'prefixcode': 'prefixcodes', 'contextmap': 'contextmaps',
+    'blockswitch': 'switches', 'literal': 'literals',
+    'metadata': 'raw', 'uncompressed': 'raw',
+    }
+
+def metablockCosts(events):
+    """Sum the bits of the events per metablock and cost category.
+    Returns a list with a (length, costs) pair per metablock,
+    where costs maps the categories in COSTS to bits.
+    The stream header is counted in the first metablock.
+    >>> olleke.pos = 0
+    >>> metablockCosts(Layout(olleke, verbose=False).events())
+    [(47, {'header': 35, 'prefixcodes': 195, 'contextmaps': 32, 'switches': 0, 'literals': 66, 'commands': 11, 'distances': 10, 'raw': 0})]
+    """
+    result = []
+    costs = dict.fromkeys(COSTS, 0)
+    for event in events:
+        kind = event['event']
+        if kind=='command':
+            costs['commands'] += event['codeBits']
+            costs['distances'] += event['distanceBits']
+            continue
+        if kind=='metablock' or kind=='metadata':
+            if result: costs = dict.fromkeys(COSTS, 0)
+            result.append((event['length'] if kind=='metablock' else 0, costs))
+        costs[COST_OF_EVENT[kind]] += event['bits']
+    return result
+
+def writeCost(events, file):
+    """Write a table with the bits per cost category of every metablock,
+    with totals and percentages.
+    """
+    rows = metablockCosts(events)
+    header = ['block', 'length']+COSTS+['total']
+    widths = [max(len(name), 9) for name in header]
+    def writeRow(fields):
+        file.write(' '.join(
+            '{:>{}}'.format(field, width)
+            for field, width in zip(fields, widths)).rstrip()+'\n')
+    writeRow(header)
+    totals = dict.fromkeys(COSTS, 0)
+    totalLength = 0
+    for block, (length, costs) in enumerate(rows):
+        writeRow([block, length]+[costs[c] for c in COSTS]
+            +[sum(costs.values())])
+        totalLength += length
+        for c in COSTS: totals[c] += costs[c]
+    total = sum(totals.values())
+    writeRow(['total', totalLength]+[totals[c] for c in COSTS]+[total])
+    writeRow(['%', '']+[
+        '{:.1f}'.format(100*totals[c]/total) if total else ''
+        for c in COSTS]+[''])
+
 __test__ = {
 'BitStream': """
     >>> bs = BitStream(b'Jurjen')
@@ -2342,8 +2688,26 @@ __test__ = {
 if __name__=='__main__':
     import sys
     if len(sys.argv)>1:
-        l = Layout(BitStream(open(sys.argv[1],'rb').read()))
-        l.processStream()
+        import argparse
+        parser = argparse.ArgumentParser(
+            description='Dump the contents of a brotli compressed file.')
+        parser.add_argument('file')
+        parser.add_argument('--format', default='text',
+            choices=('text', 'jsonl', 'csv'),
+            help='text layout (default), or one event per line')
+        parser.add_argument('--cost', action='store_true',
+            help='only show the bits per category and metablock')
+        args = parser.parse_args()
+        if args.cost and args.format!='text':
+            parser.error('--cost can not be combined with --format')
+        stream = BitStream(open(args.file,'rb').read())
+        if args.cost:
+            writeCost(Layout(stream, verbose=False).events(), sys.stdout)
+        elif args.format=='text':
+            Layout(stream).processStream()
+        else:
+            writer = {'jsonl': writeJsonLines, 'csv': writeCsv}[args.format]
+            writer(Layout(stream, verbose=False).events(), sys.stdout)
     else:
         sys.path.append("h:/Persoonlijk/bin")
         try:
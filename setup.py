@@ -157,7 +157,7 @@ CLASSIFIERS = [
 
 PACKAGE_DIR = {'': 'python'}
 
-PY_MODULES = ['brotli']
+PACKAGES = ['brotli']
 
 EXT_MODULES = [
     Extension(
@@ -230,6 +230,7 @@ EXT_MODULES = [
             'enc/ringbuffer.h',
             'enc/static_dict.h',
             'enc/static_dict_lut.h',
+            'enc/stats.h',
             'enc/utf8_util.h',
             'enc/write_bits.h',
         ],
@@ -255,7 +256,7 @@ setup(
     platforms=PLATFORMS,
     classifiers=CLASSIFIERS,
     package_dir=PACKAGE_DIR,
-    py_modules=PY_MODULES,
+    packages=PACKAGES,
     ext_modules=EXT_MODULES,
     test_suite=TEST_SUITE,
     cmdclass=CMD_CLASS)